@@ -4,4 +4,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api.settings')
 
-application = get_asgi_application()
\ No newline at end of file
+django_application = get_asgi_application()
+
+from app.events import check_broker, sse_app  # noqa: E402  (cần apps đã sẵn sàng)
+
+check_broker(serves_events=True)
+
+
+async def application(scope, receive, send):
+    # /events/ là stream SSE dài hạn, phục vụ trực tiếp trên event loop thay vì qua view đồng bộ
+    if scope["type"] == "http" and scope["path"] == "/events/":
+        return await sse_app(scope, receive, send)
+    return await django_application(scope, receive, send)
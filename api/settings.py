@@ -1,5 +1,5 @@
 from pathlib import Path
-import os
+import json, os
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -44,8 +44,10 @@ INSTALLED_APPS = [
 SITE_ID = int(os.getenv("SITE_ID", "1"))
 
 MIDDLEWARE = [
+    "app.metrics.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "app.routers.ReplicaRoutingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -86,9 +88,39 @@ DATABASES = {
         "HOST": os.getenv("DB_HOST", "localhost"),
         "PORT": int(os.getenv("DB_PORT", "3306")),
         "OPTIONS": {"charset": "utf8mb4"},
+        # Giữ kết nối giữa các request (bỏ handshake mỗi request), kiểm tra sống trước khi dùng lại
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", "60")),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Read replica: DB_REPLICAS="host1:3306,host2:3306" → alias replica1, replica2 (cùng NAME/USER/PASSWORD)
+for _i, _hp in enumerate(filter(None, os.getenv("DB_REPLICAS", "").split(",")), start=1):
+    _host, _, _port = _hp.strip().partition(":")
+    DATABASES[f"replica{_i}"] = {
+        **DATABASES["default"],
+        "HOST": _host,
+        "PORT": int(_port or DATABASES["default"]["PORT"]),
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["app.routers.ReplicaRouter"]
+DB_ROUTING = {
+    "REPLICAS": [a for a in DATABASES if a != "default"],
+    "PIN_SECONDS": int(os.getenv("DB_REPLICA_PIN_SECONDS", "5")),
+    "PIN_CACHE": "shared",  # bắt buộc khi có replica — xem CACHES
+}
+
+# ===== Cache =====
+# "default" chỉ là cache trong process. "shared" dùng chung giữa mọi worker/máy (ghim read-your-writes của
+# replica): SHARED_CACHE_URL=redis://host:6379/1, hoặc "db" = bảng cache trong DB chính (manage.py createcachetable)
+CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+_shared_cache = os.getenv("SHARED_CACHE_URL", "")
+if _shared_cache == "db":
+    CACHES["shared"] = {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "django_cache"}
+elif _shared_cache:
+    CACHES["shared"] = {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": _shared_cache}
+
 # Nếu dùng PyMySQL
 import pymysql
 pymysql.install_as_MySQLdb()
@@ -109,8 +141,8 @@ ACCOUNT_EMAIL_VERIFICATION = "none"
 # ===== DRF =====
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
+        "app.authentication.CachedTokenAuthentication",  # Token + TTL cache key → user
         "rest_framework.authentication.SessionAuthentication",
-        "rest_framework.authentication.TokenAuthentication",  # nếu dùng Token
         # "rest_framework_simplejwt.authentication.JWTAuthentication",  # nếu dùng JWT
         "oauth2_provider.contrib.rest_framework.OAuth2Authentication",
     ],
@@ -120,6 +152,14 @@ REST_FRAMEWORK = {
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
 }
 
+# Cache token → user trong mỗi worker; bị huỷ khi logout/đổi mật khẩu/khoá user.
+# Cần cache "shared" (SHARED_CACHE_URL) để báo huỷ giữa các worker — không có thì mỗi request join Token + User
+AUTH_TOKEN_CACHE = {
+    "MAX_SIZE": int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000")),
+    "TTL": int(os.getenv("AUTH_TOKEN_CACHE_TTL", "60")),
+    "VERSION_CACHE": "shared" if "shared" in CACHES else None,
+}
+
 # ===== OAuth2 (tùy chọn) =====
 OAUTH2_PROVIDER = {
     "OAUTH2_BACKEND_CLASS": "oauth2_provider.oauth2_backends.JSONOAuthLibCore",
@@ -141,6 +181,143 @@ cloudinary.config(
     secure=True,
 )
 
+# ===== Plate image archive =====
+# Ảnh cổng được nén & lưu ở worker nền, không chặn request entry/exit
+PLATE_ARCHIVE = {
+    "BACKEND": os.getenv("PLATE_ARCHIVE_BACKEND", "local"),  # local | cloudinary | memory | off
+    "ROOT": MEDIA_ROOT,
+    "QUEUE_SIZE": int(os.getenv("PLATE_ARCHIVE_QUEUE_SIZE", "256")),
+    "WORKERS": int(os.getenv("PLATE_ARCHIVE_WORKERS", "2")),
+    "RETRIES": int(os.getenv("PLATE_ARCHIVE_RETRIES", "3")),
+    "MAX_SIDE": int(os.getenv("PLATE_ARCHIVE_MAX_SIDE", "1280")),
+    "JPEG_QUALITY": int(os.getenv("PLATE_ARCHIVE_JPEG_QUALITY", "80")),
+}
+
+# ===== LPR =====
+LPR = {
+    "DET_CONF": float(os.getenv("LPR_DET_CONF", "0.25")),
+    "DET_IMGSZ": int(os.getenv("LPR_DET_IMGSZ", "1024")),
+    "NMS_IOU": float(os.getenv("LPR_NMS_IOU", "0.5")),
+    "MAX_PLATES": int(os.getenv("LPR_MAX_PLATES", "8")),
+    # Lọc khung hình hỏng trước YOLO (mặc định ở lpr.QUALITY_DEFAULTS; Gate.quality ghi đè theo gate)
+    "QUALITY": {"MODE": os.getenv("LPR_QUALITY_MODE", "reject")},
+}
+
+# ===== LPR model registry =====
+# Bundle theo phiên bản trong app/lpr_models/<version>/; đổi bằng `manage.py lpr_models activate|shadow`
+LPR_MODELS = {
+    "ACTIVE": os.getenv("LPR_MODEL_ACTIVE", "default"),
+    "SHADOW": os.getenv("LPR_MODEL_SHADOW") or None,
+    "CHECK_INTERVAL": float(os.getenv("LPR_MODEL_CHECK_INTERVAL", "5")),
+    "SHADOW_RATE": float(os.getenv("LPR_MODEL_SHADOW_RATE", "0.05")),
+}
+
+# ===== LPR inference resources =====
+# Nhiều worker gunicorn cùng chạy torch: chia core cho từng worker, hoặc MODE=pool để
+# web worker chuyển ảnh (qua shared memory) cho POOL_SIZE process suy luận ghim core riêng.
+# MODE=sidecar: chạy `manage.py lpr_server`, web worker chỉ giữ client socket (không import torch/cv2).
+INFERENCE = {
+    "MODE": os.getenv("INFERENCE_MODE", "inline"),  # inline | pool | sidecar
+    "WEB_WORKERS": int(os.getenv("WEB_CONCURRENCY", "1")),
+    "TORCH_THREADS": int(os.getenv("INFERENCE_TORCH_THREADS", "0")),
+    "OPENCV_THREADS": int(os.getenv("INFERENCE_OPENCV_THREADS", "1")),
+    "AFFINITY": os.getenv("INFERENCE_AFFINITY", "0") == "1",
+    "POOL_SIZE": int(os.getenv("INFERENCE_POOL_SIZE", "2")),
+    "POOL_SLOTS": int(os.getenv("INFERENCE_POOL_SLOTS", "8")),
+    "TIMEOUT": float(os.getenv("INFERENCE_TIMEOUT", "10")),
+    "SIDECAR_ADDRESS": os.getenv("LPR_SIDECAR_ADDRESS", "unix:/tmp/lpr.sock"),  # hoặc tcp:127.0.0.1:8765
+    "SIDECAR_FALLBACK": os.getenv("LPR_SIDECAR_FALLBACK", "0") == "1",
+}
+
+# ===== Gate video stream (manage.py gate_stream) =====
+# device_camera_id của Gate là URL/đường dẫn, hoặc id tra trong GATE_STREAM_SOURCES (JSON {"cam1": "rtsp://..."})
+GATE_STREAM = {
+    "SOURCES": json.loads(os.getenv("GATE_STREAM_SOURCES", "{}")),
+    "DETECT_EVERY": int(os.getenv("GATE_STREAM_DETECT_EVERY", "2")),
+    "OCR_PER_TRACK": int(os.getenv("GATE_STREAM_OCR_PER_TRACK", "3")),
+    "WINDOW": int(os.getenv("GATE_STREAM_WINDOW", "15")),
+}
+
+# ===== LPR deferred mode =====
+# Khi engine LPR quá tải, entry/exit mở/đóng phiên bằng QR và đọc biển số sau
+LPR_DEFER = {
+    "ENABLED": os.getenv("LPR_DEFER_ENABLED", "1") == "1",
+    "MAX_IN_FLIGHT": int(os.getenv("LPR_DEFER_MAX_IN_FLIGHT", "4")),
+    "LATENCY_BUDGET_MS": int(os.getenv("LPR_DEFER_LATENCY_BUDGET_MS", "1500")),
+    "QUEUE_SIZE": int(os.getenv("LPR_DEFER_QUEUE_SIZE", "512")),
+    "WORKERS": int(os.getenv("LPR_DEFER_WORKERS", "1")),
+    "REVIEW_MIN_SIMILARITY": float(os.getenv("LPR_DEFER_REVIEW_MIN_SIMILARITY", "0.8")),
+}
+
+# ===== PlateReading write-behind =====
+# entry/exit chỉ thêm reading vào bộ đệm (+ journal), thread nền bulk_create theo FLUSH_MS / MAX_ROWS.
+# JOURNAL_DIR trống → chỉ giữ trong RAM; worker chết thì mất phần chưa flush
+WRITE_BEHIND = {
+    "ENABLED": os.getenv("WRITE_BEHIND_ENABLED", "0") == "1",
+    "FLUSH_MS": int(os.getenv("WRITE_BEHIND_FLUSH_MS", "200")),
+    "MAX_ROWS": int(os.getenv("WRITE_BEHIND_MAX_ROWS", "500")),
+    "JOURNAL_DIR": os.getenv("WRITE_BEHIND_JOURNAL_DIR", str(BASE_DIR / "var" / "readings-journal")) or None,
+    "FSYNC": os.getenv("WRITE_BEHIND_FSYNC", "interval"),  # always | interval | never
+}
+
+# ===== Metrics =====
+# Gunicorn nhiều worker: đặt METRICS_MULTIPROC_DIR để /metrics/ gộp số liệu mọi worker
+METRICS = {
+    "ENABLED": os.getenv("METRICS_ENABLED", "1") == "1",
+    "MULTIPROC_DIR": os.getenv("METRICS_MULTIPROC_DIR") or None,
+    "FLUSH_INTERVAL": float(os.getenv("METRICS_FLUSH_INTERVAL", "2")),
+    "TOKEN": os.getenv("METRICS_TOKEN") or None,
+}
+
+# ===== Profiling (request chậm / lấy mẫu) =====
+# entry/exit và recognize_plate: lưu mẫu stack + SQL + stage LPR khi chậm hơn SLOW_MS
+# hoặc theo SAMPLE_RATE. Xem /parking/admin/profiles/
+PROFILING = {
+    "ENABLED": os.getenv("PROFILING_ENABLED", "0") == "1",
+    "SAMPLE_RATE": float(os.getenv("PROFILING_SAMPLE_RATE", "0")),
+    "SLOW_MS": int(os.getenv("PROFILING_SLOW_MS", "1000")),
+    "DIR": os.getenv("PROFILING_DIR") or None,
+    "MAX_FILES": int(os.getenv("PROFILING_MAX_FILES", "200")),
+}
+
+# ===== Event stream (SSE /events/ trên ASGI) =====
+# BROKER=redis bắt buộc khi chạy nhiều process (WSGI ghi, ASGI phát, WEB_CONCURRENCY > 1);
+# local ngoài DEBUG sẽ báo ImproperlyConfigured lúc khởi động (xem app.events.check_broker)
+EVENTS = {
+    "BROKER": os.getenv("EVENTS_BROKER", "local"),  # local | redis
+    "REDIS_URL": os.getenv("EVENTS_REDIS_URL", "redis://localhost:6379/0"),
+    "HEARTBEAT": int(os.getenv("EVENTS_HEARTBEAT", "15")),
+}
+
+# ===== Signed QR =====
+# register_parking trả thêm "qr_signed": cổng kiểm tra chữ ký/hạn/giờ đến mà không cần đọc DB
+QR_SIGNING = {
+    "ENABLED": os.getenv("QR_SIGNING_ENABLED", "1") == "1",
+    "ALG": os.getenv("QR_SIGNING_ALG", "hmac"),  # hmac | ed25519
+    "KEY": os.getenv("QR_SIGNING_KEY") or None,  # hmac: mặc định SECRET_KEY; ed25519: private key PEM
+    "PUBLIC_KEY": os.getenv("QR_SIGNING_PUBLIC_KEY") or None,
+}
+
+# ===== History archive =====
+# Phiên đã đóng cũ hơn MONTHS tháng (kèm reading/payment) chuyển sang bảng *_archive: manage.py archive_history
+HISTORY_ARCHIVE = {
+    "MONTHS": int(os.getenv("HISTORY_ARCHIVE_MONTHS", "6")),
+    "BATCH_SIZE": int(os.getenv("HISTORY_ARCHIVE_BATCH_SIZE", "1000")),
+    "EXPORT_DIR": os.getenv("HISTORY_ARCHIVE_EXPORT_DIR") or None,
+}
+
+# ===== Plate search (admin) =====
+PLATE_SEARCH = {
+    "MIN_QUERY": int(os.getenv("PLATE_SEARCH_MIN_QUERY", "3")),
+    "FUZZY_RATIO": float(os.getenv("PLATE_SEARCH_FUZZY_RATIO", "0.6")),
+    "MAX_DF": int(os.getenv("PLATE_SEARCH_MAX_DF", "2000")),
+}
+
+# ===== Conditional GET (ETag / Last-Modified) =====
+CONDITIONAL_GET = {
+    "ENABLED": os.getenv("CONDITIONAL_GET_ENABLED", "1") == "1",
+}
+
 # ===== Email =====
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = "smtp.gmail.com"
@@ -4,4 +4,8 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api.settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+from app.events import check_broker  # noqa: E402
+
+check_broker(serves_events=False)  # WSGI không phục vụ /events/: event phải đi qua broker chung
@@ -1,16 +1,91 @@
+from uuid import UUID
+
 from django.contrib import admin
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+from django.utils.text import smart_split, unescape_string_literal
 from django.contrib.admin.sites import NotRegistered
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 from .models import (
     User, Reservation, QRCode, Gate, Tariff,
-    ParkingSession, Payment, PlateReading, Vehicle
+    ParkingSession, Payment, PlateReading, Vehicle,
+    ParkingSessionArchive, PaymentArchive, PlateReadingArchive,
 )
 
+from .paginators import EstimatedCountPaginator
+from . import platesearch
+
 try:
     admin.site.unregister(User)
 except NotRegistered:
     pass
 
+class UUIDSearchMixin:
+    """Khoá binary(16) không tìm được bằng icontains: khớp chính xác khi từ khoá là một UUID."""
+    uuid_search_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        qs, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        try:
+            value = UUID(search_term.strip())
+        except ValueError:
+            return qs, may_have_duplicates
+        q = Q()
+        for f in self.uuid_search_fields:
+            q |= Q(**{f: value})
+        return qs | queryset.filter(q), may_have_duplicates
+
+class PlateSearchMixin:
+    """Tìm biển số qua chỉ mục trigram (app/platesearch.py) thay vì icontains quét cả bảng.
+
+    Ký tự OCR hay nhầm (0/O/D, 8/B, ...) được coi như nhau. search_fields còn lại đi qua bảng liên quan
+    dưới dạng subquery id (user_id IN (...)) nên không JOIN/quét chéo bảng chính; từ khoá quá ngắn cho
+    chỉ mục (< MIN_QUERY) thì so icontains trực tiếp trên cột biển số.
+    """
+    plate_search_kind = None
+    plate_search_related = {}   # FK → kind của bảng liên quan, vd {'vehicle': 'vehicle'}
+
+    _PREFIX_LOOKUPS = {'^': 'istartswith', '=': 'iexact', '@': 'search'}
+
+    def _field_q(self, request, bit):
+        q = Q()
+        for f in self.get_search_fields(request):
+            lookup = self._PREFIX_LOOKUPS.get(f[0], 'icontains')
+            f = f.lstrip('^=@')
+            rel, _, rest = f.partition(LOOKUP_SEP)
+            field = self.model._meta.get_field(rel)
+            if rest and field.is_relation:
+                sub = field.related_model._default_manager.filter(**{f"{rest}__{lookup}": bit}).values('pk')
+                q |= Q(**{f"{rel}__in": sub})
+            else:
+                q |= Q(**{f"{f}__{lookup}": bit})
+        return q
+
+    def _plate_q(self, kind, term, prefix=''):
+        ids = platesearch.search(kind, term)
+        if ids is not None:
+            return Q(**{f"{prefix}pk__in": ids})
+        q = Q()
+        for f in platesearch.SOURCES[kind][1]:
+            q |= Q(**{f"{prefix}{f}__icontains": term})
+        return q
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        q = self._plate_q(self.plate_search_kind, term)
+        for fk, kind in self.plate_search_related.items():
+            q |= self._plate_q(kind, term, prefix=f"{fk}__")
+        fields = Q()
+        for bit in smart_split(term):
+            if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+                bit = unescape_string_literal(bit)
+            fields &= self._field_q(request, bit)
+        if self.get_search_fields(request):
+            q |= fields
+        return queryset.filter(q), False
+
 @admin.register(User)
 class UserAdmin(DjangoUserAdmin):
     fieldsets = DjangoUserAdmin.fieldsets + (
@@ -31,10 +106,11 @@ class ReservationAdmin(admin.ModelAdmin):
     ordering = ('-start_time',)
 
 @admin.register(QRCode)
-class QRCodeAdmin(admin.ModelAdmin):
+class QRCodeAdmin(PlateSearchMixin, admin.ModelAdmin):
     list_display  = ('value', 'user', 'status', 'expired_at', 'reservation', 'last_plate')
     list_filter   = ('status',)
-    search_fields = ('value', 'user__username', 'reservation__id', 'last_plate')
+    search_fields = ('value', 'user__username', 'reservation__id')
+    plate_search_kind = 'qrcode'
     autocomplete_fields = ('user', 'reservation')
 
 @admin.register(Gate)
@@ -49,27 +125,78 @@ class TariffAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 @admin.register(Vehicle)
-class VehicleAdmin(admin.ModelAdmin):
+class VehicleAdmin(PlateSearchMixin, admin.ModelAdmin):
     list_display = ('plate_number', 'owner')
-    search_fields = ('plate_number', 'owner__username')
+    search_fields = ('owner__username',)
+    plate_search_kind = 'vehicle'
     autocomplete_fields = ('owner',)
 
 @admin.register(ParkingSession)
-class ParkingSessionAdmin(admin.ModelAdmin):
+class ParkingSessionAdmin(UUIDSearchMixin, PlateSearchMixin, admin.ModelAdmin):
     list_display = ('id', 'user', 'vehicle', 'entry_gate', 'exit_gate', 'entry_time', 'exit_time', 'status', 'amount')
     list_filter  = ('status',)
-    search_fields = ('id', 'user__username', 'vehicle__plate_number')
+    search_fields = ('user__username',)
+    uuid_search_fields = ('id',)
+    plate_search_kind = 'session'
+    plate_search_related = {'vehicle': 'vehicle'}
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     autocomplete_fields = ('user', 'vehicle', 'entry_gate', 'exit_gate', 'tariff')
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(UUIDSearchMixin, admin.ModelAdmin):
     list_display = ('session', 'provider', 'amount', 'currency', 'paid_at', 'status')
     list_filter  = ('status', 'provider')
-    search_fields = ('session__id', 'tx_ref')
+    search_fields = ('tx_ref',)
+    uuid_search_fields = ('session__id',)
 
 @admin.register(PlateReading)
-class PlateReadingAdmin(admin.ModelAdmin):
-    list_display = ('plate_text', 'confidence', 'gate', 'captured_at', 'session')
-    list_filter  = ('gate',)
-    search_fields = ('plate_text', 'session__id')
+class PlateReadingAdmin(UUIDSearchMixin, PlateSearchMixin, admin.ModelAdmin):
+    list_display = ('plate_text', 'confidence', 'gate', 'captured_at', 'session', 'needs_review')
+    list_filter  = ('gate', 'needs_review')
+    search_fields = ('=gate__name',)
+    uuid_search_fields = ('id', 'session__id')
+    plate_search_kind = 'reading'
+    search_help_text = "Biển số (chấp nhận chuỗi con, ký tự OCR dễ nhầm), id reading/phiên hoặc tên gate"
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     autocomplete_fields = ('gate', 'session')
+
+
+class ReadOnlyArchiveAdmin(UUIDSearchMixin, admin.ModelAdmin):
+    """Dữ liệu archive chỉ được ghi bởi manage.py archive_history."""
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(ParkingSessionArchive)
+class ParkingSessionArchiveAdmin(ReadOnlyArchiveAdmin):
+    list_display = ('id', 'user', 'vehicle', 'entry_gate', 'exit_gate', 'entry_time', 'exit_time', 'status', 'amount')
+    list_filter  = ('status',)
+    search_fields = ('user__username', 'vehicle__plate_number', 'entry_plate', 'exit_plate')
+    uuid_search_fields = ('id',)
+    date_hierarchy = 'exit_time'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+@admin.register(PaymentArchive)
+class PaymentArchiveAdmin(ReadOnlyArchiveAdmin):
+    list_display = ('session', 'provider', 'amount', 'currency', 'paid_at', 'status')
+    list_filter  = ('status', 'provider')
+    search_fields = ('tx_ref',)
+    uuid_search_fields = ('session__id',)
+    show_full_result_count = False
+
+@admin.register(PlateReadingArchive)
+class PlateReadingArchiveAdmin(ReadOnlyArchiveAdmin):
+    list_display = ('plate_text', 'confidence', 'gate', 'captured_at', 'session', 'needs_review')
+    list_filter  = ('needs_review',)
+    search_fields = ('plate_text',)
+    uuid_search_fields = ('id', 'session__id')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
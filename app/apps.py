@@ -4,7 +4,11 @@ import threading
 class AppConfig(AppConfig):
     name = "app"
     def ready(self):
-        from .lpr import _load_models
+        from . import platesearch  # noqa: F401 — đăng ký signal cập nhật chỉ mục biển số
+        from . import conditional  # noqa: F401 — bump version stamp khi ghi
+        from .inference import warmup
         import os
         if os.environ.get("RUN_MAIN") == "true":
-            threading.Thread(target=_load_models, daemon=True).start()
+            threading.Thread(target=warmup, daemon=True).start()
+            from .writebehind import start
+            start()
@@ -0,0 +1,223 @@
+from __future__ import annotations
+import logging, queue, threading, time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .metrics import REGISTRY
+from .writebehind import ensure_flushed, update_pending
+
+log = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "BACKEND": "local",      # local | cloudinary | memory | off
+    "ROOT": None,            # local: thư mục gốc, mặc định MEDIA_ROOT
+    "PREFIX": "plates",
+    "QUEUE_SIZE": 256,
+    "WORKERS": 2,
+    "RETRIES": 3,
+    "RETRY_DELAY": 0.5,
+    "MAX_SIDE": 1280,        # ảnh lớn hơn sẽ được thu nhỏ (thumbnail)
+    "JPEG_QUALITY": 80,
+}
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "PLATE_ARCHIVE", {})}
+
+
+class LocalStorage:
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def save(self, name: str, data: bytes) -> str:
+        dst = self.root / name
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_suffix(dst.suffix + ".part")
+        tmp.write_bytes(data)
+        tmp.replace(dst)
+        return name
+
+    def delete(self, name: str):
+        (self.root / name).unlink(missing_ok=True)
+
+
+class CloudinaryStorage:
+    def save(self, name: str, data: bytes) -> str:
+        import cloudinary.uploader
+        public_id = name.rsplit(".", 1)[0]
+        r = cloudinary.uploader.upload(data, public_id=public_id, resource_type="image", overwrite=True)
+        return r["secure_url"]
+
+    def delete(self, name: str):
+        import cloudinary.uploader
+        cloudinary.uploader.destroy(name.rsplit(".", 1)[0], resource_type="image")
+
+
+class MemoryStorage:
+    """Stand-in cho test/dev: giữ ảnh trong RAM."""
+    def __init__(self):
+        self.files = {}
+
+    def save(self, name: str, data: bytes) -> str:
+        self.files[name] = data
+        return name
+
+    def delete(self, name: str):
+        self.files.pop(name, None)
+
+
+def _make_storage(conf):
+    backend = conf["BACKEND"]
+    if backend == "local":
+        return LocalStorage(conf["ROOT"] or settings.MEDIA_ROOT)
+    if backend == "cloudinary":
+        return CloudinaryStorage()
+    if backend == "memory":
+        return MemoryStorage()
+    raise ValueError(f"PLATE_ARCHIVE backend không hợp lệ: {backend}")
+
+
+def _compress(image_bytes: bytes, max_side: int, quality: int) -> bytes:
+    import cv2, numpy as np  # chỉ worker nền cần OpenCV; import module này không kéo cv2 vào web worker
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("không decode được ảnh")
+    h, w = img.shape[:2]
+    scale = max_side / max(h, w)
+    if scale < 1.0:
+        img = cv2.resize(img, (int(w*scale), int(h*scale)), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("không encode được ảnh")
+    return buf.tobytes()
+
+
+class PlateArchiver:
+    """Hàng đợi có giới hạn + worker nền: nén ảnh cổng, ghi vào storage rồi cập nhật PlateReading.image_path.
+
+    submit() không bao giờ chặn request: khi hàng đợi đầy, ảnh bị bỏ và đếm vào `dropped`.
+    """
+    def __init__(self, conf=None, storage=None):
+        self.conf = conf or _conf()
+        self.storage = storage or _make_storage(self.conf)
+        self.q = queue.Queue(maxsize=int(self.conf["QUEUE_SIZE"]))
+        self.stats = {"submitted": 0, "archived": 0, "dropped": 0, "retried": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _bump(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(int(self.conf["WORKERS"])):
+                t = threading.Thread(target=self._run, name=f"plate-archiver-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, reading_id, image_bytes: bytes) -> bool:
+        self._ensure_workers()
+        try:
+            self.q.put_nowait((reading_id, image_bytes, timezone.now()))
+        except queue.Full:
+            self._bump("dropped")
+            return False
+        self._bump("submitted")
+        return True
+
+    def _name(self, reading_id, captured_at):
+        return f"{self.conf['PREFIX']}/{captured_at:%Y/%m/%d}/{reading_id}.jpg"
+
+    def _store(self, reading_id, image_bytes, captured_at):
+        data = _compress(image_bytes, int(self.conf["MAX_SIDE"]), int(self.conf["JPEG_QUALITY"]))
+        return self.storage.save(self._name(reading_id, captured_at), data)
+
+    @staticmethod
+    def _link(reading_id, path) -> bool:
+        from .models import PlateReading
+        if update_pending(reading_id, image_path=path):
+            return True
+        ensure_flushed(reading_id)
+        return PlateReading.objects.filter(pk=reading_id).update(image_path=path) > 0
+
+    def _discard(self, reading_id, captured_at):
+        try:
+            self.storage.delete(self._name(reading_id, captured_at))
+        except Exception:
+            log.warning("không xoá được ảnh mồ côi của reading %s", reading_id, exc_info=True)
+
+    def process(self, reading_id, image_bytes, captured_at):
+        retries = int(self.conf["RETRIES"])
+        path = None
+        for attempt in range(retries + 1):
+            try:
+                if path is None:
+                    path = self._store(reading_id, image_bytes, captured_at)
+                # 0 dòng: reading chưa insert (write-behind ở process khác) hoặc đã bị xoá → thử lại
+                if not self._link(reading_id, path):
+                    raise LookupError(f"PlateReading {reading_id} không tồn tại")
+                self._bump("archived")
+                return path
+            except Exception:
+                if attempt >= retries:
+                    log.exception("archive plate image %s failed", reading_id)
+                    self._bump("failed")
+                    if path is not None:
+                        self._discard(reading_id, captured_at)  # không reading nào trỏ tới ảnh này
+                    return None
+                self._bump("retried")
+                time.sleep(float(self.conf["RETRY_DELAY"]) * (2 ** attempt))
+
+    def _run(self):
+        while True:
+            reading_id, image_bytes, captured_at = self.q.get()
+            close_old_connections()
+            try:
+                self.process(reading_id, image_bytes, captured_at)
+            finally:
+                close_old_connections()
+                self.q.task_done()
+
+    def drain(self, timeout=None):
+        """Chờ hàng đợi rỗng (dùng cho test / shutdown)."""
+        end = None if timeout is None else time.monotonic() + timeout
+        while self.q.unfinished_tasks:
+            if end is not None and time.monotonic() > end:
+                return False
+            time.sleep(0.01)
+        return True
+
+
+_archiver = None
+_archiver_lock = threading.Lock()
+
+def get_archiver():
+    global _archiver
+    if _archiver is None:
+        with _archiver_lock:
+            if _archiver is None:
+                _archiver = PlateArchiver()
+    return _archiver
+
+ARCHIVE_QUEUE = REGISTRY.gauge("plate_archive_queued", "Plate images waiting for archival")
+ARCHIVE_EVENTS = REGISTRY.gauge("plate_archive_events", "Plate archive counters (per process)", ("event",))
+
+def _collect():
+    ARCHIVE_QUEUE.set(_archiver.q.qsize() if _archiver else 0)
+    if _archiver:
+        for k, v in _archiver.stats.items():
+            ARCHIVE_EVENTS.set(v, event=k)
+
+REGISTRY.register_collector(_collect)
+
+def archive_plate_image(reading_id, image_bytes) -> bool:
+    if not image_bytes or _conf()["BACKEND"] == "off":
+        return False
+    return get_archiver().submit(reading_id, image_bytes)
@@ -0,0 +1,142 @@
+from __future__ import annotations
+import gzip, json, os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .conditional import bump_users
+from .platesearch import forget
+from .models import (
+    ParkingSession, Payment, PlateReading,
+    ParkingSessionArchive, PaymentArchive, PlateReadingArchive, VersionStamp,
+)
+
+DEFAULTS = {
+    "MONTHS": 6,           # phiên đã đóng cũ hơn N tháng được chuyển sang archive
+    "BATCH_SIZE": 1000,
+    "EXPORT_DIR": None,    # nếu đặt: ghi thêm jsonl.gz theo tháng
+}
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "HISTORY_ARCHIVE", {})}
+
+SESSION_FIELDS = [f.attname for f in ParkingSessionArchive._meta.concrete_fields if f.name != "archived_at"]
+PAYMENT_FIELDS = [f.attname for f in PaymentArchive._meta.concrete_fields]
+READING_FIELDS = [f.attname for f in PlateReadingArchive._meta.concrete_fields]
+
+def _copy(obj, model, fields):
+    return model(**{f: getattr(obj, f) for f in fields})
+
+
+def _export(export_dir, kind, rows, month_of):
+    by_month = {}
+    for r in rows:
+        by_month.setdefault(month_of(r), []).append(r)
+    for month, items in by_month.items():
+        path = Path(export_dir) / f"{kind}-{month}.jsonl.gz"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        created = not path.exists()
+        with open(path, "ab") as raw:
+            with gzip.open(raw, "at", encoding="utf-8") as f:
+                for r in items:
+                    row = {fl.attname: getattr(r, fl.attname) for fl in r._meta.concrete_fields}
+                    f.write(json.dumps(row, cls=DjangoJSONEncoder) + "\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+        if created:  # tên file mới cũng phải xuống đĩa
+            fd = os.open(path.parent, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+
+def archive_batch(cutoff, batch_size, export_dir=None) -> int:
+    """Chuyển 1 lô phiên đã đóng có exit_time < cutoff (kèm reading, payment) sang bảng archive.
+
+    Mỗi lô là 1 transaction ngắn; trả về số phiên đã chuyển.
+    """
+    with transaction.atomic():
+        ids = list(
+            ParkingSession.objects.filter(status="closed", exit_time__lt=cutoff)
+            .order_by("exit_time").values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        sessions = list(ParkingSession.objects.filter(id__in=ids).select_for_update())
+        payments = list(Payment.objects.filter(session_id__in=ids))
+        readings = list(PlateReading.objects.filter(session_id__in=ids))
+
+        ParkingSessionArchive.objects.bulk_create([_copy(s, ParkingSessionArchive, SESSION_FIELDS) for s in sessions])
+        PaymentArchive.objects.bulk_create([_copy(p, PaymentArchive, PAYMENT_FIELDS) for p in payments])
+        PlateReadingArchive.objects.bulk_create([_copy(r, PlateReadingArchive, READING_FIELDS) for r in readings])
+
+        # export đã fsync trước khi xoá: lỗi ghi file → rollback cả lô. Rollback sau khi đã ghi chỉ làm
+        # lô được export lại lần sau (trùng dòng), không bao giờ mất dòng đã xoá
+        if export_dir:
+            _export(export_dir, "sessions", sessions, lambda s: f"{s.exit_time:%Y-%m}")
+            _export(export_dir, "payments", payments, lambda p: f"{(p.paid_at or cutoff):%Y-%m}")
+            _export(export_dir, "readings", readings, lambda r: f"{r.captured_at:%Y-%m}")
+
+        PlateReading.objects.filter(session_id__in=ids).delete()
+        Payment.objects.filter(session_id__in=ids).delete()
+        ParkingSession.objects.filter(id__in=ids).delete()
+        forget("session", ids)
+        forget("reading", [r.id for r in readings])
+        # lịch sử của các user này giờ đọc từ archive: ETag cũ (tính trên bảng nóng) không còn đúng
+        bump_users(("payments", "reservations"), [s.user_id for s in sessions])
+        _advance_horizon(max(s.exit_time for s in sessions))
+    return len(sessions)
+
+def archive_orphan_readings(cutoff, batch_size) -> int:
+    """Reading không gắn phiên (phiên đã bị xoá / lỗi cổng) cũ hơn cutoff."""
+    with transaction.atomic():
+        readings = list(PlateReading.objects.filter(session__isnull=True, captured_at__lt=cutoff)
+                        .order_by("captured_at")[:batch_size])
+        if not readings:
+            return 0
+        PlateReadingArchive.objects.bulk_create([_copy(r, PlateReadingArchive, READING_FIELDS) for r in readings])
+        PlateReading.objects.filter(id__in=[r.id for r in readings]).delete()
+        forget("reading", [r.id for r in readings])
+    return len(readings)
+
+def default_cutoff(months=None):
+    months = _conf()["MONTHS"] if months is None else months
+    return timezone.now() - timedelta(days=30 * int(months))
+
+
+# ===== Đọc xuyên hot + archive =====
+# Lưu trong DB (VersionStamp) chứ không cache theo process: archive chạy ở process lệnh, mọi web worker
+# phải thấy mốc mới ngay — mốc cũ (thấp hơn) làm truy vấn bỏ sót phần lịch sử vừa chuyển sang archive.
+HORIZON_KEY = "archive:horizon"
+
+def _advance_horizon(value):
+    VersionStamp.objects.bulk_create([VersionStamp(key=HORIZON_KEY, stamp=value)], ignore_conflicts=True)
+    VersionStamp.objects.filter(key=HORIZON_KEY, stamp__lt=value).update(stamp=value)
+
+def archive_horizon():
+    """exit_time lớn nhất trong archive: truy vấn từ mốc này trở về sau chỉ cần bảng nóng."""
+    value = VersionStamp.objects.filter(key=HORIZON_KEY).values_list("stamp", flat=True).first()
+    if value is None:
+        # chưa có mốc (archive rỗng, hoặc dữ liệu archive có từ trước khi lưu mốc): hỏi thẳng bảng archive
+        value = ParkingSessionArchive.objects.aggregate(m=Max("exit_time"))["m"]
+        if value is not None:
+            _advance_horizon(value)
+    return value
+
+def spans_archive(since) -> bool:
+    """True nếu khoảng thời gian bắt đầu từ `since` (None = toàn bộ lịch sử) có thể chạm dữ liệu archive."""
+    horizon = archive_horizon()
+    return horizon is not None and (since is None or since <= horizon)
+
+def session_models(since=None):
+    """Các model phiên cần truy vấn cho khoảng thời gian từ `since`."""
+    return [ParkingSession, ParkingSessionArchive] if spans_archive(since) else [ParkingSession]
+
+def payment_models(since=None):
+    return [Payment, PaymentArchive] if spans_archive(since) else [Payment]
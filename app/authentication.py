@@ -0,0 +1,175 @@
+from __future__ import annotations
+import copy, threading, time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .metrics import record_cache
+
+DEFAULTS = {
+    "MAX_SIZE": 10000,
+    "TTL": 60,   # giây; hết hạn thì nạp lại token + user (thu hồi ở worker khác đã thấy ngay qua mốc trong VERSION_CACHE)
+    "VERSION_CACHE": None,   # alias CACHES dùng chung giữa các worker; None → không cache token
+}
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "AUTH_TOKEN_CACHE", {})}
+
+
+class TTLCache:
+    """LRU có TTL, giới hạn kích thước, kèm chỉ mục ngược user_id → keys để huỷ theo user."""
+    def __init__(self, maxsize, ttl):
+        self.maxsize, self.ttl = maxsize, ttl
+        self._data = OrderedDict()
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, token = item
+            if expires < now:
+                self._drop(key)
+                return None
+            self._data.move_to_end(key)
+            return token
+
+    def set(self, key, token):
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic() + self.ttl, token)
+            self._by_user.setdefault(token.user_id, set()).add(key)
+            while len(self._data) > self.maxsize:
+                self._drop(next(iter(self._data)))
+
+    def _drop(self, key):
+        _, token = self._data.pop(key)
+        keys = self._by_user.get(token.user_id)
+        if keys:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[token.user_id]
+
+    def discard(self, key):
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+
+    def discard_user(self, user_id):
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._by_user.clear()
+
+_conf_init = _conf()
+token_cache = TTLCache(int(_conf_init["MAX_SIZE"]), float(_conf_init["TTL"]))
+
+
+# Cache nằm trong từng process: xoá token / đổi mật khẩu, is_active, quyền ở worker khác được báo qua
+# mốc "auth-token:<user_id>" trong cache dùng chung (VERSION_CACHE). Mỗi hit chỉ đọc 1 khoá cache, không
+# chạm DB; không có cache dùng chung thì không giữ token (1 join Token + User như TokenAuthentication).
+def _version_cache():
+    alias = _conf()["VERSION_CACHE"]
+    return caches[alias] if alias and alias in settings.CACHES else None
+
+CLOCK_SKEW_NS = 2 * 10**9   # mốc ghi bởi worker ở máy khác
+
+def _version_key(user_id):
+    return f"auth-token:{user_id}"
+
+def _bump_auth(user_id):
+    vc = _version_cache()
+    token_cache.discard_user(user_id)
+    if vc is not None:
+        # giá trị mới duy nhất (không incr): khoá bị evict rồi tạo lại cũng không trùng mốc cũ
+        vc.set(_version_key(user_id), time.time_ns(), timeout=None)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication giữ key → user trong TTL cache, bỏ join Token + User ở mỗi request."""
+
+    def authenticate_credentials(self, key):
+        vc = _version_cache()
+        if vc is None:
+            return super().authenticate_credentials(key)
+        token = token_cache.get(key)
+        if token is not None and vc.get(_version_key(token.user_id)) != token._auth_version:
+            token_cache.discard(key)  # token bị xoá hoặc user đã đổi ở process khác
+            token = None
+        record_cache("auth_token", token is not None)
+        if token is None:
+            loaded_at = time.time_ns()
+            try:
+                token = Token.objects.select_related("user").get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_("Invalid token."))
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed(_("User inactive or deleted."))
+            token._auth_version = vc.get(_version_key(token.user_id))
+            # mốc là thời điểm bump (sau commit): mốc mới hơn lúc nạp → có thể đã đọc bản trước commit, không giữ
+            if token._auth_version is None or token._auth_version < loaded_at - CLOCK_SKEW_NS:
+                token_cache.set(key, token)
+        # bản sao: request có thể sửa user (last_login, set_password...) mà không làm bẩn cache
+        token = copy.copy(token)
+        token.user = copy.copy(token.user)
+        return (token.user, token)
+
+
+NO_AUTH = []
+
+
+# Chỉ các trường quyết định token còn dùng được / user được làm gì; last_login, tên... không huỷ cache
+AUTH_FIELDS = ("is_active", "password", "is_staff", "is_superuser")
+
+def _auth_state(user):
+    return tuple(user.__dict__.get(f) for f in AUTH_FIELDS)  # không ép trường defer (tránh query)
+
+def _bump_on_commit(user_id):
+    transaction.on_commit(lambda: _bump_auth(user_id))
+
+@receiver(post_delete, sender=Token)
+def _token_deleted(sender, instance, **kwargs):
+    token_cache.discard(instance.key)
+    _bump_on_commit(instance.user_id)
+
+@receiver(post_init, sender=get_user_model())
+def _user_loaded(sender, instance, **kwargs):
+    instance._auth_state = _auth_state(instance)
+
+@receiver(post_save, sender=get_user_model())
+def _user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not set(update_fields) & set(AUTH_FIELDS)):
+        return
+    state = _auth_state(instance)
+    if state != getattr(instance, "_auth_state", None):
+        instance._auth_state = state
+        _bump_on_commit(instance.pk)
+
+@receiver(post_delete, sender=get_user_model())
+def _user_deleted(sender, instance, **kwargs):
+    _bump_on_commit(instance.pk)
+
+
+# Chuỗi authenticator mặc định (Session/OAuth2 vẫn dùng được), TokenAuthentication đổi sang bản có cache.
+# Import ở cuối: DEFAULT_AUTHENTICATION_CLASSES có thể trỏ lại chính module này.
+from rest_framework.settings import api_settings  # noqa: E402
+
+TOKEN_AUTH = [CachedTokenAuthentication if issubclass(cls, TokenAuthentication) else cls
+              for cls in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
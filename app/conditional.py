@@ -0,0 +1,141 @@
+from __future__ import annotations
+import hashlib, time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework.response import Response
+
+DEFAULTS = {
+    "ENABLED": True,
+}
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "CONDITIONAL_GET", {})}
+
+# Phạm vi dùng chung cho mọi user; còn lại là theo user ("<scope>:<user_id>")
+GLOBAL_SCOPES = {"tariffs"}
+
+def _key(scope, user_id=None):
+    return scope if scope in GLOBAL_SCOPES else f"{scope}:{user_id}"
+
+
+# ===== Version stamp =====
+# Lưu trong DB (không phải cache locmem): bump ở worker này phải thấy ngay ở worker khác,
+# và ghi cùng transaction với dữ liệu nên không có khe hở giữa commit và bump.
+def bump(scope, user_id=None):
+    from .models import VersionStamp
+    key, now = _key(scope, user_id), timezone.now()
+    if VersionStamp.objects.filter(key=key).update(stamp=now):
+        return now
+    try:
+        with transaction.atomic():
+            VersionStamp.objects.create(key=key, stamp=now)
+    except IntegrityError:
+        VersionStamp.objects.filter(key=key).update(stamp=now)
+    return now
+
+def bump_users(scopes, user_ids):
+    """bump() theo lô cho nhiều user (archive chuyển lịch sử của cả lô phiên): 1 UPDATE + 1 INSERT cho mốc còn thiếu."""
+    from .models import VersionStamp
+    keys = [_key(s, u) for s in scopes for u in set(user_ids)]
+    if not keys:
+        return
+    now = timezone.now()
+    VersionStamp.objects.filter(key__in=keys).update(stamp=now)
+    VersionStamp.objects.bulk_create([VersionStamp(key=k, stamp=now) for k in keys], ignore_conflicts=True)
+
+def last_modified(user_id, scopes):
+    """Mốc mới nhất của các phạm vi; phạm vi chưa có mốc được tạo với thời điểm hiện tại."""
+    from .models import VersionStamp
+    keys = [_key(s, user_id) for s in scopes]
+    stamps = dict(VersionStamp.objects.filter(key__in=keys).values_list("key", "stamp"))
+    missing = [k for k in keys if k not in stamps]
+    if missing:
+        now = timezone.now()
+        VersionStamp.objects.bulk_create([VersionStamp(key=k, stamp=now) for k in missing], ignore_conflicts=True)
+        stamps.update(VersionStamp.objects.filter(key__in=missing).values_list("key", "stamp"))
+    return max(stamps.values())
+
+
+def _etag(request, scopes, stamp):
+    fmt = getattr(getattr(request, "accepted_renderer", None), "format", "")
+    raw = f"{request.user.pk}|{request.get_full_path()}|{fmt}|{','.join(scopes)}|{stamp.timestamp():.6f}"
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()[:24]}"'
+
+def _not_modified(request, etag, stamp):
+    inm = request.headers.get("If-None-Match")
+    if inm is not None:
+        tags = parse_etags(inm)
+        return "*" in tags or etag.removeprefix("W/") in {t.removeprefix("W/") for t in tags}
+    ims = parse_http_date_safe(request.headers.get("If-Modified-Since") or "")
+    return ims is not None and int(stamp.timestamp()) <= ims
+
+def versioned(*scopes):
+    """GET/HEAD trả 304 khi ETag/If-Modified-Since còn khớp — bỏ qua cả query lẫn serializer.
+
+    Đặt dưới @api_view (hoặc method_decorator cho view class) để request đã được xác thực.
+    """
+    def deco(view):
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD") or not _conf()["ENABLED"]:
+                return view(request, *args, **kwargs)
+            stamp = last_modified(request.user.pk, scopes)
+            etag = _etag(request, scopes, stamp)
+            if _not_modified(request, etag, stamp):
+                resp = Response(status=304)
+            else:
+                resp = view(request, *args, **kwargs)
+                if resp.status_code != 200:
+                    return resp
+            resp["ETag"] = etag
+            resp["Cache-Control"] = "private, no-cache"
+            resp["Vary"] = "Authorization, Accept"
+            # Last-Modified chỉ có độ phân giải giây: khi giây của mốc chưa trôi qua, một bump ngay sau
+            # vẫn cùng giây đó → If-Modified-Since sẽ trả 304 sai. Khi đó chỉ gửi ETag.
+            if time.time() >= int(stamp.timestamp()) + 1:
+                resp["Last-Modified"] = http_date(int(stamp.timestamp()))
+            return resp
+        return inner
+    return deco
+
+
+# ===== Bump khi ghi =====
+@receiver(post_save, sender=get_user_model())
+def _profile_saved(sender, instance, **kwargs):
+    bump("profile", instance.pk)
+
+@receiver(post_save, sender="app.Reservation")
+@receiver(post_delete, sender="app.Reservation")
+def _reservation_changed(sender, instance, **kwargs):
+    bump("reservations", instance.user_id)
+
+@receiver(post_save, sender="app.QRCode")
+def _qrcode_saved(sender, instance, update_fields=None, **kwargs):
+    # reservation hiển thị qr.value; last_plate cập nhật mỗi lượt vào thì không ảnh hưởng
+    if instance.reservation_id and (update_fields is None or {"value", "reservation"} & set(update_fields)):
+        bump("reservations", instance.user_id)
+
+# Không nghe post_delete của Payment: archive xoá payment theo lô (vẫn hiện trong lịch sử) và
+# receiver post_delete sẽ tắt fast-delete của Django.
+@receiver(post_save, sender="app.Payment")
+def _payment_saved(sender, instance, **kwargs):
+    from .models import ParkingSession
+    field = sender._meta.get_field("session")
+    if field.is_cached(instance):
+        user_id = instance.session.user_id
+    else:
+        user_id = ParkingSession.objects.filter(pk=instance.session_id).values_list("user_id", flat=True).first()
+    if user_id:
+        bump("payments", user_id)
+
+@receiver(post_save, sender="app.Tariff")
+@receiver(post_delete, sender="app.Tariff")
+def _tariff_changed(sender, instance, **kwargs):
+    bump("tariffs")
@@ -0,0 +1,263 @@
+from __future__ import annotations
+import logging, queue, threading, time
+from contextlib import contextmanager
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+
+from .inference import (InferenceUnavailable, recognize_plate_from_bytes, recognize_plates_from_bytes,
+                        recognize_plate_from_crops)
+from .metrics import REGISTRY, INFERENCE
+from .serializers import normalize_plate
+from .writebehind import ensure_flushed, update_reading
+
+log = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "ENABLED": True,
+    "MAX_IN_FLIGHT": 4,           # số request đang OCR đồng thời trong 1 worker
+    "LATENCY_BUDGET_MS": 1500,    # EWMA thời gian OCR vượt ngưỡng → chuyển sang deferred
+    "EWMA_ALPHA": 0.2,
+    "QUEUE_SIZE": 512,
+    "WORKERS": 1,
+    "REVIEW_MIN_SIMILARITY": 0.8,
+}
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "LPR_DEFER", {})}
+
+def _norm(s): return normalize_plate(s or "") or ""
+def _similar(a, b): return SequenceMatcher(None, _norm(a), _norm(b)).ratio()
+
+
+class LprLoad:
+    """Theo dõi tải của engine LPR trong process: số request đang OCR và EWMA latency."""
+    def __init__(self):
+        self.in_flight = 0
+        self.ewma_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, ms: float):
+        alpha = float(_conf()["EWMA_ALPHA"])
+        with self._lock:
+            self.ewma_ms = ms if self.ewma_ms == 0.0 else (1 - alpha) * self.ewma_ms + alpha * ms
+
+    @contextmanager
+    def track(self):
+        with self._lock:
+            self.in_flight += 1
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe((time.perf_counter() - t0) * 1000)
+            with self._lock:
+                self.in_flight -= 1
+
+    def saturated(self) -> bool:
+        conf = _conf()
+        if not conf["ENABLED"]:
+            return False
+        return (self.in_flight >= int(conf["MAX_IN_FLIGHT"])
+                or self.ewma_ms > float(conf["LATENCY_BUDGET_MS"]))
+
+load = LprLoad()
+
+
+def recognize_or_defer(image_bytes: bytes, lanes=None, lane=None, quality=None):
+    """Trả về kết quả LPR, hoặc None nếu engine đang quá tải (gọi defer_recognition sau khi mở/đóng phiên)."""
+    if load.saturated():
+        return None
+    try:
+        with load.track():
+            return recognize_plate_from_bytes(image_bytes, lanes=lanes, lane=lane, quality=quality)
+    except InferenceUnavailable:
+        log.warning("LPR engine không sẵn sàng, chuyển sang đọc sau", exc_info=True)
+        return None
+
+def recognize_crops_or_defer(crops, bboxes=None):
+    """Như recognize_or_defer cho crop biển số do thiết bị cổng gửi (không chạy detector)."""
+    if load.saturated():
+        return None
+    try:
+        with load.track():
+            return recognize_plate_from_crops(crops, bboxes=bboxes)
+    except InferenceUnavailable:
+        log.warning("LPR engine không sẵn sàng, chuyển sang đọc sau", exc_info=True)
+        return None
+
+def recognize_plates_or_none(image_bytes: bytes, lanes=None, quality=None):
+    """Mọi biển số trong khung hình; None nếu engine đang quá tải (không có đường đọc sau cho chế độ này)."""
+    if load.saturated():
+        return None
+    try:
+        with load.track():
+            return recognize_plates_from_bytes(image_bytes, lanes=lanes, quality=quality)
+    except InferenceUnavailable:
+        return None
+
+
+class DeferredRecognizer:
+    """Worker nền đọc biển số cho các lượt vào/ra đã được mở/đóng chỉ bằng QR."""
+    def __init__(self, conf=None):
+        self.conf = conf or _conf()
+        self.q = queue.Queue(maxsize=int(self.conf["QUEUE_SIZE"]))
+        self.stats = {"queued": 0, "done": 0, "dropped": 0, "no_plate": 0, "flagged": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _bump(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(int(self.conf["WORKERS"])):
+                t = threading.Thread(target=self._run, name=f"lpr-deferred-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, kind: str, reading_id, image_bytes: bytes, **opts) -> bool:
+        self._ensure_workers()
+        try:
+            self.q.put_nowait((kind, reading_id, image_bytes, opts))
+        except queue.Full:
+            self._bump("dropped")
+            return False
+        self._bump("queued")
+        return True
+
+    def _run(self):
+        while True:
+            kind, reading_id, image_bytes, opts = self.q.get()
+            close_old_connections()
+            try:
+                self.process(kind, reading_id, image_bytes, **opts)
+            except Exception:
+                log.exception("deferred LPR %s failed", reading_id)
+                self._bump("failed")
+                self._flag(reading_id)
+            finally:
+                close_old_connections()
+                self.q.task_done()
+
+    @staticmethod
+    def _flag(reading_id):
+        """Đọc sau lỗi (engine chết, DB...) → reading vẫn phải vào hàng duyệt tay như khi hàng đợi đầy."""
+        from .models import PlateReading
+        reading = PlateReading(pk=reading_id)
+        reading._state.adding = False
+        try:
+            update_reading(reading, needs_review=True)
+        except Exception:
+            log.exception("deferred LPR %s: không đánh dấu được needs_review", reading_id)
+
+    def process(self, kind, reading_id, image_bytes, lanes=None, lane=None, quality=None, crops=None, bboxes=None):
+        from .models import PlateReading
+        t0 = time.perf_counter()
+        if crops:
+            lpr = recognize_plate_from_crops(crops, bboxes=bboxes)
+        else:
+            lpr = recognize_plate_from_bytes(image_bytes, lanes=lanes, lane=lane, quality=quality)
+        load.observe((time.perf_counter() - t0) * 1000)
+
+        ensure_flushed(reading_id)
+        reading = PlateReading.objects.select_related("session", "session__vehicle", "session__qrcode") \
+                                      .get(pk=reading_id)
+        if not lpr["ok"]:
+            reading.needs_review = True
+            reading.save(update_fields=["needs_review"])
+            self._bump("no_plate")
+            return
+        plate = _norm(lpr["text"])
+        if kind == "entry":
+            flagged = self._apply_entry(reading, plate)
+        else:
+            flagged = self._apply_exit(reading, plate)
+        reading.plate_text = plate
+        reading.confidence = lpr.get("ocr_conf", 0.0)
+        reading.needs_review = flagged
+        reading.save(update_fields=["plate_text", "confidence", "needs_review"])
+        self._bump("flagged" if flagged else "done")
+
+    def _apply_entry(self, reading, plate):
+        sess = reading.session
+        if sess is None:
+            return True
+        vehicle = sess.vehicle
+        old = vehicle.plate_number
+        flagged = bool(old) and old != "UNKNOWN" and old != plate
+        with transaction.atomic():
+            sess.entry_plate = plate or None
+            sess.save(update_fields=["entry_plate"])
+            if plate and old != plate:
+                _set_vehicle_plate(vehicle, plate)
+            if sess.qrcode_id:
+                sess.qrcode.last_plate = plate
+                sess.qrcode.save(update_fields=["last_plate"])
+        return flagged
+
+    def _apply_exit(self, reading, plate):
+        sess = reading.session
+        if sess is None:
+            return True
+        ref = sess.entry_plate or (sess.qrcode.last_plate if sess.qrcode_id else "")
+        vehicle = sess.vehicle
+        with transaction.atomic():
+            sess.exit_plate = plate
+            sess.save(update_fields=["exit_plate"])
+            # như lượt vào: xe mang biển số đọc được gần nhất
+            if plate and vehicle.plate_number != plate:
+                _set_vehicle_plate(vehicle, plate)
+        return _similar(plate, ref) < float(self.conf["REVIEW_MIN_SIMILARITY"])
+
+
+def _set_vehicle_plate(vehicle, plate):
+    """Ghi biển số đọc được lên xe; user đã có xe khác mang biển đó (uq_owner_plate) thì giữ nguyên."""
+    if type(vehicle).objects.filter(owner_id=vehicle.owner_id, plate_number=plate).exclude(pk=vehicle.pk).exists():
+        return
+    old = vehicle.plate_number
+    vehicle.plate_number = plate
+    try:
+        with transaction.atomic():
+            vehicle.save(update_fields=["plate_number"])
+    except IntegrityError:
+        vehicle.plate_number = old  # xe trùng vừa được tạo song song
+
+
+_deferred = None
+_deferred_lock = threading.Lock()
+
+def get_deferred():
+    global _deferred
+    if _deferred is None:
+        with _deferred_lock:
+            if _deferred is None:
+                _deferred = DeferredRecognizer()
+    return _deferred
+
+DEFERRED = REGISTRY.gauge("lpr_deferred_events", "Deferred LPR counters (per process)", ("event",))
+
+def _collect():
+    INFERENCE.set(load.in_flight, state="in_flight")
+    INFERENCE.set(_deferred.q.qsize() if _deferred else 0, state="deferred_queued")
+    if _deferred:
+        for k, v in _deferred.stats.items():
+            DEFERRED.set(v, event=k)
+
+REGISTRY.register_collector(_collect)
+
+def defer_recognition(kind: str, reading, image_bytes: bytes, **opts) -> bool:
+    """Đưa ảnh vào hàng đợi đọc sau. Hàng đợi đầy → đánh dấu reading cần duyệt tay.
+
+    opts: lanes/lane/quality cho ảnh cả khung, hoặc crops/bboxes cho crop từ thiết bị (xem process).
+    """
+    if get_deferred().submit(kind, reading.id, image_bytes, **opts):
+        return True
+    update_reading(reading, needs_review=True)
+    return False
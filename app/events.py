@@ -0,0 +1,280 @@
+from __future__ import annotations
+import asyncio, itertools, json, logging, os, threading
+from collections import deque
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+
+log = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "BROKER": "local",              # local | redis
+    "REDIS_URL": "redis://localhost:6379/0",
+    "CHANNEL": "smart-parking-events",
+    "QUEUE_SIZE": 100,              # mỗi subscriber; đầy → bỏ event cũ nhất
+    "HISTORY": 256,                 # replay theo Last-Event-ID khi client kết nối lại
+    "HEARTBEAT": 15,
+}
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "EVENTS", {})}
+
+
+class Subscription:
+    def __init__(self, broker, loop, accept, maxsize):
+        self.broker, self.loop, self.accept = broker, loop, accept
+        self.q = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def put(self, event):
+        if self.accept and not self.accept(event):
+            return
+        if self.q.full():
+            self.q.get_nowait()
+            self.dropped += 1
+        self.q.put_nowait(event)
+
+    async def get(self):
+        return await self.q.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Fan-out trong process. publish() gọi được từ thread đồng bộ (view); subscriber sống trên event loop ASGI.
+
+    Mỗi event loop chỉ nhận 1 call_soon_threadsafe cho mỗi event, rồi fan-out tại chỗ tới mọi subscriber,
+    nên hàng nghìn kết nối nhàn rỗi chỉ tốn 1 asyncio.Queue mỗi kết nối.
+    """
+    def __init__(self, conf=None):
+        self.conf = conf or _conf()
+        self._subs = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self.history = deque(maxlen=int(self.conf["HISTORY"]))
+
+    def publish(self, event: dict):
+        self._deliver(event)
+
+    def _deliver(self, event: dict):
+        with self._lock:
+            if "id" not in event:   # RedisBroker đánh id lúc publish, chung cho mọi process
+                event = {**event, "id": next(self._seq)}
+            self.history.append(event)
+            targets = [(loop, tuple(subs)) for loop, subs in self._subs.items()]
+        for loop, subs in targets:
+            try:
+                loop.call_soon_threadsafe(self._fanout, subs, event)
+            except RuntimeError:
+                with self._lock:
+                    self._subs.pop(loop, None)
+
+    @staticmethod
+    def _fanout(subs, event):
+        for s in subs:
+            s.put(event)
+
+    def subscribe(self, accept=None) -> Subscription:
+        loop = asyncio.get_running_loop()
+        sub = Subscription(self, loop, accept, int(self.conf["QUEUE_SIZE"]))
+        with self._lock:
+            self._subs.setdefault(loop, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subs.get(sub.loop)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.loop]
+
+    def replay(self, after_id, accept=None):
+        with self._lock:
+            events = list(self.history)
+        return [e for e in events if e["id"] > after_id and (accept is None or accept(e))]
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subs.values())
+
+
+class RedisBroker(InProcessBroker):
+    """Chia sẻ event giữa nhiều process/host qua Redis pub/sub; fan-out cục bộ như InProcessBroker."""
+    def __init__(self, conf=None):
+        super().__init__(conf)
+        import redis
+        self._redis = redis.Redis.from_url(self.conf["REDIS_URL"])
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def publish(self, event: dict):
+        # id từ INCR chung: mọi process ASGI gán cùng id cho cùng event, Last-Event-ID replay được ở process khác
+        event = {**event, "id": self._redis.incr(f"{self.conf['CHANNEL']}:seq")}
+        self._redis.publish(self.conf["CHANNEL"], json.dumps(event, default=str))
+
+    def subscribe(self, accept=None):
+        self._ensure_listener()
+        return super().subscribe(accept)
+
+    def _ensure_listener(self):
+        if self._listener is not None:
+            return
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="events-redis", daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        ps = self._redis.pubsub(ignore_subscribe_messages=True)
+        ps.subscribe(self.conf["CHANNEL"])
+        for msg in ps.listen():
+            try:
+                self._deliver(json.loads(msg["data"]))
+            except (ValueError, TypeError):
+                log.warning("bad event payload on %s", self.conf["CHANNEL"])
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                kind = _conf()["BROKER"]
+                if kind == "local":
+                    _broker = InProcessBroker()
+                elif kind == "redis":
+                    _broker = RedisBroker()
+                else:
+                    raise ValueError(f"EVENTS broker không hợp lệ: {kind}")
+    return _broker
+
+
+def check_broker(serves_events: bool):
+    """Gọi lúc khởi động (api/asgi.py, api/wsgi.py). Broker local chỉ fan-out trong process: event phát từ
+    worker WSGI hay từ worker ASGI khác sẽ không bao giờ tới client /events/ — báo lỗi thay vì mất event
+    âm thầm. DEBUG (runserver) chỉ cảnh báo."""
+    if _conf()["BROKER"] != "local":
+        return
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if serves_events and workers <= 1:
+        return
+    msg = ("EVENTS_BROKER=local chỉ dùng được khi 1 process ASGI vừa ghi vừa phục vụ /events/; "
+           "chạy nhiều process (WSGI + ASGI, WEB_CONCURRENCY > 1) cần EVENTS_BROKER=redis")
+    if settings.DEBUG:
+        log.warning(msg)
+        return
+    raise ImproperlyConfigured(msg)
+
+
+def publish(kind: str, *, user_id=None, occupancy_delta=0, **data):
+    """Phát event sau khi transaction hiện tại commit (1 lần cho mỗi thay đổi trạng thái)."""
+    event = {
+        "type": kind,
+        "user_id": str(user_id) if user_id else None,
+        "occupancy_delta": occupancy_delta,
+        "at": timezone.now().isoformat(),
+        **{k: (str(v) if v is not None and not isinstance(v, (int, float, bool, str)) else v)
+           for k, v in data.items()},
+    }
+    transaction.on_commit(lambda: get_broker().publish(event))
+
+
+# ===== ASGI endpoint: GET /events/ (text/event-stream) =====
+def _sse(event) -> bytes:
+    # event không có id (hello) không gửi dòng id: — nếu không trình duyệt reset Last-Event-ID
+    head = f"id: {event['id']}\n" if "id" in event else ""
+    return (f"{head}event: {event['type']}\n"
+            f"data: {json.dumps(event, default=str)}\n\n").encode()
+
+def _token_from_scope(scope):
+    for k, v in scope.get("headers", []):
+        if k == b"authorization":
+            parts = v.decode().split()
+            if len(parts) == 2 and parts[0].lower() == "token":
+                return parts[1]
+    qs = parse_qs(scope.get("query_string", b"").decode())
+    return (qs.get("token") or [None])[0]
+
+def _last_event_id(scope):
+    for k, v in scope.get("headers", []):
+        if k == b"last-event-id":
+            try:
+                return int(v)
+            except ValueError:
+                return None
+    return None
+
+def _resolve_user(key):
+    from rest_framework.exceptions import AuthenticationFailed
+    from .authentication import CachedTokenAuthentication
+    try:
+        return CachedTokenAuthentication().authenticate_credentials(key)[0]
+    except AuthenticationFailed:
+        return None
+
+def _open_count():
+    from .models import ParkingSession
+    return ParkingSession.objects.filter(status="open").count()
+
+async def _wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+async def _respond(send, status, body=b""):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": body})
+
+async def sse_app(scope, receive, send):
+    key = _token_from_scope(scope)
+    user = await sync_to_async(_resolve_user)(key) if key else None
+    if user is None:
+        return await _respond(send, 401, b'{"detail": "Authentication credentials were not provided."}')
+
+    uid = str(user.pk)
+    accept = None if user.is_staff else (lambda e: e.get("user_id") == uid)
+    broker = get_broker()
+    sub = broker.subscribe(accept)
+    heartbeat = float(_conf()["HEARTBEAT"])
+    disconnect = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ]})
+        hello = {"type": "hello"}
+        if user.is_staff:
+            hello["occupancy"] = await sync_to_async(_open_count)()
+        chunks = [_sse(hello)]
+        last_id = _last_event_id(scope)
+        if last_id is not None:
+            chunks += [_sse(e) for e in broker.replay(last_id, accept)]
+        await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": True})
+
+        while True:
+            get = asyncio.ensure_future(sub.get())
+            done, _ = await asyncio.wait({get, disconnect}, timeout=heartbeat,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnect in done:
+                get.cancel()
+                break
+            if get in done:
+                body = _sse(get.result())
+            else:
+                get.cancel()
+                body = b": ping\n\n"
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+    finally:
+        sub.close()
+        if not disconnect.done():
+            disconnect.cancel()
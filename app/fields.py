@@ -0,0 +1,63 @@
+import os, threading, time, uuid
+
+from django.db import models
+
+_uuid7_lock = threading.Lock()
+_uuid7_last = (0, 0)
+
+def uuid7() -> uuid.UUID:
+    """UUID version 7: 48 bit millisecond timestamp + bộ đếm 12 bit + ngẫu nhiên, tăng dần trong process.
+
+    Chèn liên tục chỉ nối vào cuối B-tree thay vì tách trang ngẫu nhiên như uuid4.
+    """
+    global _uuid7_last
+    rand = int.from_bytes(os.urandom(8), "big")
+    with _uuid7_lock:
+        ms = time.time_ns() // 1_000_000
+        last_ms, counter = _uuid7_last
+        if ms <= last_ms:
+            ms, counter = last_ms, counter + 1
+            if counter > 0xFFF:
+                ms, counter = ms + 1, 0
+        else:
+            counter = rand >> 56          # bắt đầu ngẫu nhiên trong nửa dưới, chừa chỗ để đếm
+        _uuid7_last = (ms, counter)
+    value = (ms & 0xFFFF_FFFF_FFFF) << 80
+    value |= 0x7 << 76                    # version
+    value |= counter << 64                # rand_a dùng làm bộ đếm (RFC 9562, method 1)
+    value |= 0b10 << 62                   # variant
+    value |= rand & 0x3FFF_FFFF_FFFF_FFFF
+    return uuid.UUID(int=value)
+
+
+class CompactUUIDField(models.UUIDField):
+    """UUIDField lưu BINARY(16) trên MySQL thay vì char(32).
+
+    API/serializer vẫn thấy uuid.UUID như cũ; backend khác (sqlite, postgres) giữ kiểu của UUIDField.
+    """
+    def db_type(self, connection):
+        if connection.vendor == "mysql":
+            return "binary(16)"
+        return super().db_type(connection)
+
+    def rel_db_type(self, connection):
+        return self.db_type(connection)
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, bytearray, memoryview)) and len(value) == 16:
+            return uuid.UUID(bytes=bytes(value))
+        return super().to_python(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if connection.vendor != "mysql":
+            return super().get_db_prep_value(value, connection, prepared)
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            value = self.to_python(value)
+        return value.bytes
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return self.to_python(value)
@@ -0,0 +1,139 @@
+"""Giao thức gọn cho thiết bị cổng (entry/exit/plates).
+
+Bộ điều khiển cổng chỉ cần JSON (hoặc MessagePack) với schema cố định: bỏ browsable API, bỏ serializer
+khi trả phiên, mã hoá UUID/Decimal/datetime trực tiếp. orjson và msgpack là tuỳ chọn — không cài thì
+dùng json chuẩn và không nhận MessagePack.
+
+Ảnh gửi qua MessagePack là field bin ("image", "plate_crop" — 1 ảnh hoặc list) và được đưa vào
+request.FILES như upload multipart, nên view không phân biệt hai cách gửi.
+"""
+from __future__ import annotations
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from uuid import UUID
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
+from django.utils.datastructures import MultiValueDict
+from rest_framework.parsers import BaseParser, DataAndFiles, FormParser, MultiPartParser, ParseError
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def iso(dt):
+    """Cùng định dạng DateTimeField của DRF: giờ địa phương, UTC viết 'Z'."""
+    if dt is None:
+        return None
+    s = timezone.localtime(dt).isoformat()
+    return s[:-6] + "Z" if s.endswith("+00:00") else s
+
+def _default(o):
+    if isinstance(o, Decimal):
+        return str(o)
+    if isinstance(o, UUID):
+        return str(o)
+    if isinstance(o, datetime):
+        return iso(o)
+    if isinstance(o, (date, time)):
+        return o.isoformat()
+    raise TypeError(f"không mã hoá được {type(o).__name__}")
+
+_json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_default)
+
+def dumps_json(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    return _json_encoder.encode(data).encode()
+
+def dumps_msgpack(data) -> bytes:
+    return msgpack.packb(data, default=_default, use_bin_type=True, datetime=False)
+
+
+# ===== Schema cố định (thay ParkingSessionSerializer trên đường cổng) =====
+def _pk(v):
+    return None if v is None else (str(v) if isinstance(v, UUID) else v)
+
+def session_payload(sess) -> dict:
+    """Cùng key/giá trị với ParkingSessionSerializer(sess).data, dựng trực tiếp từ attname."""
+    return {
+        "id": str(sess.id),
+        "user": _pk(sess.user_id),
+        "vehicle": _pk(sess.vehicle_id),
+        "entry_gate": _pk(sess.entry_gate_id),
+        "exit_gate": _pk(sess.exit_gate_id),
+        "entry_time": iso(sess.entry_time),
+        "exit_time": iso(sess.exit_time),
+        "entry_plate": sess.entry_plate,
+        "exit_plate": sess.exit_plate,
+        "status": sess.status,
+        "amount": None if sess.amount is None else f"{Decimal(sess.amount):.2f}",
+        "tariff": _pk(sess.tariff_id),
+        "qrcode": _pk(sess.qrcode_id),
+        "reservation": _pk(sess.reservation_id),
+    }
+
+
+# ===== Renderer / parser =====
+class GateJSONRenderer(BaseRenderer):
+    media_type = "application/json"
+    format = "json"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b"" if data is None else dumps_json(data)
+
+class GateMsgPackRenderer(BaseRenderer):
+    media_type = "application/x-msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b"" if data is None else dumps_msgpack(data)
+
+
+class GateJSONParser(BaseParser):
+    media_type = "application/json"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        raw = stream.read() if stream is not None else b""
+        try:
+            return (orjson.loads(raw) if orjson is not None else json.loads(raw)) if raw else {}
+        except ValueError as e:
+            raise ParseError(f"JSON lỗi: {e}")
+
+class GateMsgPackParser(BaseParser):
+    media_type = "application/x-msgpack"
+    file_fields = ("image", "plate_crop")
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        raw = stream.read() if stream is not None else b""
+        try:
+            data = msgpack.unpackb(raw, raw=False) if raw else {}
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as e:
+            raise ParseError(f"MessagePack lỗi: {e}")
+        if not isinstance(data, dict):
+            raise ParseError("MessagePack lỗi: body phải là map")
+        files = MultiValueDict()
+        for name in self.file_fields:
+            value = data.get(name)
+            blobs = value if isinstance(value, list) else [value]
+            if value is None or not all(isinstance(b, bytes) for b in blobs):
+                continue
+            del data[name]
+            files.setlist(name, [SimpleUploadedFile(f"{name}.jpg", b, "image/jpeg") for b in blobs])
+        return DataAndFiles(data, files)
+
+
+# JSON đứng đầu: client không gửi Accept (hoặc */*) nhận JSON như trước
+GATE_RENDERERS = [GateJSONRenderer] + ([GateMsgPackRenderer] if msgpack is not None else [])
+GATE_PARSERS = [GateJSONParser, MultiPartParser, FormParser] + ([GateMsgPackParser] if msgpack is not None else [])
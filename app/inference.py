@@ -0,0 +1,384 @@
+from __future__ import annotations
+import itertools, logging, multiprocessing as mp, os, queue, threading
+from multiprocessing import connection as mp_connection, shared_memory
+
+from django.conf import settings
+
+from .metrics import REGISTRY, INFERENCE
+from .profiling import profiled
+
+log = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "MODE": "inline",          # inline: OCR trong web worker (dev) | pool: N process suy luận riêng, ghim core
+                               # | sidecar: gửi ảnh tới manage.py lpr_server, web worker không import torch
+    "WEB_WORKERS": 1,          # số worker gunicorn cùng máy — chia đều core cho từng worker (mode inline)
+    "TORCH_THREADS": 0,        # 0 = tự tính theo số core / số process dùng torch
+    "INTEROP_THREADS": 1,
+    "OPENCV_THREADS": 1,
+    "AFFINITY": False,         # ghim mỗi process vào 1 dải core riêng
+    "POOL_SIZE": 2,
+    "POOL_SLOTS": 8,           # số ảnh đang xử lý đồng thời tối đa (mỗi slot 1 vùng shared memory)
+    "SLOT_BYTES": 8 * 1024 * 1024,
+    "TIMEOUT": 10.0,
+    "SIDECAR_ADDRESS": "unix:/tmp/lpr.sock",
+    "SIDECAR_FALLBACK": False, # sidecar không chạy → OCR trong process (chỉ nên bật khi dev)
+}
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "INFERENCE", {})}
+
+class InferenceUnavailable(Exception):
+    """Không chạy được OCR lúc này (pool hết slot/quá giờ/worker lỗi, sidecar không phản hồi) — deferred đọc sau."""
+
+
+def _cores():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+# ===== Thread budget & CPU affinity =====
+current_budget = {}
+
+def plan(n_procs, index, cores=None, threads=0):
+    """Chia core cho process thứ `index` trong `n_procs`: trả về (dải core, số thread torch)."""
+    cores = cores or _cores()
+    n_procs = max(1, n_procs)
+    per = max(1, len(cores) // n_procs)
+    start = (index % n_procs) * per % len(cores)
+    mine = cores[start:start + per] or cores[:per]
+    return mine, int(threads) or len(mine)
+
+def apply_budget(n_procs=None, index=None, threads=None, affinity=None):
+    """Đặt số thread torch/OpenCV (và affinity nếu bật) cho process hiện tại.
+
+    Gọi trước khi torch chạy phép tính đầu tiên: set_num_interop_threads chỉ đặt được một lần.
+    `index` là vị trí ổn định của process (gunicorn.conf.py gán cho từng worker); không có index thì
+    không ghim core — pid không cho biết dải core nào còn trống.
+    """
+    conf = _conf()
+    n_procs = int(n_procs or conf["WEB_WORKERS"])
+    affinity = conf["AFFINITY"] if affinity is None else affinity
+    if index is None:
+        if affinity:
+            log.warning("apply_budget không có index: bỏ qua ghim core")
+        index, affinity = 0, False
+    cores, n_threads = plan(n_procs, index, threads=conf["TORCH_THREADS"] if threads is None else threads)
+    if affinity and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError:
+            log.warning("không ghim được core %s", cores)
+            cores = _cores()
+    try:
+        import cv2
+        cv2.setNumThreads(int(conf["OPENCV_THREADS"]))
+    except ImportError:
+        pass
+    try:
+        import torch
+        torch.set_num_threads(n_threads)
+        try:
+            torch.set_num_interop_threads(int(conf["INTEROP_THREADS"]))
+        except RuntimeError:
+            pass  # đã có phép tính song song chạy trước đó
+    except ImportError:
+        pass
+    current_budget.update(pid=os.getpid(), cores=list(cores) if affinity else None, torch_threads=n_threads)
+    return dict(current_budget)
+
+
+_synthetic_net = None
+
+def synthetic_workload(image_bytes: bytes = b"", batch=1):
+    """Tải tính toán cỡ CRNN (conv trên ảnh 48x320) để benchmark cấu hình thread khi không có weights."""
+    global _synthetic_net
+    import torch
+    if _synthetic_net is None:
+        torch.manual_seed(0)
+        _synthetic_net = torch.nn.Sequential(
+            torch.nn.Conv2d(1, 64, 3, padding=1), torch.nn.ReLU(), torch.nn.MaxPool2d(2),
+            torch.nn.Conv2d(64, 128, 3, padding=1), torch.nn.ReLU(), torch.nn.MaxPool2d(2),
+            torch.nn.Conv2d(128, 256, 3, padding=1), torch.nn.ReLU(),
+            torch.nn.Conv2d(256, 256, 3, padding=1), torch.nn.ReLU(),
+        ).eval()
+    with torch.no_grad():
+        out = _synthetic_net(torch.rand(batch, 1, 48, 320))
+    return {"ok": True, "sum": float(out.mean())}
+
+
+# ===== Pool process suy luận (shared memory) =====
+def _pool_main(index, n_procs, slot_names, conn, threads, affinity):
+    import django
+    django.setup()
+    apply_budget(n_procs=n_procs, index=index, threads=threads, affinity=affinity)
+    from . import lpr
+    from .lprclient import split_crops
+    ops = {"plate": lpr.recognize_plate_from_bytes, "plates": lpr.recognize_plates_from_bytes,
+           "crops": lambda data, sizes, bboxes=None: lpr.recognize_plate_from_crops(split_crops(data, sizes), bboxes),
+           "synthetic": synthetic_workload}
+    shms = [shared_memory.SharedMemory(name=n) for n in slot_names]
+    try:
+        lpr._load_models()
+    except Exception:
+        log.exception("inference[%s]: nạp model lỗi", index)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break  # web worker đã thoát
+        if task is None:
+            break
+        req_id, op, slot, size, kwargs = task
+        try:
+            data = bytes(shms[slot].buf[:size])
+            conn.send((req_id, True, ops[op](data, **kwargs)))
+        except Exception as e:
+            conn.send((req_id, False, repr(e)))
+    for shm in shms:
+        shm.close()
+
+
+class InferencePool:
+    """N process suy luận ghim core; web worker ghi ảnh vào shared memory và chỉ gửi (slot, size) qua pipe.
+
+    Mỗi process 1 pipe riêng (không dùng chung mp.Queue: process bị kill khi đang giữ lock của queue làm
+    treo cả pool). Process chết → request đang nằm ở đó báo lỗi ngay, slot được thu hồi, process được dựng lại.
+    """
+    def __init__(self, conf=None, slot=None):
+        self.conf = conf or _conf()
+        self.slot = slot   # vị trí web worker sở hữu pool (gunicorn slot_index) — quyết định dải core
+        self._ctx = mp.get_context("spawn")  # fork sau khi torch đã khởi tạo thread pool dễ treo
+        n_slots, size = int(self.conf["POOL_SLOTS"]), int(self.conf["SLOT_BYTES"])
+        self.shms = [shared_memory.SharedMemory(create=True, size=size) for _ in range(n_slots)]
+        self.free = queue.Queue()
+        for i in range(n_slots):
+            self.free.put(i)
+        self._ids = itertools.count()
+        self._waiting, self._slots, self._owner = {}, {}, {}   # req_id → (event, box) | slot | process
+        self._lock = threading.Lock()
+        self._closed = False
+        self.restarts = 0
+        n = int(self.conf["POOL_SIZE"])
+        self.procs, self.conns, self._send_locks = [None] * n, [None] * n, [None] * n
+        for i in range(n):
+            self._spawn(i)
+        threading.Thread(target=self._collect, name="lpr-inference-results", daemon=True).start()
+
+    def _core_index(self, i):
+        """(index, n_procs) cho apply_budget: mỗi web worker có 1 pool riêng, nên process i của worker
+        `slot` lấy dải thứ slot*POOL_SIZE + i trên tổng WEB_WORKERS*POOL_SIZE — các pool không ghim trùng core."""
+        n, web = len(self.procs), max(1, int(self.conf["WEB_WORKERS"]))
+        slot = self.slot if self.slot is not None else (0 if web == 1 else None)
+        if slot is None:
+            return None, n * web  # không biết vị trí worker: apply_budget bỏ qua ghim core
+        return slot * n + i, n * web
+
+    def _spawn(self, i):
+        parent, child = self._ctx.Pipe()
+        index, n_procs = self._core_index(i)
+        p = self._ctx.Process(target=_pool_main, name=f"lpr-inference-{i}", daemon=True,
+                              args=(index, n_procs, [s.name for s in self.shms], child,
+                                    int(self.conf["TORCH_THREADS"]), bool(self.conf["AFFINITY"])))
+        p.start()
+        child.close()  # chỉ process con giữ đầu kia: con chết → recv ở đây gặp EOF
+        with self._lock:
+            self.procs[i], self.conns[i], self._send_locks[i] = p, parent, threading.Lock()
+
+    def _worker_died(self, i):
+        p = self.procs[i]
+        p.join(timeout=1)
+        with self._lock:
+            lost = [r for r, w in self._owner.items() if w == i]
+            for r in lost:
+                del self._owner[r]
+            waiters = [self._waiting.pop(r, None) for r in lost]
+            slots = [self._slots.pop(r) for r in lost if r in self._slots]
+        for slot in slots:
+            self.free.put(slot)  # process đã chết, không còn ai đọc slot
+        for w in waiters:
+            if w:
+                w[1].extend((False, "process suy luận chết"))
+                w[0].set()
+        self.conns[i].close()
+        if self._closed:
+            return
+        log.error("inference[%d] chết (exit %s), khởi động lại", i, p.exitcode)
+        self.restarts += 1
+        self._spawn(i)
+
+    def _collect(self):
+        while not self._closed:
+            conns = {c: i for i, c in enumerate(self.conns)}
+            for c in mp_connection.wait(list(conns), timeout=1.0):
+                try:
+                    req_id, ok, payload = c.recv()
+                except (EOFError, OSError):
+                    if not self._closed:
+                        self._worker_died(conns[c])
+                    continue
+                with self._lock:
+                    waiter = self._waiting.pop(req_id, None)
+                    slot = self._slots.pop(req_id, None)
+                    self._owner.pop(req_id, None)
+                if slot is not None:
+                    self.free.put(slot)  # process đã đọc xong ảnh → slot dùng lại được
+                if waiter:
+                    waiter[1].extend((ok, payload))
+                    waiter[0].set()
+
+    def run(self, op, image_bytes, **kwargs):
+        timeout = float(self.conf["TIMEOUT"])
+        if len(image_bytes) > self.shms[0].size:
+            raise InferenceUnavailable("ảnh vượt SLOT_BYTES")
+        try:
+            slot = self.free.get(timeout=timeout)
+        except queue.Empty:
+            raise InferenceUnavailable("inference pool hết slot") from None
+        req_id, done, box = next(self._ids), threading.Event(), []
+        self.shms[slot].buf[:len(image_bytes)] = image_bytes
+        with self._lock:
+            busy = [0] * len(self.procs)
+            for w in self._owner.values():
+                busy[w] += 1
+            i = min(range(len(busy)), key=busy.__getitem__)  # process ít việc nhất
+            conn, send_lock = self.conns[i], self._send_locks[i]
+            self._waiting[req_id] = (done, box)
+            self._slots[req_id] = slot
+            self._owner[req_id] = i
+        try:
+            with send_lock:
+                conn.send((req_id, op, slot, len(image_bytes), kwargs))
+        except OSError:
+            with self._lock:
+                self._waiting.pop(req_id, None)
+                self._owner.pop(req_id, None)
+                if self._slots.pop(req_id, None) is not None:
+                    self.free.put(slot)
+            raise InferenceUnavailable(f"process suy luận {i} không nhận việc") from None
+        if not done.wait(timeout):
+            # slot vẫn giữ tới khi kết quả muộn về (hoặc process chết): process có thể còn đang đọc ảnh
+            with self._lock:
+                self._waiting.pop(req_id, None)
+            raise InferenceUnavailable("inference pool quá thời gian")
+        ok, payload = box
+        if not ok:
+            raise InferenceUnavailable(payload)
+        return payload
+
+    def close(self):
+        self._closed = True
+        for conn, send_lock in zip(self.conns, self._send_locks):
+            try:
+                with send_lock:
+                    conn.send(None)
+            except OSError:
+                pass
+        for p in self.procs:
+            p.join(timeout=5)
+        for conn in self.conns:
+            conn.close()
+        for shm in self.shms:
+            shm.close(); shm.unlink()
+
+_pool = None
+_pool_lock = threading.Lock()
+_slot = None   # warmup(index=...) ghi lại trước khi dựng pool
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = InferencePool(slot=_slot)
+    return _pool
+
+def _collect_metrics():
+    if _pool:
+        INFERENCE.set(_pool.free.qsize(), state="pool_free_slots")
+        INFERENCE.set(sum(p.is_alive() for p in _pool.procs), state="pool_alive")
+        INFERENCE.set(_pool.restarts, state="pool_restarts")
+
+REGISTRY.register_collector(_collect_metrics)
+
+
+# ===== Sidecar =====
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from .lprclient import LprClient
+                conf = _conf()
+                _client = LprClient(conf["SIDECAR_ADDRESS"], timeout=float(conf["TIMEOUT"]))
+    return _client
+
+def _sidecar(method, *args, **kwargs):
+    from .lprclient import SidecarUnavailable
+    try:
+        return getattr(get_client(), method)(*args, **kwargs)
+    except SidecarUnavailable as e:
+        if not _conf()["SIDECAR_FALLBACK"]:
+            raise InferenceUnavailable(str(e)) from e
+        log.warning("LPR sidecar không phản hồi, OCR trong process")
+        return None
+
+
+# ===== Điểm vào dùng chung cho views/deferred =====
+# Pool/sidecar không chạy được → InferenceUnavailable, deferred coi như engine quá tải.
+@profiled("recognize_plate")
+def recognize_plate_from_bytes(image_bytes: bytes, lanes=None, lane=None, quality=None):
+    mode = _conf()["MODE"]
+    if mode == "pool":
+        return get_pool().run("plate", image_bytes, lanes=lanes, lane=lane, quality=quality)
+    if mode == "sidecar":
+        result = _sidecar("recognize_plate", image_bytes, lanes=lanes, lane=lane, quality=quality)
+        if result is not None:
+            return result
+    from .lpr import recognize_plate_from_bytes as run
+    return run(image_bytes, lanes=lanes, lane=lane, quality=quality)
+
+def recognize_plates_from_bytes(image_bytes: bytes, lanes=None, quality=None):
+    mode = _conf()["MODE"]
+    if mode == "pool":
+        return get_pool().run("plates", image_bytes, lanes=lanes, quality=quality)
+    if mode == "sidecar":
+        result = _sidecar("recognize_plates", image_bytes, lanes=lanes, quality=quality)
+        if result is not None:
+            return result
+    from .lpr import recognize_plates_from_bytes as run
+    return run(image_bytes, lanes=lanes, quality=quality)
+
+@profiled("recognize_crops")
+def recognize_plate_from_crops(crops, bboxes=None):
+    mode = _conf()["MODE"]
+    if mode == "pool":
+        return get_pool().run("crops", b"".join(crops), sizes=[len(c) for c in crops], bboxes=bboxes)
+    if mode == "sidecar":
+        result = _sidecar("recognize_crops", crops, bboxes=bboxes)
+        if result is not None:
+            return result
+    from .lpr import recognize_plate_from_crops as run
+    return run(crops, bboxes=bboxes)
+
+def warmup(index=None):
+    """Gọi khi khởi động (runserver: apps.ready, gunicorn: gunicorn.conf.py): đặt thread budget cho web worker
+    thứ `index`, nạp model (inline) hoặc dựng pool."""
+    global _slot
+    mode = _conf()["MODE"]
+    if mode == "pool":
+        _slot = index
+        get_pool()
+        return
+    if mode == "sidecar":
+        if not get_client().ping():
+            log.warning("LPR sidecar %s chưa sẵn sàng", _conf()["SIDECAR_ADDRESS"])
+        return
+    apply_budget(index=index)
+    from .lpr import _load_models
+    _load_models()
@@ -1,22 +1,43 @@
 from __future__ import annotations
-from pathlib import Path
-import re, cv2, torch, numpy as np
+import re, threading, time, cv2, torch, numpy as np
 import torch.nn.functional as F
-from .model import CRNN
-from .dataset import read_charset
-
-ROOT = Path(__file__).resolve().parent
-MODELS_DIR = ROOT / "lpr_models"
-DET_WEIGHTS = MODELS_DIR / "best.pt"
-OCR_WEIGHTS = MODELS_DIR / "best_acc.pth"
-CHARSET_TXT = MODELS_DIR / "charset.txt"
+from django.conf import settings
+from .metrics import lpr_stage, REGISTRY
+from .lprmodels import get_registry, submit_shadow
 
 IMG_H, IMG_W = 48, 320
+LPR_PREFILTER = REGISTRY.counter("lpr_prefilter_total", "Frames rejected/flagged by the quality pre-filter",
+                                 ("reason", "mode"))
 _device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
-_det = None
-_crnn = None
-_ch2idx, _idx2ch = None, None
+DEFAULTS = {
+    "DET_CONF": 0.25,
+    "DET_IMGSZ": 1024,
+    "NMS_IOU": 0.5,       # NMS không phân lớp giữa các box biển số (xe máy cạnh ô tô, 2 làn)
+    "MAX_PLATES": 8,      # số biển tối đa OCR trong 1 khung hình
+    "QUALITY": {},        # ghi đè QUALITY_DEFAULTS cho mọi gate; Gate.quality ghi đè tiếp cho từng gate
+    # Crop biển số do thiết bị cổng gửi lên: ngoài khoảng tỉ lệ W/H này coi như crop sai → chạy lại detector
+    "CROP_MIN_ASPECT": 1.0,   # biển 2 dòng xe máy ~1.4
+    "CROP_MAX_ASPECT": 6.0,   # biển 1 dòng ô tô ~4.7
+    "CROP_MIN_HEIGHT": 12,
+}
+
+QUALITY_DEFAULTS = {
+    "ENABLED": True,
+    "MAX_SIDE": 320,           # kiểm tra trên ảnh thu nhỏ
+    "MIN_SHARPNESS": 40.0,     # phương sai Laplacian
+    "MIN_MEAN": 25.0,
+    "MAX_MEAN": 235.0,
+    "MAX_CLIPPED_HIGH": 0.30,  # tỉ lệ pixel >= 250
+    "MAX_CLIPPED_LOW": 0.50,   # tỉ lệ pixel <= 5
+    "MODE": "reject",          # reject: trả lỗi ngay, không chạy YOLO | flag: vẫn nhận dạng, gắn quality_flag
+}
+# Hành động gợi ý cho thiết bị cổng theo mã lý do
+QUALITY_ACTIONS = {"undecodable": "retake", "overexposed": "retake", "underexposed": "retake",
+                   "blurry": "retake"}
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "LPR", {})}
 
 RULE = re.compile(r"^[0-9]{2}[A-Z0-9]{2}[0-9]{4,5}$")
 MAP_LET2NUM = {"O":"0","I":"1","Z":"2","S":"5","B":"8","G":"6"}
@@ -32,48 +53,165 @@ def _force_plate_format(txt: str) -> str:
     return s2 if RULE.match(s2) else s
 
 def _load_models():
-    global _det, _crnn, _ch2idx, _idx2ch
-    if _det is None:
-        from ultralytics import YOLO
-        _det = YOLO(str(DET_WEIGHTS))
-    if _crnn is None:
-        _ch2idx, _idx2ch = read_charset(str(CHARSET_TXT))
-        _crnn = CRNN(num_classes=len(_idx2ch), img_h=IMG_H).to(_device)
-        state = torch.load(str(OCR_WEIGHTS), map_location=_device)
-        _crnn.load_state_dict(state, strict=True)
-        _crnn.eval()
+    """Bundle model đang phục vụ (detector + CRNN + charset) — xem app/lprmodels.py."""
+    return get_registry(_device).serving()
 
 def _to_bgr(image_bytes: bytes):
     arr = np.frombuffer(image_bytes, np.uint8)
     return cv2.imdecode(arr, cv2.IMREAD_COLOR)
 
-def _best_plate_box(img_bgr, conf=0.25, imgsz=1024):
-    _load_models()
-    r = _det.predict(img_bgr, imgsz=imgsz, conf=conf, verbose=False)
-    boxes = r[0].boxes
-    if boxes is None or boxes.xyxy.shape[0] == 0:
-        return None
-    i = int(boxes.conf.argmax().item())
-    x1,y1,x2,y2 = boxes.xyxy[i].cpu().numpy().astype(int)
-    det_conf = float(boxes.conf[i].item())
+_HIST_BINS = np.arange(256, dtype=np.float64)
+
+def frame_quality(img_bgr, thresholds=None):
+    """Lọc khung hình hỏng trước khi chạy YOLO: mờ, cháy sáng/thiếu sáng.
+
+    Không so với khung trước của gate: xe đứng yên trước barie chụp lại (sau retake) vẫn là khung hợp lệ,
+    và khung trước chỉ có trong process đã nhận request đó. Lọc cảnh tĩnh nằm ở chế độ stream (app/stream.py).
+
+    Trả về {"ok", "reason", "action", "mode", "metrics"}; reason None khi khung hình dùng được.
+    """
+    q = {**QUALITY_DEFAULTS, **_conf()["QUALITY"], **(thresholds or {})}
+    if img_bgr is None:
+        return {"ok": False, "reason": "undecodable", "action": "retake", "mode": "reject", "metrics": {}}
+    if not q["ENABLED"]:
+        return {"ok": True, "reason": None, "action": None, "mode": q["MODE"], "metrics": {}}
+    H, W = img_bgr.shape[:2]
+    scale = min(1.0, float(q["MAX_SIDE"]) / max(H, W))
+    small = cv2.resize(img_bgr, (max(1, int(W*scale)), max(1, int(H*scale))), interpolation=cv2.INTER_AREA) \
+        if scale < 1.0 else img_bgr
+    g = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    n = float(g.size)
+    hist = cv2.calcHist([g], [0], None, [256], [0, 256]).ravel()
+    m = {
+        "sharpness": float(cv2.Laplacian(g, cv2.CV_32F).var()),
+        "mean": float(hist @ _HIST_BINS / n),
+        "clipped_high": float(hist[250:].sum() / n),
+        "clipped_low": float(hist[:6].sum() / n),
+    }
+
+    if m["mean"] > q["MAX_MEAN"] or m["clipped_high"] > q["MAX_CLIPPED_HIGH"]:
+        reason = "overexposed"
+    elif m["mean"] < q["MIN_MEAN"] or m["clipped_low"] > q["MAX_CLIPPED_LOW"]:
+        reason = "underexposed"
+    elif m["sharpness"] < q["MIN_SHARPNESS"]:
+        reason = "blurry"
+    else:
+        reason = None
+    return {"ok": reason is None, "reason": reason, "action": QUALITY_ACTIONS.get(reason),
+            "mode": q["MODE"], "metrics": m}
+
+def _decode_checked(image_bytes, quality=None):
+    """Decode + lọc chất lượng. Trả về (ảnh, kết quả lỗi hoặc None, quality_flag)."""
+    with lpr_stage("decode"):
+        img = _to_bgr(image_bytes)
+    with lpr_stage("quality"):
+        qc = frame_quality(img, quality)
+    if not qc["ok"]:
+        LPR_PREFILTER.inc(reason=qc["reason"], mode=qc["mode"])
+        if qc["mode"] == "reject" or img is None:
+            return img, {"ok": False, "detail": "bad_frame", "reason": qc["reason"], "action": qc["action"],
+                         "quality": qc["metrics"]}, None
+        return img, None, qc["reason"]
+    return img, None, None
+
+def _nms(boxes, scores, iou):
+    """NMS không phân lớp; trả về chỉ số giữ lại theo thứ tự score giảm dần."""
+    order = scores.argsort()[::-1]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size:
+        i = order[0]; keep.append(int(i))
+        xx1 = np.maximum(boxes[i, 0], boxes[order[1:], 0]); yy1 = np.maximum(boxes[i, 1], boxes[order[1:], 1])
+        xx2 = np.minimum(boxes[i, 2], boxes[order[1:], 2]); yy2 = np.minimum(boxes[i, 3], boxes[order[1:], 3])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        ov = inter / (areas[i] + areas[order[1:]] - inter + 1e-9)
+        order = order[1:][ov <= iou]
+    return keep
+
+def _crop(img_bgr, box):
+    x1,y1,x2,y2 = map(int, box)
     H,W = img_bgr.shape[:2]
     padx = int(0.08*(x2-x1)); pady = int(0.20*(y2-y1))
     x1 = max(0, x1-padx); y1 = max(0, y1-pady)
     x2 = min(W, x2+padx); y2 = min(H, y2+pady)
-    crop = img_bgr[y1:y2, x1:x2].copy()
-    return crop, (x1,y1,x2,y2), det_conf
+    return img_bgr[y1:y2, x1:x2].copy(), (x1,y1,x2,y2)
+
+def _plate_boxes(img_bgr, conf=None, imgsz=None, iou=None, max_plates=None, bundle=None):
+    """Mọi box biển số trên ngưỡng sau NMS: [(crop, bbox, det_conf)], det_conf giảm dần."""
+    c = _conf()
+    det = (bundle or _load_models()).det
+    r = det.predict(img_bgr, imgsz=imgsz or c["DET_IMGSZ"], conf=c["DET_CONF"] if conf is None else conf,
+                     verbose=False)
+    boxes = r[0].boxes
+    if boxes is None or boxes.xyxy.shape[0] == 0:
+        return []
+    xyxy = boxes.xyxy.cpu().numpy()
+    scores = boxes.conf.cpu().numpy()
+    keep = _nms(xyxy, scores, c["NMS_IOU"] if iou is None else iou)[:max_plates or c["MAX_PLATES"]]
+    out = []
+    for i in keep:
+        crop, bbox = _crop(img_bgr, xyxy[i].astype(int))
+        out.append((crop, bbox, float(scores[i])))
+    return out
+
+def _best_plate_box(img_bgr, conf=0.25, imgsz=1024):
+    found = _plate_boxes(img_bgr, conf=conf, imgsz=imgsz, max_plates=1)
+    return found[0] if found else None
+
+def assign_lane(bbox, lanes, width, height):
+    """Làn chứa tâm bbox. lanes (Gate.lanes): [{"name": "L1", "x": [0, 0.5], "y": [0, 1]}], toạ độ chuẩn hoá 0..1."""
+    x1,y1,x2,y2 = bbox
+    cx, cy = (x1 + x2) / 2 / width, (y1 + y2) / 2 / height
+    for lane in lanes or ():
+        lx = lane.get("x") or (0, 1); ly = lane.get("y") or (0, 1)
+        if lx[0] <= cx < lx[1] and ly[0] <= cy < ly[1]:
+            return lane.get("name")
+    return None
+
+_tls = threading.local()   # CLAHE của OpenCV không thread-safe; buffer batch cũng riêng từng thread
+
+def _clahe():
+    c = getattr(_tls, "clahe", None)
+    if c is None:
+        c = _tls.clahe = cv2.createCLAHE(2.0,(8,8))
+    return c
+
+def _batch_buffers(n):
+    """Buffer tái sử dụng theo thread: uint8 (N,H,W) để resize vào, float32 (N,1,H,W) (pinned nếu CUDA)."""
+    cap = getattr(_tls, "cap", 0)
+    if cap < n:
+        cap = max(n, 2*cap, 4)
+        _tls.u8 = np.empty((cap, IMG_H, IMG_W), np.uint8)
+        t = torch.empty((cap, 1, IMG_H, IMG_W), dtype=torch.float32)
+        _tls.batch = t.pin_memory() if _device.type == "cuda" else t
+        _tls.cap = cap
+    return _tls.u8, _tls.batch
+
+_SCALE, _SHIFT = np.float32(2/255.0), np.float32(1.0)
+
+def _preprocess_batch(crops):
+    """[crop BGR] → tensor (N,1,48,320) trên _device, chuẩn hoá (x/255-0.5)/0.5.
+
+    Trên CPU tensor trả về là view của buffer thread: chỉ dùng được tới lần gọi kế tiếp trong cùng thread.
+    """
+    n = len(crops)
+    u8, batch = _batch_buffers(n)
+    clahe = _clahe()
+    for i, img in enumerate(crops):
+        g = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        g = clahe.apply(g)
+        blur = cv2.GaussianBlur(g,(0,0),1.0)
+        cv2.addWeighted(g,1.5,blur,-0.5,0,dst=blur)
+        cv2.resize(blur,(IMG_W,IMG_H),dst=u8[i],interpolation=cv2.INTER_LINEAR)
+    out = batch[:n].numpy()[:, 0]
+    np.multiply(u8[:n], _SCALE, out=out, casting="unsafe")
+    np.subtract(out, _SHIFT, out=out)
+    return batch[:n].to(_device, non_blocking=True)
 
 def _preprocess_for_crnn(img_bgr):
-    g = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
-    clahe = cv2.createCLAHE(2.0,(8,8)); g = clahe.apply(g)
-    blur = cv2.GaussianBlur(g,(0,0),1.0)
-    sharp = cv2.addWeighted(g,1.5,blur,-0.5,0)
-    im = cv2.resize(sharp,(IMG_W,IMG_H),interpolation=cv2.INTER_LINEAR).astype(np.float32)
-    im = (im/255.0 - 0.5)/0.5
-    t = torch.from_numpy(im).unsqueeze(0).unsqueeze(0).to(_device)
-    return t
+    return _preprocess_batch([img_bgr]).clone()
 
-def _ctc_greedy_decode(logp):
+def _ctc_greedy_decode_batch(logp):
     pred = logp.argmax(2).permute(1,0).detach().cpu().numpy().tolist()
     outs=[]
     for seq in pred:
@@ -82,32 +220,140 @@ def _ctc_greedy_decode(logp):
             if a!=prev and a!=0: s.append(a)
             prev=a
         outs.append(s)
+    return outs
+
+def _ctc_greedy_decode(logp):
+    outs = _ctc_greedy_decode_batch(logp)
     return outs[0] if outs else []
 
-def _ocr_text_and_conf(crop_bgr):
-    _load_models()
-    x = _preprocess_for_crnn(crop_bgr)
+def _ocr_batch(crops, bundle=None):
+    """OCR nhiều crop trong 1 lượt forward CRNN: [(text, conf)] theo thứ tự crops."""
+    if not crops:
+        return []
+    b = bundle or _load_models()
+    idx2ch = b.idx2ch
+    x = _preprocess_batch(crops)
     with torch.no_grad():
-        logits = _crnn(x)
-        logp = torch.log_softmax(logits, dim=2)
-        ids = _ctc_greedy_decode(logp)
-        text = "".join(_idx2ch[i] for i in ids if i < len(_idx2ch))
-        text = _force_plate_format(text)
-        prob = torch.exp(logp).max(2).values.mean().item()
-    return text, float(prob)
-
-def recognize_plate_from_bytes(image_bytes: bytes):
-    img = _to_bgr(image_bytes)
-    best = _best_plate_box(img)
-    if not best:
-        return {"ok": False, "detail": "no_plate"}
-    crop, bbox, det_conf = best
-    text, ocr_conf = _ocr_text_and_conf(crop)
+        logits = b.crnn(x)
+        logp = torch.log_softmax(logits, dim=2)                 # (T, N, C)
+        probs = torch.exp(logp).max(2).values.mean(0).tolist()  # (N,)
+        out = []
+        for ids, prob in zip(_ctc_greedy_decode_batch(logp), probs):
+            text = "".join(idx2ch[i] for i in ids if i < len(idx2ch))
+            out.append((_force_plate_format(text), float(prob)))
+    return out
+
+def _ocr_text_and_conf(crop_bgr, bundle=None):
+    return _ocr_batch([crop_bgr], bundle)[0]
+
+def _plate_result(text, ocr_conf, bbox, det_conf, lane=None):
     return {
-        "ok": True,
         "text": text,
         "det_conf": det_conf,
         "ocr_conf": ocr_conf,
         "n_chars": len(text),
         "bbox": bbox,
+        "lane": lane,
     }
+
+def _recognize_plates(b, image_bytes, lanes=None, quality=None):
+    """Mọi biển số trong khung hình (camera phủ nhiều làn), OCR chung 1 batch.
+
+    Trả về {"ok", "plates": [...]} — mỗi plate có "lane" theo cấu hình lanes của Gate (None nếu ngoài làn).
+    Khung hình hỏng: {"ok": False, "detail": "bad_frame", "reason", "action"} (xem frame_quality).
+    """
+    img, bad, flag = _decode_checked(image_bytes, quality)
+    if bad:
+        return {**bad, "plates": []}
+    with lpr_stage("detect"):
+        found = _plate_boxes(img, bundle=b)
+    if not found:
+        return {"ok": False, "detail": "no_plate", "plates": []}
+    H, W = img.shape[:2]
+    with lpr_stage("ocr"):
+        texts = _ocr_batch([crop for crop, _, _ in found], b)
+    plates = [
+        _plate_result(text, ocr_conf, bbox, det_conf, assign_lane(bbox, lanes, W, H) if lanes else None)
+        for (_, bbox, det_conf), (text, ocr_conf) in zip(found, texts)
+    ]
+    return {"ok": True, "plates": plates, "quality_flag": flag}
+
+def _recognize_plate(b, image_bytes, lanes=None, lane=None, quality=None):
+    """Biển số tin cậy nhất; nếu có lane (và gate có cấu hình lanes) thì chỉ xét box nằm trong làn đó.
+
+    quality là ngưỡng riêng của gate (Gate.quality).
+    """
+    if not lanes:
+        lane = None  # không có làn nào để so: lọc theo lane sẽ loại hết box
+    img, bad, flag = _decode_checked(image_bytes, quality)
+    if bad:
+        return bad
+    with lpr_stage("detect"):
+        found = _plate_boxes(img, max_plates=None if lane else 1, bundle=b)
+    if lane:
+        H, W = img.shape[:2]
+        found = [f for f in found if assign_lane(f[1], lanes, W, H) == lane]
+    if not found:
+        return {"ok": False, "detail": "no_plate"}
+    crop, bbox, det_conf = found[0]
+    with lpr_stage("ocr"):
+        text, ocr_conf = _ocr_text_and_conf(crop, b)
+    return {"ok": True, **_plate_result(text, ocr_conf, bbox, det_conf, lane), "quality_flag": flag}
+
+def _crop_plausible(img, c):
+    if img is None:
+        return False
+    h, w = img.shape[:2]
+    return h >= c["CROP_MIN_HEIGHT"] and c["CROP_MIN_ASPECT"] <= w / h <= c["CROP_MAX_ASPECT"]
+
+def _recognize_crops(b, crops, bboxes=None):
+    """Thiết bị cổng đã tự cắt biển số: bỏ qua YOLO, OCR mọi crop trong 1 batch và lấy kết quả tin cậy nhất.
+
+    Crop có tỉ lệ bất thường (thiết bị cắt lệch/gửi cả khung) được đưa qua detector như ảnh thường.
+    bboxes: toạ độ crop trong khung gốc do thiết bị khai báo, chỉ để trả lại cho client.
+    """
+    c = _conf()
+    items = []   # (crop, bbox, det_conf, source)
+    for i, data in enumerate(crops):
+        with lpr_stage("decode"):
+            img = _to_bgr(data)
+        declared = tuple(bboxes[i]) if bboxes and i < len(bboxes) and bboxes[i] else None
+        if _crop_plausible(img, c):
+            h, w = img.shape[:2]
+            items.append((img, declared or (0, 0, w, h), 1.0, "edge"))
+        elif img is not None:
+            with lpr_stage("detect"):
+                found = _plate_boxes(img, max_plates=1, bundle=b)
+            items += [(crop, bbox, det_conf, "detector") for crop, bbox, det_conf in found]
+    if not items:
+        return {"ok": False, "detail": "no_plate"}
+    with lpr_stage("ocr"):
+        texts = _ocr_batch([it[0] for it in items], b)
+    (_, bbox, det_conf, source), (text, ocr_conf) = max(zip(items, texts), key=lambda x: x[1][1])
+    return {"ok": True, **_plate_result(text, ocr_conf, bbox, det_conf), "source": source}
+
+
+# ===== Điểm vào: bundle đang phục vụ + lấy mẫu cho model shadow =====
+_RUNNERS = {"plate": _recognize_plate, "plates": _recognize_plates, "crops": _recognize_crops}
+
+def run_with(bundle, kind, payload, opts):
+    return _RUNNERS[kind](bundle, payload, **opts)
+
+def _serve(kind, payload, opts):
+    b = _load_models()  # giữ 1 tham chiếu cho cả request: hot-swap giữa chừng không trộn 2 phiên bản
+    t0 = time.perf_counter()
+    result = run_with(b, kind, payload, opts)
+    if result.get("detail") != "bad_frame":
+        # shadow không lọc chất lượng lại
+        shadow_opts = {**opts, "quality": {"ENABLED": False}} if kind != "crops" else opts
+        submit_shadow(kind, payload, shadow_opts, result, time.perf_counter() - t0, b.version)
+    return result
+
+def recognize_plate_from_bytes(image_bytes: bytes, lanes=None, lane=None, quality=None):
+    return _serve("plate", image_bytes, {"lanes": lanes, "lane": lane, "quality": quality})
+
+def recognize_plates_from_bytes(image_bytes: bytes, lanes=None, quality=None):
+    return _serve("plates", image_bytes, {"lanes": lanes, "quality": quality})
+
+def recognize_plate_from_crops(crops, bboxes=None):
+    return _serve("crops", crops, {"bboxes": bboxes})
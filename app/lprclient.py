@@ -0,0 +1,167 @@
+# Client mỏng cho LPR sidecar (manage.py lpr_server) — chỉ dùng thư viện chuẩn, không kéo torch/cv2.
+#
+# Giao thức nhị phân trên Unix socket hoặc TCP localhost, mỗi kết nối gửi nhiều frame:
+#   request : MAGIC | op u8 | flags u8 | meta_len u16 | image_len u32 | meta (JSON) | image
+#   response: MAGIC | status u8 | n_plates u8 | detail_len u16 | 0 u32 | detail
+#             (detail: lỗi; "reason:action" khi BAD_FRAME; quality_flag khi OK)
+#             + n_plates x (det_conf f32 | ocr_conf f32 | bbox 4 x i32 | text_len u8 | lane_len u8 | text | lane)
+from __future__ import annotations
+import json, socket, struct, threading
+
+MAGIC = b"LPR1"
+HEADER = struct.Struct(">4sBBHI")
+PLATE = struct.Struct(">ff4iBB")
+
+OP_PLATE, OP_PLATES, OP_PING, OP_CROPS = 1, 2, 3, 4
+ST_OK, ST_NO_PLATE, ST_ERROR, ST_BAD_FRAME = 0, 1, 2, 3
+
+
+class SidecarUnavailable(Exception):
+    pass
+
+
+def parse_address(address: str):
+    """"unix:/run/lpr.sock" | "tcp:127.0.0.1:8765" → (family, sockaddr)."""
+    kind, _, rest = address.partition(":")
+    if kind == "unix":
+        return socket.AF_UNIX, rest
+    if kind == "tcp":
+        host, _, port = rest.rpartition(":")
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    raise ValueError(f"địa chỉ sidecar không hợp lệ: {address}")
+
+def recv_exact(sock, n: int) -> bytes:
+    buf = bytearray(n)
+    view, got = memoryview(buf), 0
+    while got < n:
+        k = sock.recv_into(view[got:], n - got)
+        if not k:
+            raise ConnectionError("sidecar đóng kết nối")
+        got += k
+    return bytes(buf)
+
+
+# ===== Mã hoá =====
+def split_crops(blob: bytes, sizes) -> list[bytes]:
+    """Nhiều crop được nối thành 1 payload (1 slot shared memory / 1 frame); sizes tách lại."""
+    out, pos = [], 0
+    for n in sizes:
+        out.append(blob[pos:pos + n]); pos += n
+    return out
+
+def encode_request(op: int, image: bytes = b"", meta: dict | None = None) -> bytes:
+    m = json.dumps(meta, separators=(",", ":")).encode() if meta else b""
+    return HEADER.pack(MAGIC, op, 0, len(m), len(image)) + m + image
+
+def encode_response(result: dict) -> bytes:
+    plates = result.get("plates")
+    if plates is None:
+        plates = [result] if result.get("ok") else []
+    if result.get("ok"):
+        status, detail = ST_OK, (result.get("quality_flag") or "").encode()
+    elif result.get("detail") == "bad_frame":
+        status, detail = ST_BAD_FRAME, f"{result.get('reason')}:{result.get('action') or ''}".encode()
+    else:
+        status = ST_NO_PLATE if result.get("detail") == "no_plate" else ST_ERROR
+        detail = str(result.get("detail", "")).encode()
+    parts = [HEADER.pack(MAGIC, status, len(plates), len(detail), 0), detail]
+    for p in plates:
+        text, lane = p["text"].encode(), (p.get("lane") or "").encode()
+        parts.append(PLATE.pack(p["det_conf"], p["ocr_conf"], *map(int, p["bbox"]), len(text), len(lane)))
+        parts += [text, lane]
+    return b"".join(parts)
+
+def read_response(sock) -> tuple[int, list[dict], str]:
+    magic, status, n, detail_len, _ = HEADER.unpack(recv_exact(sock, HEADER.size))
+    if magic != MAGIC:
+        raise ConnectionError("sai giao thức sidecar")
+    detail = recv_exact(sock, detail_len).decode() if detail_len else ""
+    plates = []
+    for _ in range(n):
+        det, ocr, x1, y1, x2, y2, tl, ll = PLATE.unpack(recv_exact(sock, PLATE.size))
+        text = recv_exact(sock, tl).decode()
+        lane = recv_exact(sock, ll).decode() if ll else None
+        plates.append({"text": text, "det_conf": det, "ocr_conf": ocr, "n_chars": len(text),
+                       "bbox": (x1, y1, x2, y2), "lane": lane})
+    return status, plates, detail
+
+
+class LprClient:
+    """Mỗi thread giữ 1 kết nối tới sidecar; lỗi kết nối → thử lại 1 lần với kết nối mới."""
+    def __init__(self, address: str, timeout: float = 10.0):
+        self.family, self.sockaddr = parse_address(address)
+        self.timeout = timeout
+        self._tls = threading.local()
+
+    def _sock(self):
+        s = getattr(self._tls, "sock", None)
+        if s is None:
+            s = socket.socket(self.family, socket.SOCK_STREAM)
+            s.settimeout(self.timeout)
+            try:
+                s.connect(self.sockaddr)
+            except OSError as e:
+                s.close()
+                raise SidecarUnavailable(str(e)) from e
+            if self.family == socket.AF_INET:
+                s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._tls.sock = s
+        return s
+
+    def _drop(self):
+        s = getattr(self._tls, "sock", None)
+        self._tls.sock = None
+        if s is not None:
+            s.close()
+
+    def call(self, op: int, image: bytes = b"", meta: dict | None = None):
+        frame = encode_request(op, image, meta)
+        for attempt in (0, 1):
+            try:
+                s = self._sock()
+                s.sendall(frame)
+                return read_response(s)
+            except SidecarUnavailable:
+                raise
+            except (OSError, ConnectionError) as e:
+                self._drop()
+                if attempt:
+                    raise SidecarUnavailable(str(e)) from e
+
+    @staticmethod
+    def _meta(**kw):
+        return {k: v for k, v in kw.items() if v} or None
+
+    @staticmethod
+    def _failure(status, detail):
+        if status == ST_BAD_FRAME:
+            reason, _, action = detail.partition(":")
+            return {"ok": False, "detail": "bad_frame", "reason": reason, "action": action or None}
+        return {"ok": False, "detail": detail or "no_plate"}
+
+    def recognize_plate(self, image: bytes, lanes=None, lane=None, quality=None) -> dict:
+        meta = self._meta(lanes=lanes if lane else None, lane=lane, quality=quality)
+        status, plates, detail = self.call(OP_PLATE, image, meta)
+        if status != ST_OK:
+            return self._failure(status, detail)
+        return {"ok": True, **plates[0], "quality_flag": detail or None}
+
+    def recognize_plates(self, image: bytes, lanes=None, quality=None) -> dict:
+        status, plates, detail = self.call(OP_PLATES, image, self._meta(lanes=lanes, quality=quality))
+        if status != ST_OK:
+            return {**self._failure(status, detail), "plates": []}
+        return {"ok": True, "plates": plates, "quality_flag": detail or None}
+
+    def recognize_crops(self, crops, bboxes=None) -> dict:
+        meta = self._meta(sizes=[len(c) for c in crops], bboxes=bboxes)
+        status, plates, detail = self.call(OP_CROPS, b"".join(crops), meta)
+        if status != ST_OK:
+            return self._failure(status, detail)
+        # source không đi qua giao thức: crop có qua detector hay không chỉ có ý nghĩa chẩn đoán
+        return {"ok": True, **plates[0]}
+
+    def ping(self) -> bool:
+        try:
+            return self.call(OP_PING)[0] == ST_OK
+        except SidecarUnavailable:
+            return False
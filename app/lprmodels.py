@@ -0,0 +1,281 @@
+"""Registry model LPR theo phiên bản.
+
+Mỗi bundle là 1 thư mục con của DIR: detector (best.pt) + CRNN (best_acc.pth) + charset.txt, tuỳ chọn
+meta.json đổi tên file. Bản "default" là bố cục cũ (các file nằm thẳng trong DIR).
+
+Con trỏ ACTIVE / SHADOW là file text trong DIR (ghi bằng `manage.py lpr_models`), mọi process
+(web worker, pool, sidecar) tự đọc lại sau mỗi CHECK_INTERVAL giây: bundle mới được nạp + chạy thử
+ở thread nền rồi mới thay con trỏ, request đang chạy vẫn giữ bundle cũ tới khi xong.
+
+Module này không import torch ở mức module — lệnh quản trị chạy được trên máy không có torch.
+"""
+from __future__ import annotations
+import json, logging, os, queue, random, threading, time
+from pathlib import Path
+
+from django.conf import settings
+
+from .metrics import REGISTRY, LPR_MODEL_LOAD, record_cache
+
+log = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "DIR": Path(__file__).resolve().parent / "lpr_models",
+    "ACTIVE": "default",       # dùng khi chưa có file con trỏ ACTIVE
+    "SHADOW": None,
+    "CHECK_INTERVAL": 5.0,     # giây giữa 2 lần đọc con trỏ
+    "SHADOW_RATE": 0.05,       # tỉ lệ ảnh thật được chạy lại bằng model shadow
+    "SHADOW_QUEUE": 32,        # đầy → bỏ mẫu, không bao giờ chặn request
+    "LOG_DIR": None,           # mặc định DIR/shadow
+}
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "LPR_MODELS", {})}
+
+FILES = {"det": "best.pt", "ocr": "best_acc.pth", "charset": "charset.txt"}
+LPR_MODEL_ACTIVE = REGISTRY.gauge("lpr_model_active", "Loaded LPR model bundle (1 = in use)", ("version", "role"))
+LPR_SHADOW = REGISTRY.counter("lpr_shadow_total", "Shadow evaluations by outcome", ("version", "result"))
+LPR_SHADOW_SECONDS = REGISTRY.histogram("lpr_shadow_seconds", "Shadow model latency", ("version",))
+
+
+# ===== Con trỏ & danh sách phiên bản =====
+def models_dir(conf=None):
+    return Path((conf or _conf())["DIR"])
+
+def bundle_path(version, conf=None):
+    d = models_dir(conf)
+    if (d / version).is_dir():
+        return d / version
+    if version == "default" and (d / FILES["det"]).exists():
+        return d
+    raise FileNotFoundError(f"không có bundle model '{version}' trong {d}")
+
+def bundle_files(version, conf=None):
+    path = bundle_path(version, conf)
+    meta = {}
+    if (path / "meta.json").exists():
+        meta = json.loads((path / "meta.json").read_text())
+    return {k: path / meta.get(k, name) for k, name in FILES.items()}, meta
+
+def list_versions(conf=None):
+    d = models_dir(conf)
+    if not d.is_dir():
+        return []
+    found = sorted(p.name for p in d.iterdir() if p.is_dir() and (p / FILES["det"]).exists())
+    if (d / FILES["det"]).exists() and "default" not in found:
+        found.insert(0, "default")
+    return found
+
+def _read_pointer(name, fallback, conf):
+    try:
+        return (models_dir(conf) / name).read_text().strip() or None
+    except FileNotFoundError:
+        return fallback
+
+def active_version(conf=None):
+    conf = conf or _conf()
+    return _read_pointer("ACTIVE", conf["ACTIVE"], conf)
+
+def shadow_version(conf=None):
+    conf = conf or _conf()
+    return _read_pointer("SHADOW", conf["SHADOW"], conf)
+
+def set_pointer(name, version, conf=None):
+    """Ghi con trỏ nguyên tử (rename); version None → xoá con trỏ."""
+    d = models_dir(conf)
+    target = d / name
+    if version is None:
+        target.unlink(missing_ok=True)
+        return
+    bundle_files(version, conf)  # kiểm tra bundle tồn tại trước khi trỏ vào
+    tmp = d / f".{name}.{os.getpid()}"
+    tmp.write_text(version + "\n")
+    tmp.replace(target)
+
+
+# ===== Bundle =====
+class Bundle:
+    """1 phiên bản model đã nạp: detector, CRNN, bảng ký tự."""
+    def __init__(self, version, det, crnn, idx2ch):
+        self.version, self.det, self.crnn, self.idx2ch = version, det, crnn, idx2ch
+
+    @classmethod
+    def load(cls, version, device, conf=None):
+        import numpy as np, torch
+        from ultralytics import YOLO
+        from .dataset import read_charset
+        from .model import CRNN
+        from .lpr import IMG_H, IMG_W
+        files, meta = bundle_files(version, conf)
+        t0 = time.perf_counter()
+        det = YOLO(str(files["det"]))
+        LPR_MODEL_LOAD.set(time.perf_counter() - t0, model="det")
+        t0 = time.perf_counter()
+        _, idx2ch = read_charset(str(files["charset"]))
+        crnn = CRNN(num_classes=len(idx2ch), img_h=IMG_H).to(device)
+        crnn.load_state_dict(torch.load(str(files["ocr"]), map_location=device), strict=True)
+        crnn.eval()
+        LPR_MODEL_LOAD.set(time.perf_counter() - t0, model="ocr")
+        # chạy thử trước khi nhận traffic: lần predict/forward đầu tiên tốn thêm thời gian khởi tạo
+        det.predict(np.zeros((64, 64, 3), np.uint8), imgsz=64, verbose=False)
+        with torch.no_grad():
+            crnn(torch.zeros(1, 1, IMG_H, IMG_W, device=device))
+        log.info("LPR model %s đã nạp (%s)", version, meta.get("note", files["det"].parent))
+        return cls(version, det, crnn, idx2ch)
+
+
+class ModelRegistry:
+    def __init__(self, device):
+        self.device = device
+        self._serving = None
+        self._shadow = None
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self._loading = None
+        self._retry_at = {}        # version nạp lỗi → thời điểm được thử lại
+
+    def serving(self) -> Bundle:
+        """Bundle đang phục vụ. Lần đầu nạp đồng bộ; về sau đổi phiên bản ở thread nền (hot-swap)."""
+        b = self._serving
+        record_cache("lpr_models", b is not None)
+        if b is None:
+            with self._lock:
+                if self._serving is None:
+                    self._install(Bundle.load(active_version(), self.device))
+                return self._serving
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + float(_conf()["CHECK_INTERVAL"])
+            self._check(b)
+        return b
+
+    def _install(self, bundle):
+        old, self._serving = self._serving, bundle
+        if old is not None:
+            LPR_MODEL_ACTIVE.set(0, version=old.version, role="serving")
+        LPR_MODEL_ACTIVE.set(1, version=bundle.version, role="serving")
+
+    def _check(self, current):
+        try:
+            version = active_version()
+        except OSError:
+            return
+        with self._lock:
+            if version == current.version or version == self._loading \
+                    or time.monotonic() < self._retry_at.get(version, 0):
+                return
+            self._loading = version
+        threading.Thread(target=self._swap, args=(version,), name=f"lpr-model-load-{version}", daemon=True).start()
+
+    def _swap(self, version):
+        try:
+            bundle = Bundle.load(version, self.device)
+        except Exception:
+            log.exception("LPR model %s nạp lỗi — giữ bản %s", version, self._serving.version)
+            self._retry_at[version] = time.monotonic() + 60
+            return
+        finally:
+            self._loading = None
+        with self._lock:
+            self._install(bundle)  # gán 1 tham chiếu: request mới dùng bản mới, request cũ giữ bản cũ
+        log.info("LPR hot-swap → %s", version)
+
+    def reload(self):
+        """Nạp lại ngay theo con trỏ ACTIVE (đồng bộ) — dùng trong lệnh quản trị/benchmark."""
+        with self._lock:
+            self._install(Bundle.load(active_version(), self.device))
+        return self._serving
+
+    def shadow(self) -> Bundle | None:
+        version = shadow_version()
+        if not version:
+            self._shadow = None
+            return None
+        if self._serving is not None and version == self._serving.version:
+            return None
+        if self._shadow is None or self._shadow.version != version:
+            self._shadow = Bundle.load(version, self.device)
+            LPR_MODEL_ACTIVE.set(1, version=version, role="shadow")
+        return self._shadow
+
+
+# ===== Shadow evaluation =====
+_registry = None
+_registry_lock = threading.Lock()
+_shadow_q = None
+_shadow_worker = None
+_shadow_lock = threading.Lock()
+
+def get_registry(device=None) -> ModelRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry(device)
+    return _registry
+
+def shadow_log_path(version, conf=None):
+    conf = conf or _conf()
+    d = Path(conf["LOG_DIR"]) if conf["LOG_DIR"] else models_dir(conf) / "shadow"
+    return d / f"{version}.jsonl"
+
+def submit_shadow(kind, payload, opts, served, served_seconds, served_version):
+    """Sau khi trả kết quả: lấy mẫu theo SHADOW_RATE, đưa ảnh cho model shadow chạy lại ở thread nền."""
+    conf = _conf()
+    if random.random() >= float(conf["SHADOW_RATE"]):
+        return
+    if not conf["SHADOW"] and not (models_dir(conf) / "SHADOW").exists():
+        return
+    global _shadow_q, _shadow_worker
+    if _shadow_worker is None:
+        with _shadow_lock:
+            if _shadow_worker is None:
+                _shadow_q = queue.Queue(maxsize=int(conf["SHADOW_QUEUE"]))
+                _shadow_worker = threading.Thread(target=_shadow_loop, name="lpr-shadow", daemon=True)
+                _shadow_worker.start()
+    try:
+        _shadow_q.put_nowait((kind, payload, opts, served, served_seconds, served_version))
+    except queue.Full:
+        LPR_SHADOW.inc(version="?", result="dropped")
+
+def _top(result):
+    if result.get("plates") is not None:
+        best = max(result["plates"], key=lambda p: p["ocr_conf"], default=None)
+        return (best["text"], best["ocr_conf"]) if best else (None, 0.0)
+    return (result.get("text"), float(result.get("ocr_conf") or 0.0)) if result.get("ok") else (None, 0.0)
+
+def _shadow_loop():
+    from . import lpr
+    while True:
+        kind, payload, opts, served, served_s, served_version = _shadow_q.get()
+        try:
+            bundle = get_registry().shadow()
+        except Exception:
+            log.exception("không nạp được model shadow")
+            time.sleep(30)
+            continue
+        if bundle is None:
+            continue
+        t0 = time.perf_counter()
+        try:
+            result = lpr.run_with(bundle, kind, payload, opts)
+        except Exception as e:
+            LPR_SHADOW.inc(version=bundle.version, result="error")
+            log.warning("shadow %s lỗi: %r", bundle.version, e)
+            continue
+        elapsed = time.perf_counter() - t0
+        (s_text, s_conf), (c_text, c_conf) = _top(served), _top(result)
+        outcome = "agree" if s_text == c_text else "disagree"
+        LPR_SHADOW.inc(version=bundle.version, result=outcome)
+        LPR_SHADOW_SECONDS.observe(elapsed, version=bundle.version)
+        rec = {"at": time.time(), "kind": kind, "serving": served_version, "shadow": bundle.version,
+               "agree": outcome == "agree", "serving_text": s_text, "shadow_text": c_text,
+               "serving_conf": round(s_conf, 4), "shadow_conf": round(c_conf, 4),
+               "serving_ms": round(served_s * 1000, 1), "shadow_ms": round(elapsed * 1000, 1)}
+        path = shadow_log_path(bundle.version)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "a") as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        except OSError:
+            log.exception("không ghi được %s", path)
@@ -0,0 +1,75 @@
+from __future__ import annotations
+import json, logging, os, socket, socketserver, threading
+
+from .lprclient import (HEADER, MAGIC, OP_CROPS, OP_PING, OP_PLATE, OP_PLATES,
+                        encode_response, parse_address, recv_exact, split_crops)
+
+log = logging.getLogger(__name__)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server, sock = self.server, self.request
+        while True:
+            try:
+                head = recv_exact(sock, HEADER.size)
+                magic, op, _, meta_len, image_len = HEADER.unpack(head)
+                if magic != MAGIC:
+                    return
+                meta = json.loads(recv_exact(sock, meta_len)) if meta_len else {}
+                image = recv_exact(sock, image_len) if image_len else b""
+            except (OSError, ConnectionError, ValueError, json.JSONDecodeError):
+                return
+            sock.sendall(server.dispatch(op, image, meta))
+
+
+class _ServerMixin:
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def setup_engine(self, concurrency):
+        from . import lpr
+        self.lpr = lpr
+        self.slots = threading.BoundedSemaphore(concurrency)
+
+    def dispatch(self, op, image, meta):
+        if op == OP_PING:
+            return encode_response({"ok": True, "plates": []})
+        try:
+            with self.slots:
+                if op == OP_PLATE:
+                    result = self.lpr.recognize_plate_from_bytes(image, lanes=meta.get("lanes"), lane=meta.get("lane"),
+                                                             quality=meta.get("quality"))
+                elif op == OP_PLATES:
+                    result = self.lpr.recognize_plates_from_bytes(image, lanes=meta.get("lanes"),
+                                                              quality=meta.get("quality"))
+                elif op == OP_CROPS:
+                    result = self.lpr.recognize_plate_from_crops(split_crops(image, meta.get("sizes") or [len(image)]),
+                                                                 bboxes=meta.get("bboxes"))
+                else:
+                    result = {"ok": False, "detail": f"op không hỗ trợ: {op}"}
+        except Exception as e:
+            log.exception("lpr_server: lỗi xử lý op %s", op)
+            return encode_response({"ok": False, "detail": repr(e)})
+        return encode_response(result)
+
+class UnixServer(_ServerMixin, socketserver.ThreadingUnixStreamServer):
+    pass
+
+class TCPServer(_ServerMixin, socketserver.ThreadingTCPServer):
+    pass
+
+
+def make_server(address: str, concurrency: int = 1):
+    """Dựng server sidecar. Nạp model ngay để request đầu không phải chờ."""
+    family, sockaddr = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(sockaddr):
+            os.unlink(sockaddr)
+        server = UnixServer(sockaddr, _Handler)
+        os.chmod(sockaddr, 0o660)
+    else:
+        server = TCPServer(sockaddr, _Handler)
+    server.setup_engine(concurrency)
+    server.lpr._load_models()
+    return server
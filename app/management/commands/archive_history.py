@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.archive import _conf, archive_batch, archive_orphan_readings, default_cutoff
+
+
+class Command(BaseCommand):
+    help = "Chuyển phiên đã đóng (kèm reading/payment) cũ hơn N tháng sang bảng archive theo lô."
+
+    def add_arguments(self, parser):
+        conf = _conf()
+        parser.add_argument("--months", type=int, default=conf["MONTHS"])
+        parser.add_argument("--batch-size", type=int, default=conf["BATCH_SIZE"])
+        parser.add_argument("--export-dir", default=conf["EXPORT_DIR"],
+                            help="Ghi thêm bản jsonl.gz theo tháng vào thư mục này")
+        parser.add_argument("--max-batches", type=int, default=0, help="0 = chạy đến khi hết")
+        parser.add_argument("--sleep", type=float, default=0.0,
+                            help="Nghỉ giữa các lô (giây) để không chiếm I/O của giờ cao điểm")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **o):
+        cutoff = default_cutoff(o["months"])
+        if o["dry_run"]:
+            from app.models import ParkingSession, PlateReading
+            sessions = ParkingSession.objects.filter(status="closed", exit_time__lt=cutoff).count()
+            orphans = PlateReading.objects.filter(session__isnull=True, captured_at__lt=cutoff).count()
+            self.stdout.write(f"cutoff={cutoff:%Y-%m-%d} sessions={sessions} orphan_readings={orphans}")
+            return
+        total = batches = 0
+        t0 = time.perf_counter()
+        while not o["max_batches"] or batches < o["max_batches"]:
+            n = archive_batch(cutoff, o["batch_size"], o["export_dir"])
+            if not n:
+                break
+            total, batches = total + n, batches + 1
+            self.stdout.write(f"batch {batches}: {n} phiên")
+            if o["sleep"]:
+                time.sleep(o["sleep"])
+        orphans = 0
+        while n := archive_orphan_readings(cutoff, o["batch_size"]):
+            orphans += n
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã archive {total} phiên, {orphans} reading lẻ trước {cutoff:%Y-%m-%d} "
+            f"trong {time.perf_counter() - t0:.1f}s"))
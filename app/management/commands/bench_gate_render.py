@@ -0,0 +1,82 @@
+import json, statistics, time, uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, renderer_classes, parser_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+
+from app import gateproto
+from app.models import ParkingSession
+from app.serializers import ParkingSessionSerializer
+
+
+def _session():
+    now = timezone.now()
+    return ParkingSession(id=uuid.uuid4(), user_id=1, vehicle_id=uuid.uuid4(), entry_gate_id=uuid.uuid4(),
+                          exit_gate_id=uuid.uuid4(), entry_time=now, exit_time=now, entry_plate="51A12345",
+                          exit_plate="51A12345", status="closed", amount=Decimal("15000"),
+                          tariff_id=uuid.uuid4(), qrcode_id=uuid.uuid4(), reservation_id=None)
+
+
+class Command(BaseCommand):
+    help = "So sánh chi phí mỗi request của entry/exit: DRF mặc định (serializer + negotiation) và giao thức cổng gọn."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=5000)
+        parser.add_argument("--rounds", type=int, default=5)
+        parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+
+    def handle(self, *args, **o):
+        sess = _session()
+
+        @api_view(["POST"])
+        @permission_classes([AllowAny])
+        @authentication_classes([])
+        def drf_view(request):
+            request.data.get("qr")
+            return Response(ParkingSessionSerializer(sess).data, status=201)
+
+        @api_view(["POST"])
+        @permission_classes([AllowAny])
+        @authentication_classes([])
+        @renderer_classes(gateproto.GATE_RENDERERS)
+        @parser_classes(gateproto.GATE_PARSERS)
+        def gate_view(request):
+            request.data.get("qr")
+            return Response(gateproto.session_payload(sess), status=201)
+
+        factory = APIRequestFactory()
+        body = {"qr": "x" * 40, "plate_text": "51A12345", "gate": "G1"}
+        cases = {
+            "drf_json": (drf_view, "application/json", json.dumps(body).encode(), "application/json"),
+            "gate_json": (gate_view, "application/json", json.dumps(body).encode(), "application/json"),
+        }
+        if gateproto.msgpack is not None:
+            cases["gate_msgpack"] = (gate_view, "application/x-msgpack", gateproto.dumps_msgpack(body),
+                                     "application/x-msgpack")
+
+        results = {}
+        for name, (view, ctype, payload, accept) in cases.items():
+            make = lambda: factory.post("/parking/entry/", payload, content_type=ctype, HTTP_ACCEPT=accept)
+            resp = view(make()); resp.render()
+            rounds = []
+            for _ in range(o["rounds"]):
+                reqs = [make() for _ in range(o["requests"])]
+                t0 = time.perf_counter()
+                for req in reqs:
+                    view(req).render()
+                rounds.append((time.perf_counter() - t0) / o["requests"] * 1e6)
+            results[name] = {"us_per_request": round(statistics.median(rounds), 1),
+                             "us_min": round(min(rounds), 1), "response_bytes": len(resp.content)}
+
+        base = results["drf_json"]["us_per_request"]
+        for name, v in results.items():
+            v["speedup"] = round(base / v["us_per_request"], 2)
+            self.stdout.write(f"{name:13} {v['us_per_request']:8.1f} µs/req  x{v['speedup']:<5} {v['response_bytes']} B")
+        self.stdout.write(f"orjson: {'có' if gateproto.orjson else 'không'}, msgpack: {'có' if gateproto.msgpack else 'không'}")
+        if o["json"]:
+            with open(o["json"], "w") as f:
+                json.dump(results, f, indent=2)
@@ -0,0 +1,116 @@
+import json, multiprocessing as mp, os, statistics, threading, time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(p / 100 * len(xs)))] if xs else 0.0
+
+def _load_images(path):
+    if not path:
+        return [b""]
+    files = [f for f in sorted(Path(path).iterdir()) if f.suffix.lower() in (".jpg", ".jpeg", ".png")]
+    if not files:
+        raise CommandError(f"Không có ảnh trong {path}")
+    return [f.read_bytes() for f in files]
+
+def _worker(index, n_procs, threads, affinity, images_dir, n_requests, synthetic, barrier, out):
+    """1 process mô phỏng 1 web worker (mode inline): đặt thread budget rồi OCR tuần tự."""
+    import django
+    django.setup()
+    from app.inference import apply_budget, synthetic_workload
+    budget = apply_budget(n_procs=n_procs, index=index, threads=threads, affinity=affinity)
+    if synthetic:
+        run = synthetic_workload
+    else:
+        from app.lpr import recognize_plate_from_bytes as run, _load_models
+        _load_models()
+    images = _load_images(images_dir)
+    run(images[0])  # warm-up
+    barrier.wait()   # mọi worker bắt đầu cùng lúc để đo đúng tranh chấp CPU
+    lat = []
+    for i in range(n_requests):
+        t0 = time.perf_counter()
+        run(images[i % len(images)])
+        lat.append((time.perf_counter() - t0) * 1000)
+    out.put((index, budget, lat))
+
+
+class Command(BaseCommand):
+    help = ("Benchmark ma trận process x thread cho suy luận LPR: p50/p95 latency và throughput "
+            "của từng cấu hình (inline: N web worker; pool: N process suy luận).")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--matrix", default="1x0,2x0,4x0,2x1,4x1",
+                            help="Danh sách PROCSxTHREADS, THREADS=0 là tự chia theo core")
+        parser.add_argument("--mode", choices=["inline", "pool"], default="inline")
+        parser.add_argument("--requests", type=int, default=50, help="Số request mỗi process (inline) / tổng (pool)")
+        parser.add_argument("--concurrency", type=int, default=4, help="Số thread gửi request (mode pool)")
+        parser.add_argument("--images", help="Thư mục ảnh thật; bỏ trống thì dùng --synthetic")
+        parser.add_argument("--synthetic", action="store_true", help="Tải conv cỡ CRNN, không cần weights")
+        parser.add_argument("--affinity", action="store_true")
+        parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+
+    def handle(self, *args, **o):
+        if not o["images"] and not o["synthetic"]:
+            raise CommandError("Cần --images hoặc --synthetic")
+        results = []
+        for cell in o["matrix"].split(","):
+            procs, threads = (int(x) for x in cell.lower().split("x"))
+            lat, wall = self._run_pool(procs, threads, o) if o["mode"] == "pool" else self._run_inline(procs, threads, o)
+            row = {"procs": procs, "threads": threads, "requests": len(lat),
+                   "p50_ms": round(_pct(lat, 50), 1), "p95_ms": round(_pct(lat, 95), 1),
+                   "mean_ms": round(statistics.fmean(lat), 1) if lat else 0.0,
+                   "throughput_rps": round(len(lat) / wall, 2) if wall else 0.0}
+            results.append(row)
+            self.stdout.write(f"{procs:>3} x {threads:<3} p50={row['p50_ms']:8.1f}ms p95={row['p95_ms']:8.1f}ms "
+                              f"{row['throughput_rps']:8.2f} req/s")
+        if o["json"]:
+            Path(o["json"]).write_text(json.dumps({"mode": o["mode"], "cpus": os.cpu_count(),
+                                                   "results": results}, indent=2))
+
+    def _run_inline(self, procs, threads, o):
+        ctx = mp.get_context("spawn")
+        out, barrier = ctx.Queue(), ctx.Barrier(procs + 1)
+        ps = [ctx.Process(target=_worker, args=(i, procs, threads, o["affinity"], o["images"],
+                                                 o["requests"], o["synthetic"], barrier, out))
+              for i in range(procs)]
+        for p in ps:
+            p.start()
+        barrier.wait()
+        t0 = time.perf_counter()
+        lat = []
+        for _ in ps:
+            _, _, xs = out.get()
+            lat.extend(xs)
+        wall = time.perf_counter() - t0
+        for p in ps:
+            p.join()
+        return lat, wall
+
+    def _run_pool(self, procs, threads, o):
+        from app.inference import InferencePool, _conf
+        pool = InferencePool({**_conf(), "POOL_SIZE": procs, "TORCH_THREADS": threads,
+                              "AFFINITY": o["affinity"], "TIMEOUT": 120.0})
+        op = "synthetic" if o["synthetic"] else "plate"
+        images = _load_images(o["images"])
+        pool.run(op, images[0])  # đợi process nạp xong
+        lat, lock, counter = [], threading.Lock(), iter(range(o["requests"]))
+
+        def client():
+            for i in counter:
+                t0 = time.perf_counter()
+                pool.run(op, images[i % len(images)])
+                with lock:
+                    lat.append((time.perf_counter() - t0) * 1000)
+        ts = [threading.Thread(target=client) for _ in range(o["concurrency"])]
+        t0 = time.perf_counter()
+        for t in ts:
+            t.start()
+        for t in ts:
+            t.join()
+        wall = time.perf_counter() - t0
+        pool.close()
+        return lat, wall
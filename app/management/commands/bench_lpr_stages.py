@@ -0,0 +1,188 @@
+import json, math, os, platform, random, statistics, time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def synthetic_plates(n, seed=0):
+    """Ảnh giả lập: khung 1280x720 nền nhiễu + biển trắng chữ đen, trả về [(jpeg bytes, crop BGR, text)]."""
+    import cv2, numpy as np
+    rng = random.Random(seed)
+    nrng = np.random.default_rng(seed)
+    out = []
+    for _ in range(n):
+        text = f"{rng.randint(10, 99)}{rng.choice('ABCDEFGHKLMNPSTUVXYZ')}{rng.randint(1, 9)}{rng.randint(10000, 99999)}"
+        frame = nrng.integers(40, 120, (720, 1280, 3), dtype=np.uint8)
+        w, h = rng.randint(260, 360), rng.randint(70, 100)
+        x, y = rng.randint(100, 1280 - w - 100), rng.randint(200, 720 - h - 100)
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (235, 235, 235), -1)
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (20, 20, 20), 3)
+        cv2.putText(frame, text, (x + 12, y + int(h * 0.72)), cv2.FONT_HERSHEY_SIMPLEX, w / 330, (15, 15, 15), 3,
+                    cv2.LINE_AA)
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        out.append((buf.tobytes(), frame[y - 8:y + h + 8, x - 12:x + w + 12].copy(), text))
+    return out
+
+def load_fixtures(path):
+    """Thư mục ảnh thật: mỗi ảnh dùng làm cả frame (decode/detector) lẫn crop (CRNN) — tên file là nhãn biển số."""
+    import cv2, numpy as np
+    files = [f for f in sorted(Path(path).iterdir()) if f.suffix.lower() in (".jpg", ".jpeg", ".png")]
+    if not files:
+        raise CommandError(f"Không có ảnh trong {path}")
+    out = []
+    for f in files:
+        data = f.read_bytes()
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        out.append((data, img, f.stem))
+    return out
+
+
+def measure(fn, warmup, rounds, min_round_ms):
+    """Thời gian 1 lần gọi (µs): chạy thử, tự chọn số lần gọi mỗi round để round ≥ min_round_ms, lấy median các round."""
+    for _ in range(warmup):
+        fn()
+    t0 = time.perf_counter()
+    fn()
+    one = max(time.perf_counter() - t0, 1e-7)
+    iters = max(1, math.ceil(min_round_ms / 1000 / one))
+    per = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for _ in range(iters):
+            fn()
+        per.append((time.perf_counter() - t0) / iters * 1e6)
+    per.sort()
+    return {"us": round(statistics.median(per), 2), "us_min": round(per[0], 2),
+            "spread_pct": round((per[-1] - per[0]) / per[0] * 100, 1), "iters": iters, "rounds": rounds}
+
+
+class Command(BaseCommand):
+    help = ("Microbenchmark từng stage LPR trên CPU (decode ảnh, detector, tiền xử lý, CRNN, CTC decode, "
+            "chuẩn hoá biển số) theo batch size, với thread cố định; so sánh với baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=1, help="Số thread torch/OpenCV (cố định để số đo ổn định)")
+        parser.add_argument("--batch-sizes", default="1,2,4,8,16,32,64")
+        parser.add_argument("--stages", nargs="*", help="Chỉ chạy các stage này")
+        parser.add_argument("--images", help="Thư mục ảnh thật; bỏ trống thì sinh ảnh biển số giả lập")
+        parser.add_argument("--samples", type=int, default=64, help="Số ảnh giả lập")
+        parser.add_argument("--model", help="Phiên bản bundle model (mặc định con trỏ ACTIVE)")
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--rounds", type=int, default=7)
+        parser.add_argument("--min-round-ms", type=float, default=50.0)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+        parser.add_argument("--baseline", help="So sánh với file JSON của lần chạy trước")
+        parser.add_argument("--save-baseline", help="Ghi kết quả lần chạy này làm baseline")
+        parser.add_argument("--tolerance", type=float, default=0.10, help="Chậm hơn baseline quá tỉ lệ này → hồi quy")
+
+    def handle(self, *args, **o):
+        import cv2, numpy as np, torch
+        from app import lpr
+        from app.inference import apply_budget
+        from app.lprmodels import Bundle, active_version
+
+        apply_budget(n_procs=1, index=0, threads=o["threads"], affinity=False)
+        cv2.setNumThreads(o["threads"])
+        torch.manual_seed(o["seed"])
+        lpr._device = torch.device("cpu")  # số đo so sánh được giữa các máy: luôn CPU, kể cả khi có GPU
+        sizes = sorted({int(x) for x in o["batch_sizes"].split(",")})
+
+        samples = load_fixtures(o["images"]) if o["images"] else synthetic_plates(o["samples"], o["seed"])
+        frames = [s[0] for s in samples]
+        crops = [s[1] for s in samples]
+        texts = [s[2] for s in samples]
+        def pick(n):
+            return [crops[i % len(crops)] for i in range(n)]
+
+        version = o["model"] or active_version()
+        try:
+            bundle = Bundle.load(version, torch.device("cpu"))
+        except Exception as e:
+            bundle = None
+            self.stderr.write(f"Không nạp được bundle '{version}' ({e}) — bỏ qua stage cần model.")
+
+        skipped, stages = {}, {}
+        it = {"i": 0}
+        def cycle(seq):
+            it["i"] = (it["i"] + 1) % len(seq)
+            return seq[it["i"]]
+
+        stages["to_bgr"] = {1: lambda: lpr._to_bgr(cycle(frames))}
+        decoded = [lpr._to_bgr(f) for f in frames]
+        stages["force_plate_format"] = {1: lambda: lpr._force_plate_format(cycle(texts))}
+        stages["preprocess_for_crnn"] = {1: lambda: lpr._preprocess_for_crnn(cycle(crops))}
+        stages["preprocess_batch"] = {n: (lambda b=pick(n): lpr._preprocess_batch(b)) for n in sizes}
+        if bundle is not None:
+            # Detector 1 frame/lần như khi phục vụ; _best_plate_box dùng bundle đang phục vụ nên gọi qua _plate_boxes
+            stages["best_plate_box"] = {1: lambda: lpr._plate_boxes(cycle(decoded), conf=0.25, imgsz=1024,
+                                                                    max_plates=1, bundle=bundle)}
+            inputs = {n: lpr._preprocess_batch(pick(n)).clone() for n in sizes}
+            def forward(x):
+                with torch.no_grad():
+                    return bundle.crnn(x)
+            stages["crnn_forward"] = {n: (lambda x=inputs[n]: forward(x)) for n in sizes}
+            logps = {n: torch.log_softmax(forward(inputs[n]), dim=2) for n in sizes}
+        else:
+            skipped["best_plate_box"] = skipped["crnn_forward"] = "cần bundle model"
+            # logit ngẫu nhiên cùng kích thước đầu ra CRNN: T = IMG_W/4, C = charset + blank
+            logps = {n: torch.log_softmax(torch.randn(lpr.IMG_W // 4, n, 37), dim=2) for n in sizes}
+        stages["ctc_decode"] = {1: lambda: lpr._ctc_greedy_decode(logps[sizes[0]][:, :1])}
+        stages["ctc_decode_batch"] = {n: (lambda lp=logps[n]: lpr._ctc_greedy_decode_batch(lp)) for n in sizes}
+
+        wanted = o["stages"] or list(stages) + list(skipped)
+        unknown = set(wanted) - set(stages) - set(skipped)
+        if unknown:
+            raise CommandError(f"Stage không có: {', '.join(sorted(unknown))}")
+
+        results = {}
+        for name, by_batch in stages.items():
+            if name not in wanted:
+                continue
+            for n, fn in by_batch.items():
+                r = measure(fn, o["warmup"], o["rounds"], o["min_round_ms"])
+                r["us_per_item"] = round(r["us"] / n, 2)
+                results[f"{name}@{n}"] = r
+                self.stdout.write(f"{name:20} b={n:<3} {r['us']:12.1f} µs/call {r['us_per_item']:10.1f} µs/item "
+                                  f"±{r['spread_pct']:.1f}%")
+        for name, why in skipped.items():
+            if name in wanted:
+                self.stdout.write(f"{name:20} bỏ qua: {why}")
+
+        report = {"env": {"threads": o["threads"], "cpus": os.cpu_count(), "machine": platform.machine(),
+                          "python": platform.python_version(), "torch": torch.__version__, "opencv": cv2.__version__,
+                          "numpy": np.__version__, "model": bundle.version if bundle else None,
+                          "samples": "images" if o["images"] else f"synthetic:{o['samples']}:{o['seed']}"},
+                  "results": results, "skipped": skipped}
+        regressions = []
+        if o["baseline"]:
+            regressions = self._compare(report, json.loads(Path(o["baseline"]).read_text()), o["tolerance"])
+            report["regressions"] = regressions
+        if o["json"]:
+            Path(o["json"]).write_text(json.dumps(report, indent=2))
+        if o["save_baseline"]:
+            Path(o["save_baseline"]).write_text(json.dumps(report, indent=2))
+            self.stdout.write(f"Đã ghi baseline {o['save_baseline']}")
+        if regressions:
+            raise CommandError(f"{len(regressions)} stage chậm hơn baseline quá {o['tolerance']:.0%}")
+
+    def _compare(self, report, base, tolerance):
+        for k in ("threads", "torch", "opencv", "model", "samples"):
+            if base.get("env", {}).get(k) != report["env"][k]:
+                self.stdout.write(self.style.WARNING(
+                    f"baseline khác môi trường: {k} {base.get('env', {}).get(k)} → {report['env'][k]}"))
+        out = []
+        self.stdout.write(f"{'stage@batch':26}{'baseline µs':>14}{'hiện tại µs':>14}{'tỉ lệ':>9}")
+        for key, cur in report["results"].items():
+            old = base.get("results", {}).get(key)
+            if not old:
+                continue
+            ratio = cur["us"] / old["us"] if old["us"] else float("inf")
+            # chỉ tính hồi quy khi vượt cả dao động đo của 2 lần chạy
+            noise = max(cur["spread_pct"], old.get("spread_pct", 0)) / 100
+            slower = ratio > 1 + max(tolerance, noise)
+            style = self.style.ERROR if slower else self.style.SUCCESS if ratio < 1 - tolerance else str
+            self.stdout.write(style(f"{key:26}{old['us']:14.1f}{cur['us']:14.1f}{ratio:9.2f}x"))
+            if slower:
+                out.append(f"{key}: {old['us']} → {cur['us']} µs")
+        return out
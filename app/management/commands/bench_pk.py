@@ -0,0 +1,87 @@
+import json, time, uuid
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from app.fields import uuid7
+
+# Mô phỏng bảng PlateReading: PK + FK session (có index) + vài cột dữ liệu
+VARIANTS = {
+    "uuid4_char32": (lambda: uuid.uuid4().hex, "char(32)"),
+    "uuid7_char32": (lambda: uuid7().hex, "char(32)"),
+    "uuid7_binary16": (lambda: uuid7().bytes, "binary(16)"),
+}
+
+
+class Command(BaseCommand):
+    help = "So sánh throughput INSERT và kích thước index giữa uuid4 char(32) và uuid7 binary(16)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=200_000)
+        parser.add_argument("--batch", type=int, default=1000)
+        parser.add_argument("--database", default="default")
+        parser.add_argument("--variants", nargs="*", default=list(VARIANTS))
+        parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+
+    def _ddl(self, vendor, table, col_type):
+        if vendor != "mysql":
+            col_type = "blob" if "binary" in col_type else col_type
+        engine = " ENGINE=InnoDB" if vendor == "mysql" else ""
+        return [
+            f"CREATE TABLE {table} (id {col_type} NOT NULL PRIMARY KEY, session_id {col_type} NULL, "
+            f"plate_text varchar(20) NOT NULL, confidence double NOT NULL, captured_at datetime(6) NOT NULL){engine}",
+            f"CREATE INDEX {table}_session ON {table} (session_id)",
+        ]
+
+    def _sizes(self, conn, table):
+        with conn.cursor() as c:
+            if conn.vendor == "mysql":
+                c.execute(f"ANALYZE TABLE {table}")
+                c.fetchall()
+                c.execute("SELECT DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES "
+                          "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", [table])
+                data, index = c.fetchone()
+                return {"data_bytes": int(data), "index_bytes": int(index)}
+            if conn.vendor == "sqlite":
+                try:
+                    c.execute("SELECT name, SUM(pgsize) FROM dbstat WHERE name LIKE %s GROUP BY name", [f"%{table}%"])
+                    rows = dict(c.fetchall())
+                except Exception:
+                    return {}
+                index = sum(v for k, v in rows.items() if k != table)
+                return {"data_bytes": rows.get(table, 0), "index_bytes": index}
+        return {}
+
+    def handle(self, *args, **o):
+        conn = connections[o["database"]]
+        results = {}
+        for name in o["variants"]:
+            gen, col_type = VARIANTS[name]
+            table = f"bench_pk_{name}"
+            with conn.cursor() as c:
+                c.execute(f"DROP TABLE IF EXISTS {table}")
+                for stmt in self._ddl(conn.vendor, table, col_type):
+                    c.execute(stmt)
+            sessions = [gen() for _ in range(max(1, o["rows"] // 3))]
+            sql = (f"INSERT INTO {table} (id, session_id, plate_text, confidence, captured_at) "
+                   f"VALUES (%s, %s, %s, %s, %s)")
+            t0 = time.perf_counter()
+            done = 0
+            while done < o["rows"]:
+                n = min(o["batch"], o["rows"] - done)
+                batch = [(gen(), sessions[(done + i) // 3 % len(sessions)], "51A12345", 0.9, "2025-01-01 00:00:00")
+                         for i in range(n)]
+                with transaction.atomic(using=o["database"]), conn.cursor() as c:
+                    c.executemany(sql, batch)
+                done += n
+            elapsed = time.perf_counter() - t0
+            results[name] = {"rows": o["rows"], "seconds": round(elapsed, 3),
+                             "rows_per_sec": round(o["rows"] / elapsed, 1), **self._sizes(conn, table)}
+            with conn.cursor() as c:
+                c.execute(f"DROP TABLE {table}")
+            r = results[name]
+            self.stdout.write(f"{name:16} {r['rows_per_sec']:10.0f} rows/s  data={r.get('data_bytes', '-')}  "
+                              f"index={r.get('index_bytes', '-')}")
+        if o["json"]:
+            Path(o["json"]).write_text(json.dumps({"vendor": conn.vendor, "results": results}, indent=2))
@@ -0,0 +1,459 @@
+import json, math, random, re, statistics, time, uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test import Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from app.fields import uuid7
+from app.models import User, Vehicle, Gate, Tariff, Reservation, QRCode, ParkingSession, Payment, PlateReading
+
+PREFIX = "bs_"
+BIG = (ParkingSession, PlateReading, Reservation, Payment)
+PASSWORD = "bench-scale"
+MANY_QUERIES = 20
+
+
+def parse_scale(s):
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)([kKmM]?)", s)
+    if not m:
+        raise CommandError(f"scale không hợp lệ: {s} (vd. 10k, 1m, 250000)")
+    return int(float(m[1]) * {"": 1, "k": 1_000, "m": 1_000_000}[m[2].lower()])
+
+def label(n):
+    return f"{n // 1_000_000}m" if n % 1_000_000 == 0 else f"{n // 1000}k" if n % 1000 == 0 else str(n)
+
+
+# ===== Nạp dữ liệu =====
+def _insert(conn, model, names, rows):
+    """INSERT nhiều dòng bằng executemany (MySQLdb gộp thành 1 câu multi-row) — không qua model/signal."""
+    fields = [model._meta.get_field(n) for n in names]
+    cols = ", ".join(conn.ops.quote_name(f.column) for f in fields)
+    sql = (f"INSERT INTO {conn.ops.quote_name(model._meta.db_table)} ({cols}) "
+           f"VALUES ({', '.join(['%s'] * len(fields))})")
+    with conn.cursor() as c:
+        c.executemany(sql, [[f.get_db_prep_save(v, conn) for f, v in zip(fields, row)] for row in rows])
+
+
+class Dataset:
+    """Lịch sử giả lập: mỗi "dòng" = 1 reservation + 1 phiên đã đóng + 1 payment + 1 PlateReading.
+
+    User probe có đúng PROBE_ROWS dòng ở mọi scale: endpoint theo user mà chậm dần khi bảng lớn lên
+    nghĩa là truy vấn không đi theo index.
+    """
+    def __init__(self, conn, n_users, probe_rows, months, rng):
+        self.conn, self.n_users, self.probe_rows, self.rng = conn, n_users, probe_rows, rng
+        self.span = timedelta(days=30 * months)
+
+    def fixtures(self):
+        pwd = make_password(PASSWORD)
+        if not User.objects.filter(username=f"{PREFIX}probe").exists():
+            users = [User(username=f"{PREFIX}probe", full_name="Bench probe", password=pwd),
+                     User(username=f"{PREFIX}gate", full_name="Bench gate", password=pwd),
+                     User(username=f"{PREFIX}admin", full_name="Bench admin", password=pwd, is_staff=True)]
+            users += [User(username=f"{PREFIX}{i}", full_name=f"Bench {i}", password=pwd) for i in range(self.n_users)]
+            User.objects.bulk_create(users, batch_size=1000)
+            Token.objects.bulk_create([Token(user=u, key=Token.generate_key()) for u in users[:3]])
+            Vehicle.objects.bulk_create([Vehicle(owner=u, plate_number=self.plate()) for u in users], batch_size=1000)
+            # in/out: lịch sử giả lập; lane_in/lane_out: phiên do chính endpoint entry/exit tạo khi đo
+            Gate.objects.bulk_create([Gate(name=f"{PREFIX}{n}", type=t) for n, t in
+                                      (("in", "entry"), ("out", "exit"), ("lane_in", "entry"), ("lane_out", "exit"))])
+            if not Tariff.objects.exists():
+                Tariff.objects.create(name=f"{PREFIX}default", pricing_rule={"per_block": 10000, "block_minutes": 60})
+        self.gate_in = Gate.objects.get(name=f"{PREFIX}in")
+        self.gate_out = Gate.objects.get(name=f"{PREFIX}out")
+        self.lane_in = Gate.objects.get(name=f"{PREFIX}lane_in")
+        self.lane_out = Gate.objects.get(name=f"{PREFIX}lane_out")
+        self.tariff = Tariff.objects.first()
+        rows = Vehicle.objects.filter(owner__username__startswith=PREFIX) \
+                              .values_list("owner__username", "owner_id", "id", "plate_number")
+        self.owners = {name: (uid, vid, plate) for name, uid, vid, plate in rows}
+        self.pool = [v for k, v in self.owners.items() if k[len(PREFIX):].isdigit()]
+
+    def plate(self):
+        return f"{self.rng.randint(10, 99)}A{self.rng.randint(10000, 99999)}"
+
+    def count(self):
+        return ParkingSession.objects.filter(entry_gate=self.gate_in).count()
+
+    def grow(self, target, batch, log):
+        have = self.count()
+        if have > target:
+            raise CommandError(f"Đã có {have} dòng > scale {target}; chạy --cleanup trước")
+        now, t_start = timezone.now(), time.perf_counter()
+        with self._fast_load():
+            while have < target:
+                n = min(batch, target - have)
+                self._chunk(have, n, now)
+                have += n
+                rate = have / max(time.perf_counter() - t_start, 1e-9)
+                log(f"  {have:>11,}/{target:,} dòng  ({rate:,.0f} dòng/s)")
+        self._analyze()
+
+    def _chunk(self, offset, n, now):
+        rng, probe = self.rng, self.owners[f"{PREFIX}probe"]
+        res, sess, pay, reads = [], [], [], []
+        for i in range(offset, offset + n):
+            uid, vid, plate = probe if i < self.probe_rows else rng.choice(self.pool)
+            entry = now - self.span * rng.random() - timedelta(hours=1)
+            exit_ = entry + timedelta(minutes=rng.randint(5, 600))
+            amount = Decimal(10000 * (1 + (exit_ - entry).seconds // 3600))
+            rid, sid = uuid.uuid4(), uuid7()
+            res.append((rid, uid, rng.choice(("car", "motorbike")), entry - timedelta(minutes=10), exit_, int(amount),
+                        rng.choices(("completed", "cancelled", "expired"), (90, 6, 4))[0], entry - timedelta(days=1)))
+            sess.append((sid, uid, vid, self.gate_in.pk, self.gate_out.pk, entry, exit_, plate, plate, "closed",
+                         amount, self.tariff.pk, rid))
+            pay.append((uuid7(), sid, "CASH", amount, "VND", exit_, "paid", ""))
+            reads.append((uuid7(), self.gate_in.pk, "", plate, round(rng.uniform(0.6, 1.0), 3), entry, sid, False))
+        with transaction.atomic(using=self.conn.alias):
+            _insert(self.conn, Reservation, ("id", "user", "vehicle_type", "start_time", "end_time", "estimated_fee",
+                                             "status", "created_at"), res)
+            _insert(self.conn, ParkingSession, ("id", "user", "vehicle", "entry_gate", "exit_gate", "entry_time",
+                                                "exit_time", "entry_plate", "exit_plate", "status", "amount",
+                                                "tariff", "reservation"), sess)
+            _insert(self.conn, Payment, ("id", "session", "provider", "amount", "currency", "paid_at", "status",
+                                         "tx_ref"), pay)
+            _insert(self.conn, PlateReading, ("id", "gate", "image_path", "plate_text", "confidence", "captured_at",
+                                              "session", "needs_review"), reads)
+
+    @contextmanager
+    def _fast_load(self):
+        if self.conn.vendor != "mysql":
+            yield
+            return
+        with self.conn.cursor() as c:
+            c.execute("SET foreign_key_checks = 0, unique_checks = 0")
+        try:
+            yield
+        finally:
+            with self.conn.cursor() as c:
+                c.execute("SET foreign_key_checks = 1, unique_checks = 1")
+
+    def _analyze(self):
+        """Cập nhật thống kê để EXPLAIN phản ánh đúng kích thước bảng."""
+        with self.conn.cursor() as c:
+            for m in BIG:
+                if self.conn.vendor == "mysql":
+                    c.execute(f"ANALYZE TABLE {m._meta.db_table}")
+                    c.fetchall()
+                elif self.conn.vendor == "postgresql":
+                    c.execute(f"ANALYZE {m._meta.db_table}")
+            if self.conn.vendor == "sqlite":
+                c.execute("ANALYZE")
+
+
+def cleanup(conn):
+    users = User.objects.using(conn.alias).filter(username__startswith=PREFIX)
+    sess = ParkingSession.objects.using(conn.alias).filter(user__in=users)
+    # _raw_delete: không nạp hàng triệu object vào RAM như .delete()
+    for qs in (PlateReading.objects.using(conn.alias).filter(session__in=sess),
+               Payment.objects.using(conn.alias).filter(session__in=sess), sess,
+               QRCode.objects.using(conn.alias).filter(user__in=users),
+               Reservation.objects.using(conn.alias).filter(user__in=users)):
+        qs._raw_delete(conn.alias)
+    users.delete()
+    Gate.objects.using(conn.alias).filter(name__startswith=PREFIX).delete()
+    Tariff.objects.using(conn.alias).filter(name__startswith=PREFIX).delete()
+
+
+# ===== Endpoint =====
+class Ctx:
+    def __init__(self, ds):
+        self.ds, self.k = ds, 0
+        self.tokens = dict(Token.objects.filter(user__username__in=[f"{PREFIX}probe", f"{PREFIX}gate",
+                                                                    f"{PREFIX}admin"])
+                                        .values_list("user__username", "key"))
+        self.probe = User.objects.get(username=f"{PREFIX}probe")
+        self.gate_user = User.objects.get(username=f"{PREFIX}gate")
+        self.reservation = Reservation.objects.filter(user=self.probe).order_by("-start_time").first()
+        self.gate_qr, _ = QRCode.objects.get_or_create(user=self.gate_user, value=f"{PREFIX}gate-qr",
+                                                       defaults={"status": "active"})
+
+    def token(self, who):
+        return self.tokens[f"{PREFIX}{who}"]
+
+    def throwaway_token(self):
+        """logout / changePassword xoá token của user → mỗi lượt đo cấp token mới cho user riêng."""
+        u, _ = User.objects.get_or_create(username=f"{PREFIX}throwaway", defaults={
+            "full_name": "Bench throwaway", "password": make_password(PASSWORD)})
+        return Token.objects.get_or_create(user=u)[0].key
+
+    def close_gate_sessions(self):
+        ParkingSession.objects.filter(user=self.gate_user, status="open").update(status="closed")
+
+    def open_gate_session(self):
+        if not ParkingSession.objects.filter(user=self.gate_user, status="open").exists():
+            v = self.gate_user.vehicles.first()
+            ParkingSession.objects.create(user=self.gate_user, vehicle=v, entry_gate=self.ds.lane_in,
+                                          entry_plate=v.plate_number, tariff=self.ds.tariff, status="open",
+                                          qrcode=self.gate_qr)
+
+
+def _register(ctx):
+    return {"data": {"username": f"{PREFIX}reg{uuid.uuid4().hex[:10]}", "password": PASSWORD, "email": "bench@example.com",
+                     "full_name": "Bench reg"}}
+
+def _book(ctx):
+    ctx.k += 1
+    start = timezone.now() + timedelta(days=ctx.k, hours=1)
+    # đặt chỗ bằng user gate: lịch sử của probe phải giữ nguyên giữa các scale
+    return {"token": ctx.token("gate"), "data": {"vehicle_type": "car", "start_time": start.isoformat()}}
+
+def _entry(ctx):
+    ctx.close_gate_sessions()
+    plate = ctx.gate_user.vehicles.first().plate_number
+    return {"data": {"qr": ctx.gate_qr.value, "gate": ctx.ds.lane_in.name, "plate_text": plate}}
+
+def _exit(ctx):
+    ctx.open_gate_session()
+    plate = ctx.gate_user.vehicles.first().plate_number
+    return {"data": {"qr": ctx.gate_qr.value, "gate": ctx.ds.lane_out.name, "plate_text": plate}}
+
+def _profile_file(ctx):
+    from app.profiling import list_captures
+    caps = list_captures(limit=1)
+    return {"token": ctx.token("admin"), "path": f"/parking/admin/profiles/{caps[0]['name']}/"} if caps else None
+
+def _metrics(ctx):
+    token = getattr(settings, "METRICS", {}).get("TOKEN")
+    return {"headers": {"HTTP_AUTHORIZATION": f"Bearer {token}"} if token else {}}
+
+# name, method, path, chuẩn bị (ctx) → {token, data, path, headers}; None = bỏ qua ở lần chạy này
+ENDPOINTS = [
+    ("register", "post", "/auth/register/", _register),
+    ("login", "post", "/auth/login/", lambda ctx: {"data": {"username": f"{PREFIX}probe", "password": PASSWORD}}),
+    ("logout", "post", "/auth/logout/", lambda ctx: {"token": ctx.throwaway_token()}),
+    ("me", "get", "/auth/me/", lambda ctx: {"token": ctx.token("probe")}),
+    ("change_info", "patch", "/auth/changeInfo/", lambda ctx: {"token": ctx.token("probe"), "data": {"full_name": "Bench probe"}}),
+    ("change_password", "post", "/auth/changePassword/",
+     lambda ctx: {"token": ctx.throwaway_token(), "data": {"old_password": PASSWORD, "new_password": PASSWORD}}),
+    ("register_parking", "post", "/parking/register/", _book),
+    ("entry", "post", "/parking/entry/", _entry),
+    ("exit", "post", "/parking/exit/", _exit),
+    ("my_payments", "get", "/parking/payments/", lambda ctx: {"token": ctx.token("probe")}),
+    ("my_reservations", "get", "/parking/reservations/", lambda ctx: {"token": ctx.token("probe")}),
+    ("reservation_detail", "get", None, lambda ctx: {"token": ctx.token("probe"),
+                                                     "path": f"/parking/reservations/{ctx.reservation.pk}/"}),
+    ("stats_summary", "get", "/parking/admin/stats/", lambda ctx: {"token": ctx.token("admin")}),
+    ("profile_captures", "get", "/parking/admin/profiles/", lambda ctx: {"token": ctx.token("admin")}),
+    ("profile_capture_download", "get", None, _profile_file),
+    ("metrics", "get", "/metrics/", _metrics),
+    ("gates", "get", "/gates/", lambda ctx: {"token": ctx.token("admin")}),
+    ("gate_detail", "get", None, lambda ctx: {"token": ctx.token("admin"), "path": f"/gates/{ctx.ds.gate_in.pk}/"}),
+    ("tariffs", "get", "/tariffs/", lambda ctx: {"token": ctx.token("probe")}),
+    ("tariff_detail", "get", None, lambda ctx: {"token": ctx.token("probe"), "path": f"/tariffs/{ctx.ds.tariff.pk}/"}),
+]
+# parking/plates/ chỉ chạy LPR, không đọc bảng lịch sử — đo bằng bench_inference
+SKIPPED = {"detect_plates": "chỉ chạy LPR, không phụ thuộc kích thước bảng (xem bench_inference)"}
+
+
+class Statements:
+    """execute_wrapper: giữ SQL + params của request để EXPLAIN sau."""
+    def __init__(self):
+        self.items = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.items.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def explain(conn, sql, params):
+    """Kế hoạch thực thi + các bảng lớn bị quét toàn bộ."""
+    big = {m._meta.db_table for m in BIG}
+    with conn.cursor() as c:
+        if conn.vendor == "mysql":
+            c.execute("EXPLAIN " + sql, params)
+            cols = [d[0] for d in c.description]
+            rows = [dict(zip(cols, r)) for r in c.fetchall()]
+            plan = [f"{r['table']}: type={r['type']} key={r['key']} rows={r['rows']} {r.get('Extra') or ''}".strip()
+                    for r in rows]
+            scans = [r["table"] for r in rows if r["table"] in big and r["type"] in ("ALL", "index")]
+        elif conn.vendor == "sqlite":
+            c.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = [r[-1] for r in c.fetchall()]
+            scans = [t for d in plan for t in big if re.match(rf"SCAN (TABLE )?{t}\b", d)]
+        elif conn.vendor == "postgresql":
+            c.execute("EXPLAIN " + sql, params)
+            plan = [r[0] for r in c.fetchall()]
+            scans = [t for line in plan for t in big if f"Seq Scan on {t} " in line + " "]
+        else:
+            return [], []
+    return plan, sorted(set(scans))
+
+
+def _pct(sorted_vals, p):
+    k = min(len(sorted_vals) - 1, int(round(p / 100 * (len(sorted_vals) - 1))))
+    return sorted_vals[k]
+
+
+class Command(BaseCommand):
+    help = ("Đo latency / số query / EXPLAIN của mọi endpoint khi bảng lịch sử lớn dần (10k → 1m → 10m dòng), "
+            "đánh dấu endpoint tăng siêu tuyến tính hoặc quét toàn bảng, so với baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scales", nargs="+", default=["10k", "1m", "10m"])
+        parser.add_argument("--endpoints", nargs="*", help="Chỉ chạy các endpoint này (tên trong ENDPOINTS)")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument("--users", type=int, default=5000, help="Số user chia nhau phần lịch sử còn lại")
+        parser.add_argument("--probe-rows", type=int, default=50)
+        parser.add_argument("--months", type=int, default=24, help="Lịch sử trải đều trong ngần này tháng")
+        parser.add_argument("--batch", type=int, default=5000)
+        parser.add_argument("--database", default="default")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--baseline", help="So sánh với file baseline (JSON do --save-baseline ghi)")
+        parser.add_argument("--save-baseline", help="Ghi kết quả lần chạy này làm baseline")
+        parser.add_argument("--tolerance", type=float, default=0.25, help="Chậm hơn baseline quá tỉ lệ này → hồi quy")
+        parser.add_argument("--json", help="Ghi báo cáo đầy đủ (kèm EXPLAIN) ra file JSON")
+        parser.add_argument("--cleanup", action="store_true", help="Xoá dữ liệu bs_* rồi thoát")
+        parser.add_argument("--yes", action="store_true", help="Xác nhận ghi dữ liệu giả lập vào database")
+
+    def handle(self, *args, **o):
+        conn = connections[o["database"]]
+        if o["cleanup"]:
+            cleanup(conn)
+            self.stdout.write("Đã xoá dữ liệu bench_scaling.")
+            return
+        if not o["yes"]:
+            raise CommandError(f"Lệnh này ghi tới hàng chục triệu dòng vào database '{conn.settings_dict['NAME']}'. "
+                               "Chạy trên DB riêng cho benchmark và thêm --yes.")
+        if o["database"] != "default":
+            raise CommandError("View luôn dùng DB default — trỏ DATABASES['default'] vào DB benchmark.")
+        scales = sorted({parse_scale(s) for s in o["scales"]})
+        names = [e[0] for e in ENDPOINTS]
+        wanted = o["endpoints"] or names
+        unknown = set(wanted) - set(names)
+        if unknown:
+            raise CommandError(f"Endpoint không có: {', '.join(sorted(unknown))}")
+
+        ds = Dataset(conn, o["users"], o["probe_rows"], o["months"], random.Random(o["seed"]))
+        ds.fixtures()
+        results = {}
+        for n in scales:
+            self.stdout.write(f"== scale {label(n)} ==")
+            ds.grow(n, o["batch"], self.stdout.write)
+            ctx = Ctx(ds)
+            for name, method, path, prepare in ENDPOINTS:
+                if name in wanted:
+                    results.setdefault(name, {})[label(n)] = self._measure(conn, ctx, method, path, prepare, o)
+
+        report = {"vendor": conn.vendor, "scales": [label(n) for n in scales], "skipped": SKIPPED,
+                  "endpoints": results, "flags": self._flags(results, scales)}
+        self._print(report)
+        regressions = []
+        if o["baseline"]:
+            regressions = self._compare(report, json.loads(Path(o["baseline"]).read_text()), o["tolerance"])
+            report["regressions"] = regressions
+        if o["json"]:
+            Path(o["json"]).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+        if o["save_baseline"]:
+            Path(o["save_baseline"]).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+            self.stdout.write(f"Đã ghi baseline {o['save_baseline']}")
+        if regressions:
+            raise CommandError(f"{len(regressions)} hồi quy so với baseline")
+
+    def _measure(self, conn, ctx, method, path, prepare, o):
+        client = Client()
+        times, codes, stmts = [], {}, None
+        for i in range(o["warmup"] + o["repeat"]):
+            spec = prepare(ctx)
+            if spec is None:
+                return {"skipped": "không có dữ liệu cho endpoint này"}
+            headers = dict(spec.get("headers") or {})
+            if spec.get("token"):
+                headers["HTTP_AUTHORIZATION"] = f"Token {spec['token']}"
+            data = spec.get("data")
+            kwargs = {"data": json.dumps(data), "content_type": "application/json"} if data is not None \
+                and method != "get" else {}
+            rec = Statements()
+            with conn.execute_wrapper(rec):
+                t0 = time.perf_counter()
+                resp = getattr(client, method)(spec.get("path") or path, **kwargs, **headers)
+                dt = (time.perf_counter() - t0) * 1000
+            if i >= o["warmup"]:
+                times.append(dt)
+                codes[resp.status_code] = codes.get(resp.status_code, 0) + 1
+                stmts = rec.items
+        times.sort()
+        plans, scans, seen = [], set(), set()
+        for sql, params in stmts:
+            if not sql.lstrip().upper().startswith("SELECT") or sql in seen:
+                continue
+            seen.add(sql)
+            try:
+                plan, s = explain(conn, sql, params)
+            except Exception as e:
+                plan, s = [f"EXPLAIN lỗi: {e}"], []
+            plans.append({"sql": sql, "plan": plan, "full_scans": s})
+            scans.update(s)
+        return {"p50_ms": round(statistics.median(times), 2), "p95_ms": round(_pct(times, 95), 2),
+                "queries": len(stmts), "codes": codes, "full_scans": sorted(scans), "explain": plans}
+
+    def _flags(self, results, scales):
+        """Số mũ tăng trưởng k giữa 2 scale liền nhau (t ~ n^k): k > 1.1 siêu tuyến tính, k > 0.3 vẫn phụ thuộc kích thước bảng."""
+        flags = {}
+        for name, by_scale in results.items():
+            out = []
+            for a, b in zip(scales, scales[1:]):
+                ra, rb = by_scale.get(label(a), {}), by_scale.get(label(b), {})
+                if "p50_ms" not in ra or "p50_ms" not in rb:
+                    continue
+                ta, tb = max(ra["p50_ms"], 0.01), max(rb["p50_ms"], 0.01)
+                k = math.log(tb / ta) / math.log(b / a)
+                step = f"{label(a)}→{label(b)}"
+                if k > 1.1 and tb - ta > 1:
+                    out.append(f"siêu tuyến tính {step} (k={k:.2f})")
+                elif k > 0.3 and tb - ta > 2:
+                    out.append(f"tăng theo kích thước bảng {step} (k={k:.2f})")
+                if rb["queries"] > ra["queries"]:
+                    out.append(f"số query tăng {ra['queries']}→{rb['queries']} ({step})")
+            last = by_scale.get(label(scales[-1]), {})
+            if last.get("queries", 0) > MANY_QUERIES:
+                out.append(f"{last['queries']} query/request — nghi N+1")
+            if last.get("full_scans"):
+                out.append("quét toàn bảng: " + ", ".join(last["full_scans"]))
+            if out:
+                flags[name] = out
+        return flags
+
+    def _compare(self, report, base, tolerance):
+        out = []
+        for name, by_scale in report["endpoints"].items():
+            for scale, cur in by_scale.items():
+                old = base.get("endpoints", {}).get(name, {}).get(scale)
+                if not old or "p50_ms" not in old or "p50_ms" not in cur:
+                    continue
+                if cur["p50_ms"] > old["p50_ms"] * (1 + tolerance) and cur["p50_ms"] - old["p50_ms"] > 1:
+                    out.append(f"{name}@{scale}: p50 {old['p50_ms']} → {cur['p50_ms']} ms")
+                if cur["queries"] > old["queries"]:
+                    out.append(f"{name}@{scale}: queries {old['queries']} → {cur['queries']}")
+                new_scans = set(cur["full_scans"]) - set(old.get("full_scans", []))
+                if new_scans:
+                    out.append(f"{name}@{scale}: quét toàn bảng mới {', '.join(sorted(new_scans))}")
+        for line in out:
+            self.stdout.write(self.style.ERROR(f"HỒI QUY {line}"))
+        if not out:
+            self.stdout.write(self.style.SUCCESS("Không có hồi quy so với baseline."))
+        return out
+
+    def _print(self, report):
+        scales = report["scales"]
+        self.stdout.write(f"{'endpoint':26}" + "".join(f"{s:>18}" for s in scales) + "   (p50 ms / queries)")
+        for name, by_scale in report["endpoints"].items():
+            cells = []
+            for s in scales:
+                r = by_scale.get(s, {})
+                cells.append(f"{r['p50_ms']:>10.2f} / {r['queries']:<3}" if "p50_ms" in r else f"{'-':>16}")
+            self.stdout.write(f"{name:26}" + "".join(f"{c:>18}" for c in cells))
+        for name, why in report["skipped"].items():
+            self.stdout.write(f"{name:26} bỏ qua: {why}")
+        for name, lines in report["flags"].items():
+            for line in lines:
+                self.stdout.write(self.style.WARNING(f"! {name}: {line}"))
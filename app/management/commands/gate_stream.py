@@ -0,0 +1,70 @@
+import json, threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from app.inference import apply_budget
+from app.models import Gate
+from app.stream import GateStream, _conf, read_frames, record_event, resolve_source
+
+
+class Command(BaseCommand):
+    help = ("Đọc video của gate (Gate.device_camera_id: RTSP/MJPEG/file), chỉ chạy detector khi có chuyển động, "
+            "theo dõi biển số qua các khung và ghi 1 sự kiện biển số cho mỗi xe.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("gates", nargs="+", help="Tên gate")
+        parser.add_argument("--source", help="Ghi đè nguồn video (chỉ khi chạy 1 gate)")
+        parser.add_argument("--max-frames", type=int, default=0)
+        parser.add_argument("--realtime", action="store_true", help="File: phát theo FPS gốc thay vì nhanh nhất có thể")
+        parser.add_argument("--no-emit", action="store_true", help="Chỉ đo, không ghi PlateReading/event")
+        parser.add_argument("--json", help="Ghi số liệu (fps/core, OCR mỗi xe...) ra file JSON")
+
+    def handle(self, *args, **o):
+        if o["source"] and len(o["gates"]) > 1:
+            raise CommandError("--source chỉ dùng với 1 gate")
+        conf = _conf()
+        apply_budget(n_procs=1, index=0)
+        jobs = []
+        for name in o["gates"]:
+            gate = Gate.objects.filter(name__iexact=name).first()
+            if gate is None:
+                raise CommandError(f"Không có gate {name}")
+            source = o["source"] or resolve_source(gate, conf)
+            if not source:
+                raise CommandError(f"Gate {gate.name} chưa có device_camera_id")
+            jobs.append(GateStream(gate, source, self._emitter(gate, o["no_emit"]), conf))
+
+        def run(job):
+            network = "://" in job.source
+            frames = read_frames(job.source, realtime=o["realtime"],
+                                 reconnect=conf["RECONNECT"] if network else None, max_frames=o["max_frames"] or None)
+            job.process(frames)
+
+        threads = [threading.Thread(target=run, args=(j,), name=f"stream-{j.gate.name}", daemon=True) for j in jobs]
+        for t in threads:
+            t.start()
+        try:
+            for t in threads:
+                t.join()
+        except KeyboardInterrupt:
+            pass
+        report = {j.gate.name: j.report() for j in jobs}
+        for name, r in report.items():
+            self.stdout.write(f"{name}: {r['frames']} khung, {r['fps_per_core']} fps/core, "
+                              f"detector {r['detector_calls']} lần ({r['detector_ratio']}), "
+                              f"{r['events']} xe, {r['ocr_per_vehicle']} OCR/xe")
+        if o["json"]:
+            with open(o["json"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    def _emitter(self, gate, dry):
+        def on_event(track, text, conf):
+            self.stdout.write(f"[{gate.name}] xe #{track.id}: {text} ({conf:.2f}) — "
+                              f"{track.hits} lần thấy, {len(track.reads)} lần OCR")
+            if dry:
+                return
+            close_old_connections()
+            record_event(gate, text, conf, crop=track.best[1] if track.best else None,
+                         track_id=track.id, ocr_calls=len(track.reads))
+        return on_event
@@ -0,0 +1,246 @@
+import json, random, threading, time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, transaction
+from django.test import Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from app.models import User, Vehicle, Gate, Tariff, Reservation, QRCode
+
+PREFIX = "lt_"
+
+
+def _pct(sorted_vals, p):
+    if not sorted_vals:
+        return 0.0
+    k = min(len(sorted_vals) - 1, int(round(p / 100 * (len(sorted_vals) - 1))))
+    return sorted_vals[k]
+
+
+class Recorder:
+    def __init__(self):
+        self.lat = defaultdict(list)
+        self.codes = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, ms, code):
+        with self._lock:
+            self.lat[endpoint].append(ms)
+            self.codes[endpoint][code] += 1
+
+    def report(self, elapsed):
+        out = {}
+        for ep, vals in sorted(self.lat.items()):
+            v = sorted(vals)
+            out[ep] = {
+                "count": len(v),
+                "rps": round(len(v) / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": round(_pct(v, 50), 2), "p90_ms": round(_pct(v, 90), 2),
+                "p99_ms": round(_pct(v, 99), 2), "max_ms": round(v[-1], 2),
+                "codes": dict(self.codes[ep]),
+            }
+        return out
+
+
+class Command(BaseCommand):
+    help = "Seed dữ liệu giả lập và phát lại lưu lượng entry/exit/booking để đo throughput & latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=500)
+        parser.add_argument("--gates", type=int, default=4, help="Số cặp cổng entry/exit")
+        parser.add_argument("--seed-only", action="store_true")
+        parser.add_argument("--no-seed", action="store_true", help="Dùng dữ liệu đã seed trước đó")
+        parser.add_argument("--cleanup", action="store_true", help="Xoá dữ liệu lt_* rồi thoát")
+        parser.add_argument("--duration", type=float, default=30.0, help="Thời gian phát lại (giây)")
+        parser.add_argument("--entry-rate", type=float, default=5.0, help="Lượt vào / giây")
+        parser.add_argument("--exit-rate", type=float, default=5.0, help="Lượt ra / giây")
+        parser.add_argument("--booking-rate", type=float, default=1.0, help="Lượt đặt chỗ / giây")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--images", help="Thư mục ảnh mẫu để upload kèm entry/exit")
+        parser.add_argument("--stub-lpr", action="store_true", help="Thay LPR bằng stub để đo riêng chi phí DB")
+        parser.add_argument("--stub-latency-ms", type=float, default=0.0)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--json", help="Ghi báo cáo ra file JSON")
+
+    # ===== Seed =====
+    def _cleanup(self):
+        users = User.objects.filter(username__startswith=PREFIX)
+        from app.models import ParkingSession, PlateReading, Payment
+        sess = ParkingSession.objects.filter(user__in=users)
+        PlateReading.objects.filter(session__in=sess).delete()
+        Payment.objects.filter(session__in=sess).delete()
+        sess.delete()
+        users.delete()
+        Gate.objects.filter(name__startswith=PREFIX).delete()
+        Tariff.objects.filter(name__startswith=PREFIX).delete()
+
+    @transaction.atomic
+    def _seed(self, n_users, n_gates, rng):
+        pwd = make_password("loadtest")
+        users = [User(username=f"{PREFIX}{i}", full_name=f"Load {i}", password=pwd) for i in range(n_users)]
+        User.objects.bulk_create(users, batch_size=1000)
+        Token.objects.bulk_create([Token(user=u, key=Token.generate_key()) for u in users], batch_size=1000)
+        Vehicle.objects.bulk_create(
+            [Vehicle(owner=u, plate_number=f"{rng.randint(10, 99)}A{rng.randint(10000, 99999)}") for u in users],
+            batch_size=1000,
+        )
+        gates = []
+        for i in range(n_gates):
+            gates += [Gate(name=f"{PREFIX}in{i}", type="entry"), Gate(name=f"{PREFIX}out{i}", type="exit")]
+        Gate.objects.bulk_create(gates)
+        if not Tariff.objects.exists():
+            Tariff.objects.create(name=f"{PREFIX}default", pricing_rule={"per_block": 10000, "block_minutes": 60})
+
+        now = timezone.now()
+        start = now + timedelta(minutes=5)
+        res = [Reservation(user=u, vehicle_type="car", start_time=start, end_time=start + timedelta(hours=12),
+                           estimated_fee=0, status="booked") for u in users]
+        Reservation.objects.bulk_create(res, batch_size=1000)
+        QRCode.objects.bulk_create(
+            [QRCode(user=u, reservation=r, value=f"{PREFIX}{u.pk.hex}", status="active",
+                    expired_at=r.end_time + timedelta(minutes=30)) for u, r in zip(users, res)],
+            batch_size=1000,
+        )
+
+    def _load_pool(self):
+        rows = QRCode.objects.filter(user__username__startswith=PREFIX, status="active") \
+                             .values_list("value", "user__auth_token__key", "user__vehicles__plate_number")
+        return [{"qr": v, "token": t, "plate": p} for v, t, p in rows]
+
+    # ===== Replay =====
+    def _stub_lpr(self, latency_ms):
+        import app.deferred as deferred
+
+        def fake(image_bytes, lanes=None, lane=None, quality=None):
+            if latency_ms:
+                time.sleep(latency_ms / 1000)
+            return {"ok": True, "text": "51A12345", "det_conf": 1.0, "ocr_conf": 1.0, "n_chars": 8, "bbox": (0, 0, 1, 1), "lane": lane}
+        deferred.recognize_plate_from_bytes = fake
+        deferred.recognize_plate_from_crops = lambda crops, bboxes=None: fake(b"")
+
+    def handle(self, *args, **o):
+        rng = random.Random(o["seed"])
+        if o["cleanup"]:
+            self._cleanup()
+            self.stdout.write("Đã xoá dữ liệu loadtest.")
+            return
+        if not o["no_seed"]:
+            t0 = time.perf_counter()
+            self._cleanup()
+            self._seed(o["users"], o["gates"], rng)
+            self.stdout.write(f"Seed {o['users']} users / {o['gates']} cặp cổng trong {time.perf_counter() - t0:.1f}s")
+        if o["seed_only"]:
+            return
+        if o["stub_lpr"]:
+            self._stub_lpr(o["stub_latency_ms"])
+
+        images = []
+        if o["images"]:
+            images = [p.read_bytes() for p in sorted(Path(o["images"]).iterdir())
+                      if p.suffix.lower() in (".jpg", ".jpeg", ".png")]
+
+        pool = self._load_pool()
+        entry_gates = list(Gate.objects.filter(name__startswith=PREFIX, type="entry").values_list("name", flat=True))
+        exit_gates = list(Gate.objects.filter(name__startswith=PREFIX, type="exit").values_list("name", flat=True))
+        outside, inside = list(pool), []
+        state_lock = threading.Lock()
+        rec = Recorder()
+        local = threading.local()
+
+        def client():
+            if not hasattr(local, "c"):
+                local.c = Client()
+            return local.c
+
+        def call(endpoint, path, data, scheduled, token=None, multipart=False):
+            # độ trễ tính từ thời điểm request lẽ ra được gửi (next_t), không phải lúc thread rảnh để gửi:
+            # khi server chậm, thời gian chờ trong hàng đợi của chính loadtest cũng là độ trễ client thấy
+            close_old_connections()
+            extra = {"HTTP_AUTHORIZATION": f"Token {token}"} if token else {}
+            try:
+                if multipart:
+                    r = client().post(path, data, **extra)
+                else:
+                    r = client().post(path, data, content_type="application/json", **extra)
+                code = r.status_code
+            except Exception as e:
+                code = type(e).__name__
+            rec.add(endpoint, (time.perf_counter() - scheduled) * 1000, code)
+            return code
+
+        def with_image(data):
+            if images:
+                from django.core.files.uploadedfile import SimpleUploadedFile
+                data = {**data, "image": SimpleUploadedFile("frame.jpg", rng.choice(images), "image/jpeg")}
+                data.pop("plate_text", None)
+            return data
+
+        def do_entry(scheduled):
+            with state_lock:
+                if not outside:
+                    return
+                u = outside.pop(rng.randrange(len(outside)))
+            code = call("entry", "/parking/entry/",
+                        with_image({"qr": u["qr"], "gate": rng.choice(entry_gates), "plate_text": u["plate"]}),
+                        scheduled, multipart=True)
+            with state_lock:
+                (inside if code == 201 else outside).append(u)
+
+        def do_exit(scheduled):
+            with state_lock:
+                if not inside:
+                    return
+                u = inside.pop(rng.randrange(len(inside)))
+            code = call("exit", "/parking/exit/",
+                        with_image({"qr": u["qr"], "gate": rng.choice(exit_gates), "plate_text": u["plate"]}),
+                        scheduled, multipart=True)
+            with state_lock:
+                (outside if code == 200 else inside).append(u)
+
+        def do_booking(scheduled):
+            u = rng.choice(pool)
+            start = timezone.now() + timedelta(minutes=rng.randint(10, 600))
+            call("register_parking", "/parking/register/",
+                 json.dumps({"vehicle_type": rng.choice(["car", "motorbike"]), "start_time": start.isoformat()}),
+                 scheduled, token=u["token"])
+
+        kinds = [(do_entry, o["entry_rate"]), (do_exit, o["exit_rate"]), (do_booking, o["booking_rate"])]
+        total_rate = sum(r for _, r in kinds)
+        if total_rate <= 0:
+            self.stderr.write("Tổng arrival rate phải > 0")
+            return
+
+        self.stdout.write(f"Phát lại {o['duration']}s, {total_rate:g} req/s, concurrency={o['concurrency']}")
+        t_start = time.perf_counter()
+        next_t = t_start
+        with ThreadPoolExecutor(max_workers=o["concurrency"]) as ex:
+            while next_t - t_start < o["duration"]:
+                next_t += rng.expovariate(total_rate)
+                delay = next_t - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                x = rng.random() * total_rate
+                for fn, rate in kinds:
+                    if x < rate:
+                        ex.submit(fn, next_t)
+                        break
+                    x -= rate
+        elapsed = time.perf_counter() - t_start
+
+        report = rec.report(elapsed)
+        for ep, r in report.items():
+            self.stdout.write(
+                f"{ep:18} n={r['count']:6} {r['rps']:8.1f} req/s  p50={r['p50_ms']:8.1f}  "
+                f"p90={r['p90_ms']:8.1f}  p99={r['p99_ms']:8.1f}  max={r['max_ms']:8.1f} ms  codes={r['codes']}"
+            )
+        if o["json"]:
+            Path(o["json"]).write_text(json.dumps({"elapsed_s": elapsed, "args": {
+                k: o[k] for k in ("users", "gates", "duration", "entry_rate", "exit_rate",
+                                  "booking_rate", "concurrency", "stub_lpr", "stub_latency_ms")
+            }, "endpoints": report}, indent=2))
@@ -0,0 +1,83 @@
+import json, statistics
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import lprmodels
+
+
+def _pct(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Command(BaseCommand):
+    help = ("Quản lý bundle model LPR: list | activate <version> | shadow <version|off> | report [version]. "
+            "Mọi process tự nhận thay đổi sau CHECK_INTERVAL giây, không cần restart.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["list", "activate", "shadow", "report"])
+        parser.add_argument("version", nargs="?")
+        parser.add_argument("--last", type=int, default=0, help="report: chỉ xét N mẫu cuối")
+
+    def handle(self, *args, **o):
+        getattr(self, "_" + o["action"])(o["version"], o)
+
+    def _list(self, version, o):
+        active, shadow = lprmodels.active_version(), lprmodels.shadow_version()
+        for v in lprmodels.list_versions():
+            files, meta = lprmodels.bundle_files(v)
+            mark = "*" if v == active else ("s" if v == shadow else " ")
+            self.stdout.write(f"{mark} {v:20} {files['det'].parent}  {meta.get('note', '')}")
+        if active not in lprmodels.list_versions():
+            self.stdout.write(self.style.WARNING(f"ACTIVE = {active} nhưng không có bundle tương ứng"))
+
+    def _activate(self, version, o):
+        if not version:
+            raise CommandError("Cần tên version")
+        try:
+            lprmodels.set_pointer("ACTIVE", version)
+        except FileNotFoundError as e:
+            raise CommandError(str(e))
+        if lprmodels.shadow_version() == version:
+            lprmodels.set_pointer("SHADOW", None)
+        self.stdout.write(self.style.SUCCESS(f"ACTIVE → {version}"))
+
+    def _shadow(self, version, o):
+        if not version:
+            raise CommandError("Cần tên version hoặc 'off'")
+        try:
+            lprmodels.set_pointer("SHADOW", None if version == "off" else version)
+        except FileNotFoundError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"SHADOW → {version}"))
+
+    def _report(self, version, o):
+        version = version or lprmodels.shadow_version()
+        if not version:
+            raise CommandError("Chưa có model shadow — truyền tên version")
+        path = lprmodels.shadow_log_path(version)
+        if not path.exists():
+            raise CommandError(f"Chưa có mẫu nào ({path})")
+        rows = [json.loads(line) for line in path.read_text().splitlines() if line.strip()]
+        if o["last"]:
+            rows = rows[-o["last"]:]
+        n = len(rows)
+        both = [r for r in rows if r["serving_text"] and r["shadow_text"]]
+        report = {
+            "version": version, "samples": n,
+            "agreement": round(sum(r["agree"] for r in rows) / n, 4) if n else None,
+            "serving_only": sum(1 for r in rows if r["serving_text"] and not r["shadow_text"]),
+            "shadow_only": sum(1 for r in rows if r["shadow_text"] and not r["serving_text"]),
+            "mean_conf": {
+                "serving": round(statistics.fmean(r["serving_conf"] for r in both), 4) if both else None,
+                "shadow": round(statistics.fmean(r["shadow_conf"] for r in both), 4) if both else None,
+            },
+            "latency_ms": {
+                who: {"p50": _pct([r[f"{who}_ms"] for r in rows], 0.5), "p95": _pct([r[f"{who}_ms"] for r in rows], 0.95)}
+                for who in ("serving", "shadow")
+            },
+            "serving_versions": sorted({r["serving"] for r in rows}),
+        }
+        self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
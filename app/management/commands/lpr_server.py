@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.inference import apply_budget
+from app.lprserver import make_server
+
+
+class Command(BaseCommand):
+    help = "Chạy LPR như 1 service riêng (Unix socket/TCP localhost) cho web worker dùng INFERENCE MODE=sidecar."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--address", default=settings.INFERENCE.get("SIDECAR_ADDRESS", "unix:/tmp/lpr.sock"),
+                            help='"unix:/run/lpr.sock" hoặc "tcp:127.0.0.1:8765"')
+        parser.add_argument("--concurrency", type=int, default=1, help="Số ảnh suy luận đồng thời")
+        parser.add_argument("--threads", type=int, default=0, help="Thread torch, 0 = toàn bộ core")
+        parser.add_argument("--affinity", action="store_true")
+
+    def handle(self, *args, **o):
+        budget = apply_budget(n_procs=1, index=0, threads=o["threads"], affinity=o["affinity"])
+        server = make_server(o["address"], o["concurrency"])
+        self.stdout.write(f"lpr_server lắng nghe {o['address']} (torch_threads={budget['torch_threads']})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
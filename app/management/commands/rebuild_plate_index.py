@@ -0,0 +1,27 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from app.platesearch import SOURCES, index_objects
+
+
+class Command(BaseCommand):
+    help = "Dựng lại chỉ mục trigram biển số (PlateGram) cho dữ liệu đã có, theo lô."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kinds", nargs="*", default=list(SOURCES), choices=list(SOURCES))
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **o):
+        for kind in o["kinds"]:
+            label, fields = SOURCES[kind]
+            model = apps.get_model(label)
+            qs = model.objects.only("pk", *fields).order_by("pk")
+            last, objs, rows = None, 0, 0
+            while True:
+                page = list((qs.filter(pk__gt=last) if last is not None else qs)[:o["batch_size"]])
+                if not page:
+                    break
+                rows += index_objects(kind, page)
+                objs += len(page)
+                last = page[-1].pk
+            self.stdout.write(f"{kind:8} {objs} object, {rows} trigram")
@@ -0,0 +1,282 @@
+from __future__ import annotations
+import atexit, json, os, threading, time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .profiling import stage as profile_stage
+
+DEFAULTS = {
+    "ENABLED": True,
+    "VIEWS": ["entry", "exit", "register_parking", "stats_summary"],
+    "MULTIPROC_DIR": None,    # gunicorn nhiều worker: mỗi process ghi snapshot vào thư mục này
+    "FLUSH_INTERVAL": 2.0,
+    "TOKEN": None,            # nếu đặt, /metrics/ yêu cầu header "Authorization: Bearer <TOKEN>"
+}
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "METRICS", {})}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Metric:
+    def __init__(self, name, doc, kind, labelnames=(), buckets=None):
+        self.name, self.doc, self.kind = name, doc, kind
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) if buckets else None
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def inc(self, amount=1.0, **labels):
+        k = self._key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0.0) + amount
+
+    def set(self, value, **labels):
+        k = self._key(labels)
+        with self._lock:
+            self._values[k] = float(value)
+
+    def observe(self, value, **labels):
+        k = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            v = self._values.get(k)
+            if v is None:
+                v = self._values[k] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            v[i] += 1
+            v[-2] += value
+            v[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            vals = [[list(k), (list(v) if isinstance(v, list) else v)] for k, v in self._values.items()]
+        return {"kind": self.kind, "doc": self.doc, "labelnames": list(self.labelnames),
+                "buckets": list(self.buckets) if self.buckets else None, "values": vals}
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def _add(self, name, doc, kind, labelnames=(), buckets=None):
+        with self._lock:
+            m = self.metrics.get(name)
+            if m is None:
+                m = self.metrics[name] = _Metric(name, doc, kind, labelnames, buckets)
+            return m
+
+    def counter(self, name, doc, labelnames=()):
+        return self._add(name, doc, "counter", labelnames)
+
+    def gauge(self, name, doc, labelnames=()):
+        return self._add(name, doc, "gauge", labelnames)
+
+    def histogram(self, name, doc, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(name, doc, "histogram", labelnames, buckets)
+
+    def register_collector(self, fn):
+        """fn() được gọi trước mỗi lần xuất/flush để cập nhật gauge (độ dài hàng đợi, ...)."""
+        self.collectors.append(fn)
+
+    def snapshot(self):
+        for fn in list(self.collectors):
+            try:
+                fn()
+            except Exception:
+                pass
+        return {name: m.snapshot() for name, m in list(self.metrics.items())}
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.histogram("http_request_duration_seconds", "Latency per view", ("view", "method", "status"))
+DB_QUERIES = REGISTRY.histogram("http_request_db_queries", "DB queries per request", ("view",),
+                                buckets=(1, 2, 5, 10, 20, 50, 100, 200))
+DB_TIME = REGISTRY.histogram("http_request_db_seconds", "DB time per request", ("view",))
+LPR_STAGE = REGISTRY.histogram("lpr_stage_seconds", "LPR pipeline stage latency", ("stage",))
+LPR_MODEL_LOAD = REGISTRY.gauge("lpr_model_load_seconds", "LPR model load time", ("model",))
+CACHE_REQUESTS = REGISTRY.counter("cache_requests_total", "Cache lookups", ("cache", "result"))
+INFERENCE = REGISTRY.gauge("lpr_inference", "LPR inference in flight / queued", ("state",))
+
+
+@contextmanager
+def lpr_stage(stage):
+    t0 = time.perf_counter()
+    try:
+        with profile_stage(stage):
+            yield
+    finally:
+        LPR_STAGE.observe(time.perf_counter() - t0, stage=stage)
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+# ===== Multiprocess =====
+_flusher = None
+_flusher_lock = threading.Lock()
+
+def _snapshot_path(d):
+    return Path(d) / f"{os.getpid()}.json"
+
+def flush():
+    d = _conf()["MULTIPROC_DIR"]
+    if not d:
+        return
+    Path(d).mkdir(parents=True, exist_ok=True)
+    dst = _snapshot_path(d)
+    tmp = dst.with_suffix(".tmp")
+    tmp.write_text(json.dumps(REGISTRY.snapshot()))
+    tmp.replace(dst)
+
+def _flush_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            flush()
+        except OSError:
+            pass
+
+def _ensure_flusher():
+    global _flusher
+    conf = _conf()
+    if _flusher is not None or not conf["MULTIPROC_DIR"]:
+        return
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, args=(float(conf["FLUSH_INTERVAL"]),),
+                                        name="metrics-flush", daemon=True)
+            _flusher.start()
+            atexit.register(flush)
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _merge(into, snap, live):
+    for name, m in snap.items():
+        if m["kind"] == "gauge" and not live:
+            continue
+        cur = into.setdefault(name, {**m, "values": []})
+        idx = {tuple(k): i for i, (k, _) in enumerate(cur["values"])}
+        for k, v in m["values"]:
+            i = idx.get(tuple(k))
+            if i is None:
+                cur["values"].append([k, v])
+                idx[tuple(k)] = len(cur["values"]) - 1
+            elif isinstance(v, list):
+                cur["values"][i][1] = [a + b for a, b in zip(cur["values"][i][1], v)]
+            else:
+                cur["values"][i][1] += v
+
+def collect():
+    """Snapshot của process hiện tại, gộp với các worker khác nếu bật MULTIPROC_DIR."""
+    merged = {}
+    _merge(merged, REGISTRY.snapshot(), live=True)
+    d = _conf()["MULTIPROC_DIR"]
+    if d and Path(d).is_dir():
+        me = _snapshot_path(d)
+        for f in Path(d).glob("*.json"):
+            if f == me:
+                continue
+            try:
+                snap = json.loads(f.read_text())
+            except (OSError, ValueError):
+                continue
+            _merge(merged, snap, live=_pid_alive(int(f.stem)))
+    return merged
+
+
+# ===== Exposition =====
+def _fmt_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    body = ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+def render(snap):
+    out = []
+    for name in sorted(snap):
+        m = snap[name]
+        out.append(f"# HELP {name} {m['doc']}")
+        out.append(f"# TYPE {name} {m['kind']}")
+        names = m["labelnames"]
+        for k, v in m["values"]:
+            if m["kind"] != "histogram":
+                out.append(f"{name}{_fmt_labels(names, k)} {v}")
+                continue
+            acc = 0
+            for le, n in zip(list(m["buckets"]) + ["+Inf"], v[:-2]):
+                acc += n
+                out.append(f"{name}_bucket{_fmt_labels(names, k, [('le', le)])} {acc}")
+            out.append(f"{name}_sum{_fmt_labels(names, k)} {v[-2]}")
+            out.append(f"{name}_count{_fmt_labels(names, k)} {v[-1]}")
+    return "\n".join(out) + "\n"
+
+def metrics_view(request):
+    token = _conf()["TOKEN"]
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponseForbidden()
+    return HttpResponse(render(collect()), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class _QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - t0
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """Đo latency + số query/thời gian DB cho các view trong METRICS["VIEWS"]."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+        conf = _conf()
+        self.enabled = conf["ENABLED"]
+        self.views = set(conf["VIEWS"])
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+        _ensure_flusher()
+        timer = _QueryTimer()
+        t0 = time.perf_counter()
+        wrappers = [c.execute_wrapper(timer) for c in connections.all()]
+        for w in wrappers:
+            w.__enter__()
+        try:
+            response = self.get_response(request)
+        finally:
+            for w in reversed(wrappers):
+                w.__exit__(None, None, None)
+        elapsed = time.perf_counter() - t0
+        match = getattr(request, "resolver_match", None)
+        view = match.url_name if match else None
+        if view in self.views:
+            REQUEST_LATENCY.observe(elapsed, view=view, method=request.method, status=response.status_code)
+            DB_QUERIES.observe(timer.count, view=view)
+            DB_TIME.observe(timer.seconds, view=view)
+        return response
@@ -0,0 +1,53 @@
+# Generated by Django 5.0.6 on 2026-10-19 09:13
+
+from django.db import migrations, models
+
+
+def dedupe_gate_names(apps, schema_editor):
+    """Trước khi thêm unique cho gate.name: gate trùng tên (không phân biệt hoa thường — collation MySQL)
+    được đổi tên "<tên>-2", "<tên>-3"... thay vì xoá, vì phiên/reading vẫn trỏ tới chúng."""
+    Gate = apps.get_model("app", "Gate")
+    taken = {n.lower() for n in Gate.objects.values_list("name", flat=True)}
+    seen = set()
+    for gate in Gate.objects.order_by("name", "pk"):
+        key = gate.name.lower()
+        if key not in seen:
+            seen.add(key)
+            continue
+        base, i = gate.name[:45], 2
+        while f"{base}-{i}".lower() in taken:
+            i += 1
+        gate.name = f"{base}-{i}"
+        taken.add(gate.name.lower())
+        gate.save(update_fields=["name"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_reservation_parkingsession_qrcode_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gate',
+            name='device_camera_id',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='gate',
+            name='device_qr_id',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='platereading',
+            name='needs_review',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.RunPython(dedupe_gate_names, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='gate',
+            name='name',
+            field=models.CharField(max_length=50, unique=True),
+        ),
+    ]
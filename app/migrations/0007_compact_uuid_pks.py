@@ -0,0 +1,84 @@
+import app.fields
+from django.db import migrations
+
+# (bảng, cột, NULL?) — khoá chính của 3 bảng ghi nhiều và các FK trỏ tới ParkingSession.id
+COLUMNS = [
+    ('app_parkingsession', 'id', False),
+    ('app_payment', 'id', False),
+    ('app_payment', 'session_id', False),
+    ('app_platereading', 'id', False),
+    ('app_platereading', 'session_id', True),
+]
+
+
+def _fks_to_session(cursor):
+    cursor.execute(
+        "SELECT TABLE_NAME, COLUMN_NAME, CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE "
+        "WHERE TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME = 'app_parkingsession' "
+        "AND REFERENCED_COLUMN_NAME = 'id'"
+    )
+    return cursor.fetchall()
+
+
+def _convert(schema_editor, to_binary):
+    # Chỉ MySQL đổi kiểu cột; backend khác CompactUUIDField giữ nguyên kiểu của UUIDField
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    qn = schema_editor.quote_name
+    with schema_editor.connection.cursor() as cursor:
+        fks = _fks_to_session(cursor)
+        for table, _, name in fks:
+            cursor.execute(f"ALTER TABLE {qn(table)} DROP FOREIGN KEY {qn(name)}")
+        for table, col, null in COLUMNS:
+            t, c, n = qn(table), qn(col), "NULL" if null else "NOT NULL"
+            # char(32) hex ⇄ binary(16) qua varbinary(32) để không mất dữ liệu khi đổi kiểu
+            cursor.execute(f"ALTER TABLE {t} MODIFY {c} varbinary(32) {n}")
+            if to_binary:
+                cursor.execute(f"UPDATE {t} SET {c} = UNHEX({c}) WHERE {c} IS NOT NULL")
+                cursor.execute(f"ALTER TABLE {t} MODIFY {c} binary(16) {n}")
+            else:
+                cursor.execute(f"UPDATE {t} SET {c} = LOWER(HEX({c})) WHERE {c} IS NOT NULL")
+                cursor.execute(f"ALTER TABLE {t} MODIFY {c} char(32) {n}")
+        for table, col, name in fks:
+            cursor.execute(
+                f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} FOREIGN KEY ({qn(col)}) "
+                f"REFERENCES {qn('app_parkingsession')} ({qn('id')})"
+            )
+
+
+def forwards(apps, schema_editor):
+    _convert(schema_editor, to_binary=True)
+
+
+def backwards(apps, schema_editor):
+    _convert(schema_editor, to_binary=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_platereading_needs_review'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(forwards, backwards)],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='parkingsession',
+                    name='id',
+                    field=app.fields.CompactUUIDField(default=app.fields.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='payment',
+                    name='id',
+                    field=app.fields.CompactUUIDField(default=app.fields.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+                migrations.AlterField(
+                    model_name='platereading',
+                    name='id',
+                    field=app.fields.CompactUUIDField(default=app.fields.uuid7, editable=False, primary_key=True, serialize=False),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.0.6 on 2026-10-19 09:24
+
+import app.fields
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_compact_uuid_pks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParkingSessionArchive',
+            fields=[
+                ('id', app.fields.CompactUUIDField(editable=False, primary_key=True, serialize=False)),
+                ('entry_time', models.DateTimeField()),
+                ('exit_time', models.DateTimeField(blank=True, null=True)),
+                ('entry_plate', models.CharField(blank=True, max_length=20, null=True)),
+                ('exit_plate', models.CharField(blank=True, max_length=20, null=True)),
+                ('status', models.CharField(choices=[('open', 'OPEN'), ('closed', 'CLOSED')], default='closed', max_length=10)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('entry_gate', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app.gate')),
+                ('exit_gate', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app.gate')),
+                ('qrcode', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app.qrcode')),
+                ('reservation', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app.reservation')),
+                ('tariff', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app.tariff')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('vehicle', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app.vehicle')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PaymentArchive',
+            fields=[
+                ('id', app.fields.CompactUUIDField(editable=False, primary_key=True, serialize=False)),
+                ('provider', models.CharField(max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('currency', models.CharField(default='VND', max_length=8)),
+                ('paid_at', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('pending', 'PENDING'), ('paid', 'PAID'), ('failed', 'FAILED'), ('refunded', 'REFUNDED')], default='pending', max_length=15)),
+                ('tx_ref', models.CharField(blank=True, max_length=100)),
+                ('session', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='payment', to='app.parkingsessionarchive')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlateReadingArchive',
+            fields=[
+                ('id', app.fields.CompactUUIDField(editable=False, primary_key=True, serialize=False)),
+                ('image_path', models.CharField(blank=True, max_length=255)),
+                ('plate_text', models.CharField(max_length=20)),
+                ('confidence', models.FloatField(default=0.0)),
+                ('captured_at', models.DateTimeField(db_index=True)),
+                ('needs_review', models.BooleanField(default=False)),
+                ('gate', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app.gate')),
+                ('session', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='readings', to='app.parkingsessionarchive')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='parkingsessionarchive',
+            index=models.Index(fields=['user', 'entry_time'], name='app_parking_user_id_6bc894_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parkingsessionarchive',
+            index=models.Index(fields=['entry_time'], name='app_parking_entry_t_c2e69f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parkingsessionarchive',
+            index=models.Index(fields=['exit_time'], name='app_parking_exit_ti_e0461a_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 09:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_history_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gate',
+            name='lanes',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
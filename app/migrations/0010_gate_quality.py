@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 09:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_gate_lanes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gate',
+            name='quality',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.6 on 2026-10-19 09:36
+
+import app.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_gate_quality'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlateGram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=8)),
+                ('gram', models.CharField(max_length=3)),
+                ('object_id', app.fields.CompactUUIDField()),
+                ('canon', models.CharField(max_length=20)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['object_id'], name='app_plategr_object__090712_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='plategram',
+            constraint=models.UniqueConstraint(fields=('kind', 'gram', 'object_id'), name='uq_plategram'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-19 09:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_version_stamp'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='platereading',
+            name='captured_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
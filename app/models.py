@@ -4,6 +4,8 @@ from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from .fields import CompactUUIDField, uuid7
+
 STATUS_QR = [
     ('active',  'ACTIVE'),
     ('revoked', 'REVOKED'),
@@ -112,11 +114,15 @@ class Gate(models.Model):
     location = models.CharField(max_length=120, blank=True)
     device_camera_id = models.CharField(max_length=50, blank=True, null=True)
     device_qr_id = models.CharField(max_length=50, blank=True, null=True)
+    # Camera phủ nhiều làn: [{"name": "L1", "x": [0, 0.5]}, {"name": "L2", "x": [0.5, 1]}] (toạ độ chuẩn hoá)
+    lanes = models.JSONField(default=list, blank=True)
+    # Ngưỡng lọc chất lượng ảnh riêng của gate, ghi đè lpr.QUALITY_DEFAULTS: {"MIN_SHARPNESS": 25, "MODE": "flag"}
+    quality = models.JSONField(default=dict, blank=True)
     def __str__(self):
         return f"{self.name} ({self.type})"
 
 class ParkingSession(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = CompactUUIDField(primary_key=True, default=uuid7, editable=False)
     user = models.ForeignKey(User, on_delete=models.PROTECT, related_name="sessions")
     vehicle = models.ForeignKey(Vehicle, on_delete=models.PROTECT, related_name="sessions")
     entry_gate = models.ForeignKey(Gate, on_delete=models.PROTECT, related_name="entries")
@@ -164,7 +170,7 @@ class ParkingSession(models.Model):
             )
 
 class Payment(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = CompactUUIDField(primary_key=True, default=uuid7, editable=False)
     session = models.OneToOneField(ParkingSession, on_delete=models.CASCADE, related_name="payment")
     provider = models.CharField(max_length=20)
     amount = models.DecimalField(max_digits=12, decimal_places=2)
@@ -177,13 +183,96 @@ class Payment(models.Model):
         return f"{self.provider} - {self.amount} {self.currency} ({self.status})"
 
 class PlateReading(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = CompactUUIDField(primary_key=True, default=uuid7, editable=False)
     gate = models.ForeignKey(Gate, on_delete=models.SET_NULL, null=True)
     image_path = models.CharField(max_length=255, blank=True)
     plate_text = models.CharField(max_length=20)
     confidence = models.FloatField(default=0.0)
-    captured_at = models.DateTimeField(auto_now_add=True)
+    captured_at = models.DateTimeField(default=timezone.now, editable=False)  # không auto_now_add: bulk insert/replay giữ giờ chụp
     session = models.ForeignKey(ParkingSession, on_delete=models.SET_NULL, null=True, related_name='readings')
+    needs_review = models.BooleanField(default=False, db_index=True)
 
     def __str__(self):
         return f"{self.plate_text} ({self.confidence})"
+
+
+class PlateGram(models.Model):
+    """Chỉ mục trigram của biển số (đã gộp ký tự OCR hay nhầm) cho tìm kiếm trong admin — xem app/platesearch.py."""
+    kind = models.CharField(max_length=8)       # vehicle | qrcode | session | reading
+    gram = models.CharField(max_length=3)
+    object_id = CompactUUIDField()
+    canon = models.CharField(max_length=20)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'gram', 'object_id'], name='uq_plategram'),
+        ]
+        indexes = [models.Index(fields=['object_id'])]
+
+    def __str__(self):
+        return f"{self.kind}:{self.gram} → {self.object_id}"
+
+class VersionStamp(models.Model):
+    """Mốc thay đổi theo phạm vi ("reservations:<user_id>", "tariffs", ...) làm ETag/Last-Modified — xem app/conditional.py."""
+    key = models.CharField(max_length=64, primary_key=True)
+    stamp = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.key} @ {self.stamp:%Y-%m-%d %H:%M:%S.%f}"
+
+# ===== Lưu trữ lạnh (archive) =====
+# Bản sao phẳng của phiên đã đóng + reading/payment đi kèm, được chuyển khỏi bảng nóng theo lô
+# (xem app/archive.py). Không ràng buộc FK ở DB để xoá/chuyển dữ liệu nóng không bị chặn.
+
+class ParkingSessionArchive(models.Model):
+    id = CompactUUIDField(primary_key=True, editable=False)
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    vehicle = models.ForeignKey(Vehicle, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    entry_gate = models.ForeignKey(Gate, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    exit_gate = models.ForeignKey(Gate, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+", null=True, blank=True)
+    entry_time = models.DateTimeField()
+    exit_time = models.DateTimeField(null=True, blank=True)
+    entry_plate = models.CharField(max_length=20, null=True, blank=True)
+    exit_plate = models.CharField(max_length=20, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=SESSION_STATUS, default="closed")
+    amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    tariff = models.ForeignKey(Tariff, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    qrcode = models.ForeignKey(QRCode, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name="+")
+    reservation = models.ForeignKey(Reservation, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name="+")
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'entry_time']),
+            models.Index(fields=['entry_time']),
+            models.Index(fields=['exit_time']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.vehicle_id} - {self.status} (archived)"
+
+class PaymentArchive(models.Model):
+    id = CompactUUIDField(primary_key=True, editable=False)
+    session = models.OneToOneField(ParkingSessionArchive, on_delete=models.DO_NOTHING, db_constraint=False, related_name="payment")
+    provider = models.CharField(max_length=20)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    currency = models.CharField(max_length=8, default="VND")
+    paid_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=15, choices=PAY_STATUS, default="pending")
+    tx_ref = models.CharField(max_length=100, blank=True)
+
+    def __str__(self):
+        return f"{self.provider} - {self.amount} {self.currency} ({self.status}, archived)"
+
+class PlateReadingArchive(models.Model):
+    id = CompactUUIDField(primary_key=True, editable=False)
+    gate = models.ForeignKey(Gate, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name="+")
+    image_path = models.CharField(max_length=255, blank=True)
+    plate_text = models.CharField(max_length=20)
+    confidence = models.FloatField(default=0.0)
+    captured_at = models.DateTimeField(db_index=True)
+    session = models.ForeignKey(ParkingSessionArchive, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='readings')
+    needs_review = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.plate_text} ({self.confidence}, archived)"
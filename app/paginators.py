@@ -0,0 +1,37 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def table_estimate(model, using="default"):
+    """Số dòng ước lượng từ thống kê của DB (không quét bảng); None nếu backend không hỗ trợ."""
+    conn = connections[using]
+    table = model._meta.db_table
+    with conn.cursor() as c:
+        if conn.vendor == "mysql":
+            c.execute("SELECT TABLE_ROWS FROM information_schema.TABLES "
+                      "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", [table])
+        elif conn.vendor == "postgresql":
+            c.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+        else:
+            return None
+        row = c.fetchone()
+    return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """COUNT(*) trên bảng lớn tốn cả giây: không lọc → lấy số ước lượng của DB;
+    có lọc → chỉ đếm tới COUNT_CAP dòng (số trang bị chặn, đủ cho màn hình admin)."""
+    COUNT_CAP = 10_000
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        query = getattr(qs, "query", None)
+        if query is None:
+            return super().count
+        if not query.where:
+            est = table_estimate(qs.model, qs.db)
+            if est is not None and est > self.COUNT_CAP:
+                return est
+        return qs.order_by()[:self.COUNT_CAP].count()
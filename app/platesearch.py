@@ -0,0 +1,140 @@
+from __future__ import annotations
+import math, re
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+DEFAULTS = {
+    "MIN_QUERY": 3,           # ngắn hơn (sau chuẩn hoá) → không dùng chỉ mục
+    "FUZZY_RATIO": 0.6,       # tỉ lệ trigram tối thiểu khi tìm gần đúng
+    "MAX_CANDIDATES": 1000,
+    "MAX_DF": 2000,           # gram có nhiều posting hơn ("51A", "000"...) không được GROUP BY toàn bộ
+}
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "PLATE_SEARCH", {})}
+
+# Ký tự OCR hay đọc nhầm được gộp về cùng 1 lớp trước khi tách trigram
+CONFUSION = str.maketrans({"O": "0", "D": "0", "Q": "0", "I": "1", "L": "1", "J": "1", "T": "7",
+                           "Z": "2", "S": "5", "B": "8", "G": "6", "A": "4"})
+_NON_ALNUM = re.compile(r"[^A-Z0-9]")
+
+def canon(plate: str | None) -> str:
+    return _NON_ALNUM.sub("", (plate or "").upper()).translate(CONFUSION)
+
+def trigrams(s: str) -> set[str]:
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+# kind → (model label, các field biển số)
+SOURCES = {
+    "vehicle": ("app.Vehicle", ("plate_number",)),
+    "qrcode": ("app.QRCode", ("last_plate",)),
+    "session": ("app.ParkingSession", ("entry_plate", "exit_plate")),
+    "reading": ("app.PlateReading", ("plate_text",)),
+}
+
+
+def _rows(kind, obj, fields):
+    from .models import PlateGram
+    rows, seen = [], set()
+    for f in fields:
+        c = canon(getattr(obj, f, None))[:20]
+        for g in trigrams(c):
+            if g not in seen:
+                seen.add(g)
+                rows.append(PlateGram(kind=kind, gram=g, object_id=obj.pk, canon=c))
+    return rows
+
+def index_objects(kind, objs, replace=True):
+    """Ghi (lại) trigram cho các object; replace=False khi chắc chắn object mới tạo."""
+    from .models import PlateGram
+    fields = SOURCES[kind][1]
+    objs = list(objs)
+    rows = [r for o in objs for r in _rows(kind, o, fields)]
+    with transaction.atomic():
+        if replace:
+            PlateGram.objects.filter(kind=kind, object_id__in=[o.pk for o in objs]).delete()
+        PlateGram.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows)
+
+def forget(kind, ids):
+    from .models import PlateGram
+    return PlateGram.objects.filter(kind=kind, object_id__in=list(ids)).delete()[0]
+
+
+def search(kind: str, term: str, fuzzy: bool | None = None):
+    """id các object có biển số chứa `term` (so sau khi gộp ký tự dễ nhầm), xếp theo độ giống.
+
+    fuzzy=None: tìm đúng chuỗi con trước, không có kết quả thì tìm gần đúng theo tỉ lệ trigram.
+    Trả về None nếu term quá ngắn để dùng chỉ mục.
+    """
+    from .models import PlateGram
+    conf = _conf()
+    q = canon(term)
+    if len(q) < max(3, int(conf["MIN_QUERY"])):
+        return None
+    grams = trigrams(q)
+    exact = fuzzy is not True
+    need = len(grams) if exact else max(1, math.ceil(len(grams) * float(conf["FUZZY_RATIO"])))
+    cap = int(conf["MAX_DF"])
+    postings = PlateGram.objects.filter(kind=kind)
+    # số posting mỗi gram, đếm trên subquery LIMIT cap+1: gram phổ biến chỉ tốn tối đa cap+1 dòng chỉ mục
+    df = {g: postings.filter(gram=g)[:cap + 1].count() for g in grams}
+    rare = [g for g in grams if df[g] <= cap]
+    seed = min(grams, key=df.get)
+    if exact and df[seed] == 0:
+        cands = []
+    else:
+        if exact or not rare:
+            # đúng chuỗi con cần đủ mọi gram → ứng viên nằm trong posting của gram hiếm nhất (tối đa cap)
+            base = postings.filter(gram__in=grams, object_id__in=list(
+                postings.filter(gram=seed).values_list("object_id", flat=True)[:cap]))
+            if not exact:
+                need = 1
+        else:
+            # gần đúng: bỏ gram phổ biến, object vẫn phải khớp đủ số gram hiếm còn lại
+            base = postings.filter(gram__in=rare)
+            need = max(1, need - (len(grams) - len(rare)))
+        cands = list(
+            base.values("object_id").annotate(n=Count("gram")).filter(n__gte=need)
+            .order_by("-n").values_list("object_id", flat=True)[:int(conf["MAX_CANDIDATES"])]
+        )
+    if not cands:
+        return search(kind, term, fuzzy=True) if fuzzy is None else []
+    canons = {}
+    for oid, c in PlateGram.objects.filter(kind=kind, object_id__in=cands).values_list("object_id", "canon").distinct():
+        canons.setdefault(oid, set()).add(c)
+    if exact:
+        hits = [oid for oid in cands if any(q in c for c in canons.get(oid, ()))]
+        if hits or fuzzy is False:
+            return hits
+        return search(kind, term, fuzzy=True)
+    score = lambda oid: max(SequenceMatcher(None, q, c).ratio() for c in canons.get(oid, {""}))
+    return sorted(cands, key=score, reverse=True)
+
+
+def _on_save(kind, instance, created, update_fields):
+    fields = SOURCES[kind][1]
+    if update_fields is not None and not set(fields) & set(update_fields):
+        return
+    transaction.on_commit(lambda: index_objects(kind, [instance], replace=not created))
+
+@receiver(post_save, sender="app.Vehicle")
+def _vehicle_saved(sender, instance, created, update_fields=None, **kwargs):
+    _on_save("vehicle", instance, created, update_fields)
+
+@receiver(post_save, sender="app.QRCode")
+def _qrcode_saved(sender, instance, created, update_fields=None, **kwargs):
+    _on_save("qrcode", instance, created, update_fields)
+
+@receiver(post_save, sender="app.ParkingSession")
+def _session_saved(sender, instance, created, update_fields=None, **kwargs):
+    _on_save("session", instance, created, update_fields)
+
+@receiver(post_save, sender="app.PlateReading")
+def _reading_saved(sender, instance, created, update_fields=None, **kwargs):
+    _on_save("reading", instance, created, update_fields)
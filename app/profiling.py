@@ -0,0 +1,237 @@
+from __future__ import annotations
+import itertools, json, logging, os, queue, random, re, sys, threading, time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+log = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "ENABLED": False,
+    "SAMPLE_RATE": 0.0,        # tỉ lệ request được lấy profile từ đầu, bất kể nhanh chậm
+    "SLOW_MS": 1000,           # request chạy lâu hơn → lưu capture
+    "ARM_MS": 200,             # request chưa sampled chỉ bắt đầu lấy mẫu stack sau ngần này ms
+    "INTERVAL_MS": 5,          # chu kỳ lấy mẫu stack
+    "MAX_DEPTH": 64,
+    "MAX_QUERIES": 200,
+    "DIR": None,               # mặc định BASE_DIR/profiles
+    "MAX_FILES": 200,          # giữ ngần này capture mới nhất
+}
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "PROFILING", {})}
+
+def capture_dir(conf=None):
+    d = (conf or _conf())["DIR"] or Path(settings.BASE_DIR) / "profiles"
+    return Path(d)
+
+try:
+    import psutil
+    _proc = psutil.Process()
+    def _rss():
+        return _proc.memory_info().rss
+except ImportError:
+    def _rss():
+        return 0
+
+
+class Capture:
+    """Dữ liệu của 1 lượt chạy được theo dõi: mẫu stack, SQL, thời gian/bộ nhớ từng stage LPR."""
+    def __init__(self, name, sampled, conf):
+        self.name, self.sampled = name, sampled
+        self.thread_id = threading.get_ident()
+        self.t0 = time.perf_counter()
+        self.arm_at = self.t0 + (0 if sampled else conf["ARM_MS"] / 1000)
+        self.max_depth, self.max_queries = int(conf["MAX_DEPTH"]), int(conf["MAX_QUERIES"])
+        self.stacks = Counter()
+        self.queries, self.n_queries, self.sql_seconds = [], 0, 0.0
+        self.stages = []
+        self.meta = {}
+
+    def sample(self, frame):
+        parts, depth = [], 0
+        while frame is not None and depth < self.max_depth:
+            code = frame.f_code
+            parts.append(f"{code.co_filename.rsplit('/', 2)[-1]}:{code.co_name}:{frame.f_lineno}")
+            frame, depth = frame.f_back, depth + 1
+        self.stacks[";".join(reversed(parts))] += 1
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            dt = time.perf_counter() - t0
+            self.n_queries += 1
+            self.sql_seconds += dt
+            if len(self.queries) < self.max_queries:
+                self.queries.append((round((t0 - self.t0) * 1000, 2), round(dt * 1000, 3), sql))
+
+    def to_dict(self, elapsed, reason):
+        return {
+            "name": self.name, "reason": reason, "elapsed_ms": round(elapsed * 1000, 1),
+            "pid": os.getpid(), "at": time.time(), **self.meta,
+            "sql": {"count": self.n_queries, "ms": round(self.sql_seconds * 1000, 2),
+                    "statements": [{"at_ms": a, "ms": d, "sql": s} for a, d, s in self.queries]},
+            "stages": self.stages,
+            "samples": sum(self.stacks.values()),
+            "folded": [f"{k} {v}" for k, v in self.stacks.most_common()],  # flamegraph.pl / speedscope
+        }
+
+
+# ===== Sampler =====
+# 1 thread cho cả process, chỉ thức khi có capture đang chạy; request nhanh hơn ARM_MS không bị lấy mẫu.
+_tls = threading.local()
+_active = {}
+_active_lock = threading.Lock()
+_wake = threading.Event()
+_sampler = None
+
+def current():
+    return getattr(_tls, "capture", None)
+
+def _sample_loop():
+    while True:
+        _wake.wait()
+        interval = _conf()["INTERVAL_MS"] / 1000
+        while True:
+            time.sleep(interval)
+            now = time.perf_counter()
+            with _active_lock:
+                due = [c for c in _active.values() if now >= c.arm_at]
+                if not _active:
+                    _wake.clear()
+                    break
+            if due:
+                frames = sys._current_frames()
+                for cap in due:
+                    frame = frames.get(cap.thread_id)
+                    if frame is not None:
+                        cap.sample(frame)
+                del frames
+
+def _ensure_sampler():
+    global _sampler
+    if _sampler is None:
+        with _active_lock:
+            if _sampler is None:
+                _sampler = threading.Thread(target=_sample_loop, name="profiling-sampler", daemon=True)
+                _sampler.start()
+
+
+# ===== Ghi capture (thread nền, xoay vòng theo MAX_FILES) =====
+_writes = queue.Queue(maxsize=64)
+_writer = None
+_seq = itertools.count()
+NAME_RE = re.compile(r"^[\w.-]+\.json$")
+
+def _write_loop():
+    while True:
+        data = _writes.get()
+        conf = _conf()
+        d = capture_dir(conf)
+        try:
+            d.mkdir(parents=True, exist_ok=True)
+            fname = (f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(data['at']))}-{data['name']}-"
+                     f"{data['reason']}-{int(data['elapsed_ms'])}ms-{data['pid']}-{next(_seq)}.json")
+            tmp = d / (fname + ".tmp")
+            tmp.write_text(json.dumps(data, ensure_ascii=False))
+            tmp.replace(d / fname)
+            old = sorted(d.glob("*.json"), key=lambda p: p.stat().st_mtime)
+            for p in old[:max(0, len(old) - int(conf["MAX_FILES"]))]:
+                p.unlink(missing_ok=True)
+        except OSError:
+            log.exception("profiling: không ghi được capture vào %s", d)
+
+def _save(data):
+    global _writer
+    if _writer is None:
+        _writer = threading.Thread(target=_write_loop, name="profiling-writer", daemon=True)
+        _writer.start()
+    try:
+        _writes.put_nowait(data)
+    except queue.Full:
+        log.warning("profiling: hàng đợi ghi đầy, bỏ capture %s", data["name"])
+
+
+# ===== API =====
+@contextmanager
+def stage(name):
+    """Ghi thời gian + chênh lệch RSS của 1 stage vào capture hiện tại (không có capture → gần như không tốn gì)."""
+    cap = current()
+    if cap is None:
+        yield
+        return
+    t0, m0 = time.perf_counter(), _rss()
+    try:
+        yield
+    finally:
+        t1 = time.perf_counter()
+        cap.stages.append({"stage": name, "at_ms": round((t0 - cap.t0) * 1000, 2),
+                           "ms": round((t1 - t0) * 1000, 3), "rss_delta_kb": (_rss() - m0) // 1024})
+
+def profiled(name):
+    """Theo dõi hàm/view: lưu capture khi được lấy mẫu (SAMPLE_RATE) hoặc chạy quá SLOW_MS.
+
+    Gọi lồng trong 1 capture khác (vd. recognize_plate trong entry) thì chỉ ghi thành 1 stage.
+    """
+    def deco(fn):
+        @wraps(fn)
+        def inner(*args, **kwargs):
+            conf = _conf()
+            if not conf["ENABLED"]:
+                return fn(*args, **kwargs)
+            if current() is not None:
+                with stage(name):
+                    return fn(*args, **kwargs)
+            sampled = random.random() < float(conf["SAMPLE_RATE"])
+            cap = Capture(name, sampled, conf)
+            request = args[0] if args and hasattr(args[0], "path") else None
+            if request is not None:
+                cap.meta.update(method=request.method, path=request.get_full_path())
+            _tls.capture = cap
+            _ensure_sampler()
+            with _active_lock:
+                _active[id(cap)] = cap
+            _wake.set()
+            status = None
+            try:
+                with ExitStack() as stack:
+                    for conn in connections.all():
+                        stack.enter_context(conn.execute_wrapper(cap))
+                    result = fn(*args, **kwargs)
+                status = getattr(result, "status_code", None)
+                return result
+            except Exception as e:
+                status = type(e).__name__
+                raise
+            finally:
+                elapsed = time.perf_counter() - cap.t0
+                _tls.capture = None
+                with _active_lock:
+                    _active.pop(id(cap), None)
+                slow = elapsed * 1000 >= float(conf["SLOW_MS"])
+                if slow or sampled:
+                    cap.meta["status"] = status
+                    _save(cap.to_dict(elapsed, "slow" if slow else "sampled"))
+        return inner
+    return deco
+
+
+def list_captures(limit=200):
+    d = capture_dir()
+    if not d.is_dir():
+        return []
+    files = sorted(d.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)[:limit]
+    return [{"name": p.name, "bytes": p.stat().st_size, "modified": p.stat().st_mtime} for p in files]
+
+def capture_path(name):
+    """Đường dẫn file capture theo tên; None nếu tên không hợp lệ hoặc không tồn tại."""
+    if not NAME_RE.fullmatch(name or ""):
+        return None
+    p = capture_dir() / name
+    return p if p.is_file() else None
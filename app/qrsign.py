@@ -0,0 +1,145 @@
+from __future__ import annotations
+import base64, hashlib, hmac, struct, threading, time
+from uuid import UUID
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+# Định dạng QR ký số (không cần DB ở cổng):
+#   "SP1." + base64url(payload) + "." + base64url(signature)
+#   payload = user_id(16) | reservation_id(16, 0 nếu không có) | qr_id(16) | start | end | expires  (uint32 epoch)
+PREFIX = "SP1."
+_FMT = ">16s16s16sIII"
+
+DEFAULTS = {
+    "ENABLED": True,
+    "ALG": "hmac",        # hmac (HMAC-SHA256, 16 byte) | ed25519 (cần gói cryptography)
+    "KEY": None,          # hmac: mặc định SECRET_KEY; ed25519: private key PEM
+    "PUBLIC_KEY": None,   # ed25519: public key PEM (cổng chỉ cần khoá này)
+}
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "QR_SIGNING", {})}
+
+def _b64e(b: bytes) -> str:
+    return base64.urlsafe_b64encode(b).rstrip(b"=").decode()
+
+def _b64d(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _hmac_key():
+    key = _conf()["KEY"] or settings.SECRET_KEY
+    return hashlib.sha256(b"smart-parking-qr:" + key.encode()).digest()
+
+def _sign(payload: bytes) -> bytes:
+    conf = _conf()
+    if conf["ALG"] == "ed25519":
+        from cryptography.hazmat.primitives.serialization import load_pem_private_key
+        return load_pem_private_key(conf["KEY"].encode(), password=None).sign(payload)
+    return hmac.new(_hmac_key(), payload, hashlib.sha256).digest()[:16]
+
+def _verify(payload: bytes, sig: bytes) -> bool:
+    conf = _conf()
+    if conf["ALG"] == "ed25519":
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives.serialization import load_pem_public_key
+        try:
+            load_pem_public_key(conf["PUBLIC_KEY"].encode()).verify(sig, payload)
+            return True
+        except InvalidSignature:
+            return False
+    return hmac.compare_digest(hmac.new(_hmac_key(), payload, hashlib.sha256).digest()[:16], sig)
+
+
+def is_signed(value) -> bool:
+    return isinstance(value, str) and value.startswith(PREFIX)
+
+def sign_qr(qr, reservation=None) -> str:
+    """Sinh chuỗi QR ký số cho QRCode (và Reservation nếu có)."""
+    start = int(reservation.start_time.timestamp()) if reservation else 0
+    end = int(reservation.end_time.timestamp()) if reservation else 0
+    expires = int(qr.expired_at.timestamp()) if qr.expired_at else 0
+    payload = struct.pack(_FMT, UUID(str(qr.user_id)).bytes,
+                          reservation.id.bytes if reservation else bytes(16),
+                          qr.id.bytes, start, end, expires)
+    return PREFIX + _b64e(payload) + "." + _b64e(_sign(payload))
+
+
+class SignedQR:
+    __slots__ = ("user_id", "reservation_id", "qr_id", "start", "end", "expires")
+
+    def __init__(self, user_id, reservation_id, qr_id, start, end, expires):
+        self.user_id, self.reservation_id, self.qr_id = user_id, reservation_id, qr_id
+        self.start, self.end, self.expires = start, end, expires
+
+def verify_qr(value: str) -> SignedQR:
+    """Kiểm tra chữ ký + danh sách thu hồi; không đọc DB. Raise InvalidToken nếu sai."""
+    try:
+        body, sig = value[len(PREFIX):].split(".", 1)
+        payload, sig = _b64d(body), _b64d(sig)
+        uid, rid, qid, start, end, expires = struct.unpack(_FMT, payload)
+    except (ValueError, struct.error):
+        raise InvalidToken("malformed")
+    if not _verify(payload, sig):
+        raise InvalidToken("bad_signature")
+    qr_id = UUID(bytes=qid)
+    if revoked.contains(qr_id):
+        raise InvalidToken("revoked")
+    return SignedQR(UUID(bytes=uid), UUID(bytes=rid) if any(rid) else None, qr_id, start, end, expires)
+
+
+class RevocationSet:
+    """Tập QR bị thu hồi trong RAM, đồng bộ theo QRCode.status (signal + nạp lại định kỳ từ DB).
+
+    Chỉ giữ các QR chưa hết hạn nên kích thước nhỏ; mục đã quá expires tự bị loại.
+    """
+    def __init__(self, refresh_sec=60):
+        self._ids = {}
+        self._lock = threading.Lock()
+        self._loaded_at = 0.0
+        self.refresh_sec = refresh_sec
+
+    def add(self, qr_id, expires_ts=None):
+        with self._lock:
+            self._ids[qr_id] = expires_ts or 0
+
+    def discard(self, qr_id):
+        with self._lock:
+            self._ids.pop(qr_id, None)
+
+    def contains(self, qr_id) -> bool:
+        if time.monotonic() - self._loaded_at > self.refresh_sec:
+            self.reload()
+        with self._lock:
+            return qr_id in self._ids
+
+    def reload(self):
+        from django.utils import timezone
+        from .models import QRCode
+        now = timezone.now()
+        rows = QRCode.objects.exclude(status="active").filter(expired_at__gt=now) \
+                             .values_list("id", "expired_at")
+        ids = {qid: int(exp.timestamp()) for qid, exp in rows}
+        with self._lock:
+            self._ids = ids
+            self._loaded_at = time.monotonic()
+
+revoked = RevocationSet()
+
+
+@receiver(post_save, sender="app.QRCode")
+def _qr_status_changed(sender, instance, **kwargs):
+    if instance.status == "active":
+        revoked.discard(instance.id)
+    else:
+        revoked.add(instance.id, int(instance.expired_at.timestamp()) if instance.expired_at else None)
+
+@receiver(post_delete, sender="app.QRCode")
+def _qr_deleted(sender, instance, **kwargs):
+    revoked.add(instance.id)
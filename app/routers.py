@@ -0,0 +1,147 @@
+from __future__ import annotations
+import random, threading, time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache import caches
+from django.db import connections
+from django.utils.functional import SimpleLazyObject, empty
+
+DEFAULTS = {
+    "REPLICAS": [],                 # alias trong DATABASES dùng cho đọc
+    "READ_VIEWS": ["stats_summary", "my_payments", "my_reservations", "reservation_detail"],
+    "ADMIN_CHANGELISTS": True,      # GET changelist trong admin cũng đọc từ replica
+    "PIN_SECONDS": 5,               # sau khi user ghi, đọc của user đó về primary trong N giây
+    "PIN_CACHE": None,              # alias CACHES dùng chung giữa các worker — bắt buộc khi có REPLICAS
+    "HEALTH_TTL": 10,
+    # Token/Session luôn đọc primary: token vừa tạo có thể chưa kịp sang replica; bảng của DatabaseCache
+    # (nếu PIN_CACHE là cache DB) và VersionStamp (mốc ETag) cũng vậy — mốc vừa ghi phải thấy ngay
+    "PRIMARY_MODELS": ["authtoken.token", "sessions.session", "django_cache.cacheentry", "app.versionstamp"],
+}
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "DB_ROUTING", {})}
+
+
+class _RequestState:
+    __slots__ = ("read_ok", "wrote", "pinned", "request")
+
+    def __init__(self, request=None, read_ok=False):
+        self.request, self.read_ok, self.wrote = request, read_ok, False
+        self.pinned = None
+
+_state: ContextVar[_RequestState | None] = ContextVar("db_routing_state", default=None)
+
+_health = {}
+_health_lock = threading.Lock()
+
+def _replica_ok(alias, ttl):
+    now = time.monotonic()
+    with _health_lock:
+        cached = _health.get(alias)
+    if cached and cached[0] > now:
+        return cached[1]
+    try:
+        connections[alias].ensure_connection()
+        ok = connections[alias].is_usable()
+    except Exception:
+        ok = False
+    with _health_lock:
+        _health[alias] = (now + ttl, ok)
+    return ok
+
+def check_pin_cache(conf=None):
+    """Có replica thì ghim phải qua cache dùng chung: LocMem/Dummy chỉ thấy được trong 1 process, request sau
+    của user rơi vào worker khác sẽ đọc replica chưa kịp nhận dữ liệu vừa ghi."""
+    conf = conf or _conf()
+    if not conf["REPLICAS"]:
+        return
+    alias = conf["PIN_CACHE"]
+    backend = settings.CACHES.get(alias, {}).get("BACKEND", "") if alias else ""
+    if not backend or backend.rsplit(".", 1)[-1] in ("LocMemCache", "DummyCache"):
+        raise ImproperlyConfigured(
+            f"DB_ROUTING['REPLICAS'] cần PIN_CACHE là cache dùng chung giữa các worker (hiện: {alias!r} → "
+            f"{backend or 'không có'}); đặt SHARED_CACHE_URL hoặc bỏ DB_REPLICAS")
+
+def _pin_key(user_id):
+    return f"db-pin:{user_id}"
+
+def _user_id(request):
+    # Không ép SimpleLazyObject của AuthenticationMiddleware: việc đó tự gây query (→ đệ quy router)
+    user = request.__dict__.get("user")
+    if isinstance(user, SimpleLazyObject):
+        user = None if user._wrapped is empty else user._wrapped
+    return user.pk if user is not None and user.is_authenticated else None
+
+def _pinned(st, conf):
+    if st.pinned is None and st.request is not None:
+        uid = _user_id(st.request)
+        if uid is None:
+            return False
+        st.pinned = caches[conf["PIN_CACHE"]].get(_pin_key(uid)) is not None
+    return bool(st.pinned)
+
+
+class ReplicaRouter:
+    """Đọc từ replica cho các endpoint chỉ-đọc; ghi và mọi thứ khác về primary.
+
+    Read-your-writes: trong cùng request, sau lần ghi đầu tiên mọi đọc về primary; giữa các request,
+    user vừa ghi được ghim vào primary PIN_SECONDS giây (qua cache dùng chung).
+    """
+    def db_for_read(self, model, **hints):
+        st = _state.get()
+        if st is None or not st.read_ok or st.wrote:
+            return None
+        conf = _conf()
+        if f"{model._meta.app_label}.{model._meta.model_name}" in conf["PRIMARY_MODELS"]:
+            return None
+        if _pinned(st, conf):
+            st.read_ok = False
+            return None
+        replicas = [a for a in conf["REPLICAS"] if _replica_ok(a, float(conf["HEALTH_TTL"]))]
+        return random.choice(replicas) if replicas else None
+
+    def db_for_write(self, model, **hints):
+        st = _state.get()
+        if st is not None:
+            st.wrote = True
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        check_pin_cache()  # nạp middleware lúc khởi động: cấu hình sai thì không chạy
+        self.get_response = get_response
+
+    def __call__(self, request):
+        st = _RequestState(request)
+        token = _state.set(st)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+            conf = _conf()
+            uid = _user_id(request)
+            if uid is not None and conf["REPLICAS"]:
+                caches[conf["PIN_CACHE"]].set(_pin_key(uid), 1, timeout=conf["PIN_SECONDS"])
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        st = _state.get()
+        if st is None or request.method not in ("GET", "HEAD"):
+            return None
+        conf = _conf()
+        if not conf["REPLICAS"]:
+            return None
+        name = request.resolver_match.url_name if request.resolver_match else None
+        st.read_ok = name in conf["READ_VIEWS"] or bool(
+            conf["ADMIN_CHANGELISTS"] and name and name.endswith("_changelist"))
+        return None
@@ -6,7 +6,7 @@ from rest_framework import serializers
 
 from .models import (
     User, Vehicle, QRCode, Gate, Tariff,
-    ParkingSession, Payment, PlateReading, Reservation
+    ParkingSession, Payment, PlateReading, Reservation, PaymentArchive
 )
 
 PLATE_RE = re.compile(r"^[A-Z0-9\-]{5,12}$")
@@ -94,7 +94,29 @@ class QRCodeSerializer(serializers.ModelSerializer):
 class GateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Gate
-        fields = ['id', 'name', 'type', 'location', 'device_camera_id', 'device_qr_id']
+        fields = ['id', 'name', 'type', 'location', 'device_camera_id', 'device_qr_id', 'lanes', 'quality']
+
+    def validate_lanes(self, v):
+        if not isinstance(v, list):
+            raise serializers.ValidationError("lanes phải là danh sách.")
+        for lane in v:
+            if not isinstance(lane, dict) or not lane.get("name"):
+                raise serializers.ValidationError("Mỗi làn cần có 'name'.")
+            for axis in ("x", "y"):
+                r = lane.get(axis)
+                if r is not None and not (isinstance(r, list) and len(r) == 2 and 0 <= r[0] < r[1] <= 1):
+                    raise serializers.ValidationError(f"'{axis}' của làn {lane['name']} phải là [a, b] với 0 <= a < b <= 1.")
+        return v
+
+    def validate_quality(self, v):
+        if not isinstance(v, dict):
+            raise serializers.ValidationError("quality phải là object.")
+        if v.get("MODE", "reject") not in ("reject", "flag"):
+            raise serializers.ValidationError("quality.MODE phải là 'reject' hoặc 'flag'.")
+        for k, x in v.items():
+            if k not in ("MODE", "ENABLED") and not isinstance(x, (int, float)):
+                raise serializers.ValidationError(f"quality.{k} phải là số.")
+        return v
 
 
 class TariffSerializer(serializers.ModelSerializer):
@@ -237,12 +259,20 @@ class PaymentSerializer(serializers.ModelSerializer):
         return attrs
 
 
+class PaymentArchiveSerializer(serializers.ModelSerializer):
+    """Payment đã chuyển sang archive — cùng schema với PaymentSerializer, chỉ đọc."""
+    class Meta:
+        model = PaymentArchive
+        fields = ["id", "session", "provider", "amount", "currency", "paid_at", "status", "tx_ref"]
+        read_only_fields = fields
+
+
 class PlateReadingSerializer(serializers.ModelSerializer):
     plate_text = serializers.CharField()
 
     class Meta:
         model = PlateReading
-        fields = ["id", "gate", "image_path", "plate_text", "confidence", "captured_at", "session"]
+        fields = ["id", "gate", "image_path", "plate_text", "confidence", "captured_at", "session", "needs_review"]
         read_only_fields = ["id", "captured_at"]
 
     def to_internal_value(self, data):
@@ -0,0 +1,319 @@
+"""Gate đọc video liên tục (MJPEG/RTSP/file) thay cho ảnh tĩnh.
+
+Mỗi khung: phát hiện chuyển động trên ảnh xám thu nhỏ (rẻ) → chỉ khi có chuyển động mới chạy detector →
+box biển số được theo dõi qua các khung (IoU, dự phòng khoảng cách tâm) → mỗi xe chỉ OCR vài lần ở
+những khung biển to/rõ nhất → đọc đủ (hoặc xe rời khung hình) thì gộp thành 1 sự kiện biển số.
+
+Web worker chỉ import claim_plate (không kéo theo cv2/torch); cv2 được import khi dùng.
+
+Sự kiện được ghi thành PlateReading chưa gắn phiên của gate; entry/exit chỉ có QR sẽ lấy biển số từ
+sự kiện cũ nhất chưa được nhận của gate trong WINDOW giây (xem views.entry/exit).
+"""
+from __future__ import annotations
+import logging, math, time
+from datetime import timedelta
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.utils import timezone
+
+log = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "SOURCES": {},              # device_camera_id → URL/đường dẫn (khi id không phải URL)
+    "MOTION_WIDTH": 160,        # phát hiện chuyển động trên ảnh rộng ngần này px
+    "MOTION_THRESHOLD": 25,     # chênh lệch mức xám coi là pixel thay đổi
+    "MOTION_MIN_AREA": 0.01,    # tỉ lệ pixel thay đổi tối thiểu để coi là có chuyển động
+    "BG_ALPHA": 0.05,           # tốc độ cập nhật nền
+    "DETECT_EVERY": 2,          # khi có chuyển động: chạy detector mỗi N khung
+    "IOU_MATCH": 0.3,
+    "CENTROID_MAX": 0.15,       # dự phòng khi IoU thấp (xe chạy nhanh): khoảng cách tâm / đường chéo khung
+    "MAX_AGE": 8,               # lần detect liên tiếp không thấy → track kết thúc
+    "MIN_HITS": 2,              # track ít lần thấy hơn → coi là nhiễu, không phát sự kiện
+    "OCR_PER_TRACK": 3,         # số lần OCR tối đa cho 1 xe
+    "OCR_STOP_CONF": 0.95,      # đã có lần đọc tự tin hơn ngưỡng này → thôi OCR
+    "WINDOW": 15,               # giây: entry/exit dùng được sự kiện trong khoảng này
+    "RECONNECT": 2.0,
+}
+
+def _conf():
+    conf = {**DEFAULTS, **getattr(settings, "GATE_STREAM", {})}
+    conf["SOURCES"] = {**DEFAULTS["SOURCES"], **conf["SOURCES"]}
+    return conf
+
+def resolve_source(gate, conf=None):
+    """URL/đường dẫn video của gate theo device_camera_id."""
+    conf = conf or _conf()
+    cam = (gate.device_camera_id or "").strip()
+    if not cam:
+        return None
+    return conf["SOURCES"].get(cam) or cam
+
+
+# ===== Phát hiện chuyển động =====
+class MotionDetector:
+    def __init__(self, conf):
+        self.width = int(conf["MOTION_WIDTH"])
+        self.threshold = float(conf["MOTION_THRESHOLD"])
+        self.min_area = float(conf["MOTION_MIN_AREA"])
+        self.alpha = float(conf["BG_ALPHA"])
+        self.bg = None
+
+    def __call__(self, frame) -> float:
+        """Tỉ lệ pixel thay đổi so với nền (0 ở khung đầu tiên)."""
+        import cv2, numpy as np
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (self.width, max(1, h * self.width // w)), interpolation=cv2.INTER_AREA)
+        g = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0).astype(np.float32)
+        if self.bg is None:
+            self.bg = g
+            return 0.0
+        diff = cv2.absdiff(g, self.bg)
+        cv2.accumulateWeighted(g, self.bg, self.alpha)
+        return float(np.count_nonzero(diff > self.threshold)) / diff.size
+
+    def moving(self, ratio):
+        return ratio >= self.min_area
+
+
+# ===== Theo dõi biển số =====
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+def _center(b):
+    return (b[0] + b[2]) / 2, (b[1] + b[3]) / 2
+
+@dataclass(eq=False)
+class Track:
+    id: int
+    bbox: tuple
+    first_frame: int
+    last_frame: int
+    hits: int = 1
+    misses: int = 0
+    reads: list = field(default_factory=list)     # [(text, conf)]
+    best: tuple | None = None                     # (area * det_conf, crop) — crop đẹp nhất để lưu ảnh
+    emitted: bool = False
+
+    def area(self):
+        return (self.bbox[2] - self.bbox[0]) * (self.bbox[3] - self.bbox[1])
+
+    def fused(self):
+        """Gộp các lần đọc: chọn chuỗi có tổng độ tin cậy cao nhất; conf = tổng conf của chuỗi đó / số lần đọc."""
+        votes = {}
+        for text, conf in self.reads:
+            if text:
+                votes.setdefault(text, []).append(conf)
+        if not votes:
+            return None, 0.0
+        text, confs = max(votes.items(), key=lambda kv: sum(kv[1]))
+        return text, sum(confs) / len(self.reads)
+
+
+class PlateTracker:
+    def __init__(self, conf, frame_size):
+        self.iou_match = float(conf["IOU_MATCH"])
+        self.max_dist = float(conf["CENTROID_MAX"]) * math.hypot(*frame_size)
+        self.max_age = int(conf["MAX_AGE"])
+        self.tracks = []
+        self._next_id = 1
+
+    def update(self, detections, frame_no):
+        """detections: [(bbox, det_conf, crop)]. Trả về [(track, det)] đã ghép và track vừa kết thúc."""
+        pairs = sorted(((iou(t.bbox, d[0]), ti, di) for ti, t in enumerate(self.tracks)
+                        for di, d in enumerate(detections)), reverse=True)
+        used_t, used_d, matched = set(), set(), []
+        for score, ti, di in pairs:
+            if score < self.iou_match or ti in used_t or di in used_d:
+                continue
+            used_t.add(ti); used_d.add(di); matched.append((ti, di))
+        for di, d in enumerate(detections):  # IoU thấp: ghép theo tâm gần nhất
+            if di in used_d:
+                continue
+            cx, cy = _center(d[0])
+            cands = [(math.hypot(cx - _center(t.bbox)[0], cy - _center(t.bbox)[1]), ti)
+                     for ti, t in enumerate(self.tracks) if ti not in used_t]
+            dist, ti = min(cands, default=(None, None))
+            if ti is not None and dist <= self.max_dist:
+                used_t.add(ti); used_d.add(di); matched.append((ti, di))
+        out = []
+        for ti, di in matched:
+            t, d = self.tracks[ti], detections[di]
+            t.bbox, t.last_frame, t.hits, t.misses = d[0], frame_no, t.hits + 1, 0
+            out.append((t, d))
+        for ti, t in enumerate(self.tracks):
+            if ti not in used_t:
+                t.misses += 1
+        for di, d in enumerate(detections):
+            if di not in used_d:
+                t = Track(self._next_id, d[0], frame_no, frame_no)
+                self._next_id += 1
+                self.tracks.append(t)
+                out.append((t, d))
+        return out, self.expire()
+
+    def expire(self, force=False):
+        done = [t for t in self.tracks if force or t.misses > self.max_age]
+        self.tracks = [t for t in self.tracks if t not in done]
+        return done
+
+
+# ===== Vòng xử lý =====
+class GateStream:
+    """Xử lý 1 nguồn video cho 1 gate; on_event(track, text, conf) được gọi 1 lần mỗi xe."""
+    def __init__(self, gate, source, on_event, conf=None):
+        self.gate, self.source, self.on_event = gate, source, on_event
+        self.conf = conf or _conf()
+        self.stats = {"frames": 0, "motion_frames": 0, "detector_calls": 0, "ocr_calls": 0,
+                      "tracks": 0, "events": 0, "dropped_tracks": 0, "cpu_seconds": 0.0, "wall_seconds": 0.0}
+
+    def _ocr_due(self, track):
+        c = self.conf
+        if len(track.reads) >= int(c["OCR_PER_TRACK"]):
+            return False
+        if track.reads and max(conf for _, conf in track.reads) >= float(c["OCR_STOP_CONF"]):
+            return False
+        return True
+
+    def _emit(self, t):
+        text, conf = t.fused()
+        if text:
+            t.emitted = True
+            self.stats["events"] += 1
+            self.on_event(t, text, conf)
+
+    def _finish(self, tracks, expired):
+        """Xe đứng chờ ở barie: phát sự kiện ngay khi đủ lần thấy và đã OCR xong, không đợi xe rời khung."""
+        for t in tracks:
+            if t.emitted:
+                continue
+            if t.hits < int(self.conf["MIN_HITS"]) or not t.reads:
+                if expired:
+                    self.stats["dropped_tracks"] += 1
+                continue
+            if expired or not self._ocr_due(t):
+                self._emit(t)
+
+    def process(self, frames):
+        """frames: iterable khung BGR. Trả về self.stats (cập nhật liên tục)."""
+        from . import lpr
+        every = max(1, int(self.conf["DETECT_EVERY"]))
+        motion = MotionDetector(self.conf)
+        tracker = None
+        cpu0, wall0 = time.process_time(), time.perf_counter()
+        since_motion = every
+        try:
+            for frame_no, frame in enumerate(frames):
+                self.stats["frames"] += 1
+                if tracker is None:
+                    tracker = PlateTracker(self.conf, frame.shape[1::-1])
+                if not motion.moving(motion(frame)) and not tracker.tracks:
+                    continue
+                self.stats["motion_frames"] += 1
+                since_motion += 1
+                if since_motion < every:
+                    continue
+                since_motion = 0
+                bundle = lpr._load_models()
+                self.stats["detector_calls"] += 1
+                found = lpr._plate_boxes(frame, bundle=bundle)
+                matched, finished = tracker.update([(bbox, det_conf, crop) for crop, bbox, det_conf in found], frame_no)
+                self.stats["tracks"] = tracker._next_id - 1
+                todo = [(t, d) for t, d in matched if self._ocr_due(t)]
+                for t, (bbox, det_conf, crop) in matched:
+                    score = t.area() * det_conf
+                    if t.best is None or score > t.best[0]:
+                        t.best = (score, crop)
+                if todo:
+                    self.stats["ocr_calls"] += len(todo)
+                    for (t, _), read in zip(todo, lpr._ocr_batch([d[2] for _, d in todo], bundle)):
+                        t.reads.append(read)
+                self._finish([t for t, _ in matched], expired=False)
+                self._finish(finished, expired=True)
+            if tracker is not None:
+                self._finish(tracker.expire(force=True), expired=True)
+        finally:
+            self.stats["cpu_seconds"] = round(time.process_time() - cpu0, 3)
+            self.stats["wall_seconds"] = round(time.perf_counter() - wall0, 3)
+        return self.stats
+
+    def report(self):
+        s = self.stats
+        return {**s,
+                "fps_per_core": round(s["frames"] / s["cpu_seconds"], 1) if s["cpu_seconds"] else None,
+                "fps_wall": round(s["frames"] / s["wall_seconds"], 1) if s["wall_seconds"] else None,
+                "ocr_per_vehicle": round(s["ocr_calls"] / s["events"], 2) if s["events"] else None,
+                "detector_ratio": round(s["detector_calls"] / s["frames"], 3) if s["frames"] else None}
+
+
+def read_frames(source, realtime=False, reconnect=None, max_frames=None):
+    """Khung BGR từ cv2.VideoCapture. Nguồn mạng mất kết nối → mở lại sau `reconnect` giây."""
+    import cv2
+    n = 0
+    while True:
+        cap = cv2.VideoCapture(source)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0
+        delay = 1.0 / fps if realtime and fps > 0 else 0
+        try:
+            while cap.isOpened():
+                t0 = time.perf_counter()
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                yield frame
+                n += 1
+                if max_frames and n >= max_frames:
+                    return
+                if delay:
+                    time.sleep(max(0.0, delay - (time.perf_counter() - t0)))
+        finally:
+            cap.release()
+        if not reconnect:
+            return
+        log.warning("stream %s ngắt, mở lại sau %.1fs", source, reconnect)
+        time.sleep(reconnect)
+
+
+# ===== Ghi sự kiện vào luồng entry/exit =====
+def record_event(gate, text, conf, crop=None, **extra):
+    """PlateReading chưa gắn phiên + event 'plate'; entry/exit nhận lại qua claim_plate()."""
+    from .archival import archive_plate_image
+    from .events import publish
+    from .models import PlateReading
+    from .serializers import normalize_plate
+    reading = PlateReading.objects.create(gate=gate, plate_text=normalize_plate(text), confidence=conf)
+    if crop is not None:
+        import cv2
+        ok, jpg = cv2.imencode(".jpg", crop)
+        if ok:
+            archive_plate_image(reading.id, jpg.tobytes())
+    publish("plate", gate=gate.name, plate=reading.plate_text, confidence=round(conf, 3),
+            reading_id=reading.id, source="stream", **extra)
+    return reading
+
+def claim_plate(gate, session, window=None, attempts=3):
+    """Gắn sự kiện biển số cũ nhất (chưa gắn phiên) của gate trong WINDOW giây vào `session`, hoặc None.
+
+    Xe qua cổng theo thứ tự nên sự kiện cũ nhất là của xe đang quét QR. Nhận bằng UPDATE có điều kiện:
+    2 request cùng gate không lấy trùng; thua cả `attempts` ứng viên thì coi như chưa có biển số.
+    """
+    from .models import PlateReading
+    window = _conf()["WINDOW"] if window is None else window
+    since = timezone.now() - timedelta(seconds=float(window))
+    candidates = PlateReading.objects.filter(gate=gate, session__isnull=True, captured_at__gte=since) \
+                                     .order_by("captured_at")[:attempts]
+    for reading in candidates:
+        if PlateReading.objects.filter(pk=reading.pk, session__isnull=True).update(session=session):
+            reading.session = session
+            return reading
+    return None
+
+def release_plate(reading):
+    """Trả sự kiện đã nhận về trạng thái chưa gắn phiên (request bị từ chối sau khi đã claim)."""
+    from .models import PlateReading
+    PlateReading.objects.filter(pk=reading.pk, session=reading.session_id).update(session=None)
+    reading.session = None
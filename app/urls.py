@@ -1,9 +1,10 @@
 from django.urls import path, include
 from .views import (RegisterView, LoginView, LogoutView, register_parking,
-                    entry, exit, GateViewSet, MeView,
+                    entry, exit, detect_plates, GateViewSet, MeView,
                     change_info, change_password, my_reservations,
                     reservation_detail, stats_summary, TariffViewSet,
-                    my_payments)
+                    my_payments, profile_captures, profile_capture_download)
+from .metrics import metrics_view
 from rest_framework.routers import DefaultRouter
 
 router = DefaultRouter()
@@ -21,11 +22,15 @@ urlpatterns = [
     path("parking/register/", register_parking, name="register_parking"),
     path("parking/entry/", entry, name="entry"),
     path("parking/exit/", exit, name="exit"),
+    path("parking/plates/", detect_plates, name="detect_plates"),
 
-    path("parking/payments/", my_payments),
-    path("parking/reservations/", my_reservations),
-    path("parking/reservations/<uuid:pk>/", reservation_detail),
+    path("parking/payments/", my_payments, name="my_payments"),
+    path("parking/reservations/", my_reservations, name="my_reservations"),
+    path("parking/reservations/<uuid:pk>/", reservation_detail, name="reservation_detail"),
     path('parking/admin/stats/', stats_summary, name='stats_summary'),
+    path("parking/admin/profiles/", profile_captures, name="profile_captures"),
+    path("parking/admin/profiles/<str:name>/", profile_capture_download, name="profile_capture_download"),
+    path("metrics/", metrics_view, name="metrics"),
 
     path("", include(router.urls)),
 ]
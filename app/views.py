@@ -1,8 +1,9 @@
 from difflib import SequenceMatcher
 from datetime import datetime, timedelta
-import secrets
+import secrets, time
 from uuid import UUID
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from decimal import Decimal
 
@@ -10,7 +11,7 @@ from django.utils import timezone
 from rest_framework import permissions, status, viewsets, serializers
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, renderer_classes, parser_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
@@ -18,14 +19,26 @@ from django.db.models import Count, Sum, Value, CharField, Q, DecimalField
 from django.db.models.functions import Coalesce
 
 
-from .models import Gate, QRCode, Vehicle, ParkingSession, Tariff, Reservation, Payment, PlateReading
+from .models import Gate, QRCode, Vehicle, ParkingSession, Tariff, Reservation, Payment, PaymentArchive
 from .serializers import (
     GateSerializer, QRCodeSerializer, VehicleSerializer,
-    ParkingSessionSerializer, UserSerializer,
-    ReservationSerializer, TariffSerializer, PaymentSerializer
+    UserSerializer,
+    ReservationSerializer, TariffSerializer, PaymentSerializer, PaymentArchiveSerializer
 )
 from rest_framework.permissions import IsAdminUser as IsAdmin
-from .lpr import recognize_plate_from_bytes
+from .archival import archive_plate_image
+from .writebehind import save_reading
+from .archive import session_models, spans_archive
+from .deferred import recognize_or_defer, recognize_crops_or_defer, defer_recognition, recognize_plates_or_none
+from .authentication import TOKEN_AUTH, NO_AUTH
+from .events import publish
+from .conditional import versioned
+from .gateproto import GATE_RENDERERS, GATE_PARSERS, session_payload
+from .profiling import profiled, list_captures, capture_path
+from .stream import claim_plate, release_plate
+from django.http import FileResponse
+from django.utils.decorators import method_decorator
+from .qrsign import is_signed, verify_qr, sign_qr, InvalidToken
 from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
 
 
@@ -47,6 +60,73 @@ def _estimate_fee(rule: dict, duration_min: int, vehicle_type: str) -> int:
     payable = max(0, duration_min - free)
     blocks = (payable + block - 1) // block
     return blocks * per
+def _gate_config(gate_name):
+    """Cấu hình nhận dạng của gate (tên chuẩn, lanes, ngưỡng chất lượng ảnh) — chỉ đọc khi cần chạy LPR."""
+    if not gate_name:
+        return {}
+    return Gate.objects.filter(name__iexact=str(gate_name).strip()).values("name", "lanes", "quality").first() or {}
+
+def _lpr_failure(lpr):
+    if lpr.get("detail") == "bad_frame":
+        return Response({"detail": "Ảnh không đạt chất lượng", "reason": lpr.get("reason"),
+                         "action": lpr.get("action")}, status=422)
+    return Response({"detail": "Không đọc được biển số từ ảnh"}, status=422)
+
+def _recognize_opts(gcfg, lane):
+    return {"lanes": gcfg.get("lanes") if lane else None, "lane": lane, "quality": gcfg.get("quality") or None}
+
+def _unknown_lane(gcfg, lane):
+    """400 nếu thiết bị gửi lane mà gate không cấu hình làn đó (lọc theo làn sẽ loại mọi box → no_plate)."""
+    if lane and lane not in {l.get("name") for l in gcfg.get("lanes") or ()}:
+        return Response({"detail": f"Gate không có làn '{lane}'"}, status=400)
+    return None
+
+def _edge_crops(request):
+    """Crop biển số do thiết bị cổng tự cắt (field plate_crop, có thể lặp) + bbox "x1,y1,x2,y2" tương ứng."""
+    crops = [f.read() for f in request.FILES.getlist("plate_crop")]
+    if hasattr(request.data, "getlist"):
+        raw = request.data.getlist("bbox")
+    else:  # JSON/MessagePack: "x1,y1,x2,y2", [x1, y1, x2, y2] hoặc list các bbox
+        raw = request.data.get("bbox") or []
+        if not (isinstance(raw, list) and raw and isinstance(raw[0], (list, str))):
+            raw = [raw] if raw else []
+    bboxes = []
+    for b in raw:
+        try:
+            bboxes.append([int(float(v)) for v in (b if isinstance(b, list) else str(b).split(","))][:4])
+        except (TypeError, ValueError):
+            bboxes.append(None)
+    return crops, bboxes or None
+
+def _recognize(image_bytes, crops, bboxes, opts):
+    """Nhận dạng theo nguồn ảnh: crop từ thiết bị (bỏ qua detector) hay cả khung. None = đọc sau."""
+    if crops:
+        return recognize_crops_or_defer(crops, bboxes)
+    return recognize_or_defer(image_bytes, **opts)
+
+def _defer_opts(opts, crops, bboxes):
+    if crops:
+        return {"crops": crops, "bboxes": bboxes}
+    return {"lanes": opts.get("lanes"), "lane": opts.get("lane"), "quality": opts.get("quality")}
+
+def _check_signed_qr(value, check_window=True):
+    """QR ký số: kiểm tra chữ ký/thu hồi/hạn/giờ đến mà không đọc DB.
+
+    Trả về (lookup cho QRCode, Response lỗi hoặc None).
+    """
+    if not is_signed(value):
+        return {"value": value}, None
+    try:
+        tok = verify_qr(value)
+    except InvalidToken:
+        return None, Response({"detail": "QR không hợp lệ/không active"}, status=404)
+    now_ts = time.time()
+    if tok.expires and tok.expires <= now_ts:
+        return None, Response({"detail": "QR đã hết hạn"}, status=410)
+    if check_window and tok.reservation_id and now_ts < tok.start - LEAD_MIN * 60:
+        return None, Response({"detail": "Đến quá sớm so với giờ đặt"}, status=409)
+    return {"pk": tok.qr_id}, None
+
 def _resolve_gate(request, expected_type: str):
     gid = request.data.get("gate_id") or request.data.get("gate_uuid")
     gname = request.data.get("gate_name") or request.data.get("gate")
@@ -109,11 +189,14 @@ class LoginView(ObtainAuthToken):
         })
 
 class MeView(APIView):
+    authentication_classes = TOKEN_AUTH
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(versioned("profile"))
     def get(self, request):
         return Response(UserSerializer(request.user).data)
 class LogoutView(APIView):
+    authentication_classes = TOKEN_AUTH
     def post(self, request):
         Token.objects.filter(user=request.user).delete()
         return Response({"detail": "Logged out"}, status=status.HTTP_200_OK)
@@ -128,6 +211,7 @@ class GateViewSet(viewsets.ModelViewSet):
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@authentication_classes(TOKEN_AUTH)
 def register_parking(request):
 
     user = request.user
@@ -182,6 +266,8 @@ def register_parking(request):
     )
     qr.reservation = res
     qr.save(update_fields=['reservation'])
+    publish("reservation", user_id=user.pk, reservation_id=res.id, status=res.status,
+            start_time=res.start_time.isoformat())
 
     data = {
         "id": str(res.id),
@@ -193,22 +279,45 @@ def register_parking(request):
         "qr_value": qr.value,
         "status": res.status,
     }
+    if settings.QR_SIGNING["ENABLED"]:
+        data["qr_signed"] = sign_qr(qr, res)
     return Response(data, status=201)
 
 @api_view(["POST"])
 @permission_classes([permissions.AllowAny])
+@authentication_classes(NO_AUTH)
+@renderer_classes(GATE_RENDERERS)
+@parser_classes(GATE_PARSERS)
+@profiled("entry")
 def entry(request):
 
+    qr_lookup, err = _check_signed_qr(request.data.get("qr"))
+    if err:
+        return err
+
     plate_text = request.data.get("plate_text")
     upload = request.FILES.get("image")
-    if upload and not plate_text:
-        image_bytes = upload.read()
-        lpr = recognize_plate_from_bytes(image_bytes)
-        if not lpr["ok"]:
-            return Response({"detail": "Không đọc được biển số từ ảnh"}, status=422)
-        plate_text = lpr["text"]
-
-    qr = QRCode.objects.filter(value=request.data.get("qr"), status="active") \
+    image_bytes = upload.read() if upload else None
+    crops, bboxes = _edge_crops(request)
+    lane = request.data.get("lane") or None
+    opts, lpr, deferred = {}, {}, False
+    if (upload or crops) and not plate_text:
+        if not crops:
+            gcfg = _gate_config(request.data.get("gate_name") or request.data.get("gate"))
+            err = _unknown_lane(gcfg, lane)
+            if err:
+                return err
+            opts = _recognize_opts(gcfg, lane)
+        lpr = _recognize(image_bytes, crops, bboxes, opts)
+        deferred = lpr is None
+        if deferred:
+            lpr = {"ocr_conf": 0.0}
+        elif not lpr["ok"]:
+            return _lpr_failure(lpr)
+        else:
+            plate_text = lpr["text"]
+
+    qr = QRCode.objects.filter(**qr_lookup, status="active") \
                        .select_related("user", "reservation").first()
     if not qr:
         return Response({"detail": "QR không hợp lệ/không active"}, status=404)
@@ -244,50 +353,86 @@ def entry(request):
     if ParkingSession.objects.filter(user=qr.user, status="open").exists():
         return Response({"detail": "Người dùng đang có phiên OPEN"}, status=409)
 
-    plate = _norm(plate_text or "")
-    qr.last_plate = plate
-    qr.save(update_fields=["last_plate"])
-
-    vehicle = qr.user.vehicles.first() or Vehicle.objects.create(owner=qr.user, plate_number=plate or "UNKNOWN")
-    if plate and vehicle.plate_number != plate:
-        vehicle.plate_number = plate
-        vehicle.save(update_fields=["plate_number"])
-
     tariff = Tariff.objects.first()
     if not tariff:
         return Response({"detail": "Chưa cấu hình Tariff"}, status=400)
 
+    plate = _norm(plate_text or "")
+    vehicle = qr.user.vehicles.first() or Vehicle.objects.create(owner=qr.user, plate_number=plate or "UNKNOWN")
     sess = ParkingSession.objects.create(
         user=qr.user, vehicle=vehicle, entry_gate=gate,
         entry_plate=plate or None, tariff=tariff, status="open",
         qrcode=qr, reservation=res if res else None,
     )
-    PlateReading.objects.create(
+
+    # Gate có camera video (manage.py gate_stream): chỉ quét QR, biển số lấy từ sự kiện cũ nhất chưa được
+    # nhận — claim trước rồi mới dùng biển số; thua claim thì phiên mở không biển số
+    streamed = claim_plate(gate, sess) if not (plate_text or upload or crops) else None
+    if streamed:
+        plate, lpr = streamed.plate_text, {"ocr_conf": streamed.confidence}
+        sess.entry_plate = plate or None
+        sess.save(update_fields=["entry_plate"])
+
+    qr.last_plate = plate
+    qr.save(update_fields=["last_plate"])
+    if plate and vehicle.plate_number != plate:
+        vehicle.plate_number = plate
+        vehicle.save(update_fields=["plate_number"])
+
+    reading = streamed or save_reading(
         gate=gate,
         plate_text=plate,
-        confidence=lpr.get("ocr_conf", 1.0) if upload else 1.0,
+        confidence=lpr.get("ocr_conf", 1.0),
         session=sess
     )
+    archive_plate_image(reading.id, image_bytes or (crops[0] if crops else None))
+    if deferred:
+        defer_recognition("entry", reading, image_bytes, **_defer_opts(opts, crops, bboxes))
     if res and res.status != 'active':
         res.status = 'active'; res.save(update_fields=['status'])
+    publish("entry", user_id=qr.user_id, occupancy_delta=1, session_id=sess.id, gate=gate.name,
+            plate=sess.entry_plate, reservation_id=res.id if res else None)
 
-    return Response(ParkingSessionSerializer(sess).data, status=201)
+    data = session_payload(sess)
+    if deferred:
+        data["plate_pending"] = True
+    return Response(data, status=201)
 
 
 @api_view(["POST"])
 @permission_classes([permissions.AllowAny])
+@authentication_classes(NO_AUTH)
+@renderer_classes(GATE_RENDERERS)
+@parser_classes(GATE_PARSERS)
+@profiled("exit")
 def exit(request):
+    qr_lookup, err = _check_signed_qr(request.data.get("qr"), check_window=False)
+    if err:
+        return err
+
     plate_text = request.data.get("plate_text")
     upload = request.FILES.get("image")
-    if upload and not plate_text:
-        image_bytes = upload.read()
-        lpr = recognize_plate_from_bytes(image_bytes)
-        if not lpr["ok"]:
-            return Response({"detail": "Không đọc được biển số từ ảnh"}, status=422)
-
-        plate_text = lpr["text"]
-
-    qr = QRCode.objects.filter(value=request.data.get("qr"), status="active") \
+    image_bytes = upload.read() if upload else None
+    crops, bboxes = _edge_crops(request)
+    lane = request.data.get("lane") or None
+    opts, lpr, deferred = {}, {}, False
+    if (upload or crops) and not plate_text:
+        if not crops:
+            gcfg = _gate_config(request.data.get("gate_name") or request.data.get("gate"))
+            err = _unknown_lane(gcfg, lane)
+            if err:
+                return err
+            opts = _recognize_opts(gcfg, lane)
+        lpr = _recognize(image_bytes, crops, bboxes, opts)
+        deferred = lpr is None
+        if deferred:
+            lpr = {"ocr_conf": 0.0}
+        elif not lpr["ok"]:
+            return _lpr_failure(lpr)
+        else:
+            plate_text = lpr["text"]
+
+    qr = QRCode.objects.filter(**qr_lookup, status="active") \
         .select_related("user", "reservation").first()
     if not qr:
         return Response({"detail": "QR không hợp lệ/không active"}, status=404)
@@ -301,17 +446,24 @@ def exit(request):
     if not sess:
         return Response({"detail": "Không tìm thấy phiên OPEN"}, status=404)
 
+    streamed = claim_plate(gate, sess) if not (plate_text or upload or crops) else None
+    if streamed:
+        plate_text = streamed.plate_text
+
     exit_plate = _norm(plate_text)
     score = _similar(exit_plate, getattr(qr, "last_plate", ""))
     if score < -0.80:
+        if streamed:
+            release_plate(streamed)
         return Response({"detail": "Biển số không khớp", "score": score}, status=409)
 
-    PlateReading.objects.create(
+    reading = streamed or save_reading(
         gate=gate,
         plate_text=exit_plate,
-        confidence=score,
+        confidence=lpr.get("ocr_conf", 1.0),   # như lượt vào: độ tin cậy OCR, không phải điểm khớp biển số
         session=sess
     )
+    archive_plate_image(reading.id, image_bytes or (crops[0] if crops else None))
     now = timezone.now()
     sess.exit_gate = gate
     sess.exit_time = now
@@ -324,15 +476,40 @@ def exit(request):
     sess.amount = fee
     sess.status = "closed"
     sess.save(update_fields=['exit_gate', 'exit_time', 'exit_plate', 'amount', 'status'])
+    if deferred:
+        defer_recognition("exit", reading, image_bytes, **_defer_opts(opts, crops, bboxes))
+    publish("exit", user_id=qr.user_id, occupancy_delta=-1, session_id=sess.id, gate=gate.name,
+            plate=sess.exit_plate, amount=float(sess.amount))
 
     return Response({
         "session_id": str(sess.id),
         "exit_plate": sess.exit_plate,
         "amount": sess.amount,
-        "duration_minutes": duration
+        "duration_minutes": duration,
+        "plate_pending": deferred,
     }, status=200)
+@api_view(["POST"])
+@permission_classes([permissions.AllowAny])
+@authentication_classes(NO_AUTH)
+@renderer_classes(GATE_RENDERERS)
+@parser_classes(GATE_PARSERS)
+def detect_plates(request):
+    """Camera phủ nhiều làn: trả mọi biển số trong ảnh kèm làn theo cấu hình Gate.lanes."""
+    upload = request.FILES.get("image")
+    if not upload:
+        return Response({"detail": "Thiếu ảnh"}, status=400)
+    gcfg = _gate_config(request.data.get("gate_name") or request.data.get("gate"))
+    lpr = recognize_plates_or_none(upload.read(), lanes=gcfg.get("lanes"),
+                                   quality=gcfg.get("quality") or None)
+    if lpr is None:
+        return Response({"detail": "LPR đang quá tải, thử lại sau"}, status=503)
+    if lpr.get("detail") == "bad_frame":
+        return _lpr_failure(lpr)
+    return Response({"plates": lpr["plates"], "quality_flag": lpr.get("quality_flag")}, status=200)
+
 @api_view(["GET", "PATCH"])
 @permission_classes([IsAuthenticated])
+@authentication_classes(TOKEN_AUTH)
 def change_info(request):
 
     if request.method == "GET":
@@ -345,6 +522,7 @@ def change_info(request):
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@authentication_classes(TOKEN_AUTH)
 def change_password(request):
 
     old = request.data.get("old_password")
@@ -364,12 +542,16 @@ def change_password(request):
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@authentication_classes(TOKEN_AUTH)
+@versioned("reservations")
 def my_reservations(request):
     qs = Reservation.objects.filter(user=request.user).order_by('-start_time')
     return Response(ReservationSerializer(qs, many=True).data)
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@authentication_classes(TOKEN_AUTH)
+@versioned("reservations")
 def reservation_detail(request, pk):
     try:
         r = Reservation.objects.get(pk=pk, user=request.user)
@@ -378,16 +560,27 @@ def reservation_detail(request, pk):
     return Response(ReservationSerializer(r).data)
 
 
+def _merge_gate_counts(querysets):
+    merged = {}
+    for qs in querysets:
+        for row in qs:
+            key = next(k for k in row if k != 'count')
+            merged[(key, row[key])] = merged.get((key, row[key]), 0) + row['count']
+    return [{key: name, 'count': count} for (key, name), count in merged.items()]
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def stats_summary(request):
     now = timezone.now()
     start_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
 
-    total_sessions = ParkingSession.objects.filter(entry_time__gte=start_month).count()
+    # Tháng hiện tại thường chỉ nằm ở bảng nóng; archive chỉ được đọc khi khoảng thời gian chạm tới nó
+    models_ = session_models(start_month)
+
+    total_sessions = sum(m.objects.filter(entry_time__gte=start_month).count() for m in models_)
 
-    total_revenue = (
-            ParkingSession.objects
+    total_revenue = sum((
+            m.objects
             .filter(status='CLOSED', exit_time__gte=start_month, exit_time__lt=now)
             .aggregate(
                 total=Coalesce(
@@ -395,7 +588,7 @@ def stats_summary(request):
                     Value(0, output_field=DecimalField(max_digits=12, decimal_places=2)),
                 )
             )['total'] or Decimal('0')
-    )
+    ) for m in models_)
     total_revenue = float(total_revenue)
 
     reservations = Reservation.objects.filter(start_time__gte=start_month)
@@ -414,12 +607,14 @@ def stats_summary(request):
         {"type": "motorbike", "count": res_agg["motorbike"] or 0},
     ]
 
-    gate_entries = ParkingSession.objects.filter(entry_time__gte=start_month) \
-        .values('entry_gate__name') \
-        .annotate(count=Count('id'))
-    gate_exits = ParkingSession.objects.filter(exit_time__gte=start_month) \
-        .values('exit_gate__name') \
-        .annotate(count=Count('id'))
+    gate_entries = _merge_gate_counts(
+        m.objects.filter(entry_time__gte=start_month).values('entry_gate__name').annotate(count=Count('id'))
+        for m in models_
+    )
+    gate_exits = _merge_gate_counts(
+        m.objects.filter(exit_time__gte=start_month).values('exit_gate__name').annotate(count=Count('id'))
+        for m in models_
+    )
 
     data = {
         "total_sessions": total_sessions,
@@ -433,6 +628,28 @@ def stats_summary(request):
         "gate_exits": list(gate_exits),
     }
     return Response(data)
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+@authentication_classes(TOKEN_AUTH)
+def profile_captures(request):
+    """Capture profiling (request chậm / được lấy mẫu) mới nhất trước."""
+    try:
+        limit = int(request.query_params.get("limit") or 200)
+    except ValueError:
+        limit = -1
+    if limit < 0:
+        return Response({"detail": "limit không hợp lệ (số nguyên ≥ 0)."}, status=400)
+    return Response(list_captures(min(limit, 1000)))
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+@authentication_classes(TOKEN_AUTH)
+def profile_capture_download(request, name):
+    path = capture_path(name)
+    if path is None:
+        return Response({"detail": "Not found"}, status=404)
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=name, content_type="application/json")
+
 class TariffViewSet(viewsets.ModelViewSet):
     queryset = Tariff.objects.all().order_by('name')
     serializer_class = TariffSerializer
@@ -441,12 +658,18 @@ class TariffViewSet(viewsets.ModelViewSet):
         if self.request.method in ('GET', 'HEAD', 'OPTIONS'):
             return [permissions.IsAuthenticated()]
         return [permissions.IsAdminUser()]
+
+    @method_decorator(versioned("tariffs"))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 class GateViewSet(viewsets.ModelViewSet):
     queryset = Gate.objects.all().order_by('name')
     serializer_class = GateSerializer
     permission_classes = [IsAdmin]
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@authentication_classes(TOKEN_AUTH)
+@versioned("payments")
 def my_payments(request):
     qs = Payment.objects.filter(session__user=request.user) \
                         .select_related('session') \
@@ -456,4 +679,16 @@ def my_payments(request):
     if status_param:
         qs = qs.filter(status=status_param)
 
-    return Response(PaymentSerializer(qs, many=True).data)
\ No newline at end of file
+    data = PaymentSerializer(qs, many=True).data
+    if not spans_archive(None):
+        return Response(data)
+
+    # Lịch sử cũ đã chuyển sang archive: ghép lại, giữ thứ tự paid_at giảm dần (None cuối)
+    old = PaymentArchive.objects.filter(session__user=request.user) \
+                                .select_related('session') \
+                                .order_by('-paid_at', '-session__exit_time', '-session__entry_time')
+    if status_param:
+        old = old.filter(status=status_param)
+    data = list(data) + list(PaymentArchiveSerializer(old, many=True).data)
+    data.sort(key=lambda p: p['paid_at'] or '', reverse=True)
+    return Response(data)
\ No newline at end of file
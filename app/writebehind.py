@@ -0,0 +1,343 @@
+"""Ghi PlateReading kiểu write-behind: request chỉ thêm vào bộ đệm trong RAM (+ 1 dòng journal),
+thread nền bulk_create mỗi FLUSH_MS hoặc khi đủ MAX_ROWS.
+
+Journal: mỗi process ghi 1 file JSONL riêng trong JOURNAL_DIR, giữ flock suốt đời process. Lúc flush
+file hiện tại được niêm phong, insert xong mới xoá. Khi khởi động, file nào không còn process giữ
+lock (process cũ chết giữa chừng) được đọc lại và insert — id là PK có sẵn nên insert lặp cũng vô hại.
+
+Bộ đệm thuộc về process đã tạo nó: sau fork (gunicorn --preload) process con bỏ bản thừa hưởng (thread
+flush không sống sang con, journal là của cha) và tạo bộ đệm mới khi cần. Với gunicorn, gunicorn.conf.py
+gọi start() trong từng worker.
+
+Reading đang chờ flush vẫn có id (uuid7 sinh ở client): archival/deferred gọi ensure_flushed() trước khi
+UPDATE theo id, request sửa reading vừa tạo thì dùng update_reading().
+"""
+from __future__ import annotations
+import atexit, fcntl, json, logging, os, threading, time
+from datetime import date, datetime
+from pathlib import Path
+from uuid import UUID
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .metrics import REGISTRY
+
+log = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "ENABLED": False,
+    "FLUSH_MS": 200,
+    "MAX_ROWS": 500,            # đủ ngần này dòng thì flush ngay, không đợi FLUSH_MS
+    "BATCH_SIZE": 1000,
+    "JOURNAL_DIR": None,        # None: chỉ giữ trong RAM (process chết là mất phần chưa flush)
+    "FSYNC": "interval",        # always: fsync mỗi dòng | interval: mỗi lượt flush | never
+    "FLUSH_TIMEOUT": 5.0,       # ensure_flushed chờ tối đa
+}
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "WRITE_BEHIND", {})}
+
+WRITE_BEHIND = REGISTRY.gauge("write_behind", "PlateReading write-behind buffer (per process)", ("state",))
+
+
+def _json_default(o):
+    if isinstance(o, UUID):
+        return str(o)
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    raise TypeError(type(o).__name__)
+
+def _fields():
+    from .models import PlateReading
+    return PlateReading._meta.concrete_fields
+
+def _row(obj):
+    return {f.attname: getattr(obj, f.attname) for f in _fields()}
+
+def _from_row(row):
+    from .models import PlateReading
+    return PlateReading(**{f.attname: f.to_python(row[f.attname]) for f in _fields() if f.attname in row})
+
+
+class Journal:
+    def __init__(self, directory, fsync):
+        self.dir, self.fsync = Path(directory), fsync
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._n = 0
+        self._open()
+
+    def _open(self):
+        self._n += 1
+        self.path = self.dir / f"readings-{os.getpid()}-{int(time.time() * 1000)}-{self._n}.jsonl"
+        self.f = open(self.path, "ab")
+        fcntl.flock(self.f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.dirty = False
+
+    def append(self, rec):
+        self.f.write(json.dumps(rec, default=_json_default, ensure_ascii=False).encode() + b"\n")
+        self.f.flush()
+        if self.fsync == "always":
+            os.fsync(self.f.fileno())
+        self.dirty = True
+
+    def sync(self):
+        if self.dirty and self.fsync != "never":
+            os.fsync(self.f.fileno())
+            self.dirty = False
+
+    def seal(self):
+        """Đóng file hiện tại để flush (vẫn giữ lock tới khi release), mở file mới cho ghi tiếp."""
+        self.sync()
+        sealed = (self.path, self.f)
+        self._open()
+        return sealed
+
+    @staticmethod
+    def release(sealed, delete=True):
+        path, f = sealed
+        if delete:
+            path.unlink(missing_ok=True)
+        f.close()
+
+
+def read_journal(path):
+    """Dòng "add"/"set" → danh sách row theo thứ tự thêm; set cho id không có trong file trả riêng."""
+    rows, orphan_sets = {}, {}
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                break  # dòng cuối ghi dở lúc process chết
+            if rec["op"] == "add":
+                rows[rec["row"]["id"]] = rec["row"]
+            elif rec["id"] in rows:
+                rows[rec["id"]].update(rec["fields"])
+            else:
+                orphan_sets.setdefault(rec["id"], {}).update(rec["fields"])
+    return list(rows.values()), orphan_sets
+
+
+class ReadingBuffer:
+    def __init__(self, conf=None):
+        self.conf = conf or _conf()
+        self._pending = {}          # pk → PlateReading chưa insert
+        self._inflight = set()      # pk đang được bulk_create
+        self._carry = []            # journal đã niêm phong của lượt flush lỗi, xoá khi insert được
+        self._urgent = False
+        self._cond = threading.Condition()
+        self.pid = os.getpid()
+        self.stats = {"added": 0, "flushed": 0, "flushes": 0, "failed": 0, "replayed": 0}
+        d = self.conf["JOURNAL_DIR"]
+        self.journal = Journal(d, self.conf["FSYNC"]) if d else None
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    # ----- request path -----
+    def add(self, obj):
+        with self._cond:
+            self._pending[obj.pk] = obj
+            if self.journal:
+                self.journal.append({"op": "add", "row": _row(obj)})
+            self.stats["added"] += 1
+            if len(self._pending) >= int(self.conf["MAX_ROWS"]):
+                self._cond.notify_all()
+
+    def update_pending(self, pk, **fields) -> bool:
+        """Sửa reading còn trong bộ đệm; False nếu đã (hoặc đang) được insert."""
+        with self._cond:
+            obj = self._pending.get(pk)
+            if obj is None:
+                return False
+            for k, v in fields.items():
+                setattr(obj, k, v)
+            if self.journal:
+                self.journal.append({"op": "set", "id": pk, "fields": fields})
+            return True
+
+    def is_pending(self, pk):
+        with self._cond:
+            return pk in self._pending or pk in self._inflight
+
+    def ensure_flushed(self, pk, timeout=None) -> bool:
+        with self._cond:
+            if pk not in self._pending and pk not in self._inflight:
+                return True
+            self._urgent = True
+            self._cond.notify_all()
+            timeout = float(self.conf["FLUSH_TIMEOUT"]) if timeout is None else timeout
+            return self._cond.wait_for(lambda: pk not in self._pending and pk not in self._inflight, timeout)
+
+    # ----- thread nền -----
+    def _run(self):
+        try:
+            self.replay()
+        except Exception:
+            log.exception("write-behind: replay journal lỗi")
+        interval = float(self.conf["FLUSH_MS"]) / 1000
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._urgent or len(self._pending) >= int(self.conf["MAX_ROWS"]),
+                                    timeout=interval)
+            try:
+                self.flush()
+            except Exception:
+                log.exception("write-behind: flush lỗi")
+                time.sleep(interval)
+            finally:
+                close_old_connections()
+
+    def flush(self) -> int:
+        from .models import PlateReading
+        from .platesearch import index_objects
+        with self._cond:
+            self._urgent = False
+            if not self._pending:
+                return 0
+            batch = list(self._pending.values())
+            self._pending = {}
+            self._inflight = {o.pk for o in batch}
+            sealed = self.journal.seal() if self.journal else None
+        ok = False
+        try:
+            PlateReading.objects.bulk_create(batch, batch_size=int(self.conf["BATCH_SIZE"]), ignore_conflicts=True)
+            ok = True
+            index_objects("reading", batch, replace=False)  # bulk_create không gửi post_save
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            with self._cond:
+                if ok:
+                    self.stats["flushed"] += len(batch)
+                    self.stats["flushes"] += 1
+                    for s in self._carry + ([sealed] if sealed else []):
+                        Journal.release(s)
+                    self._carry = []
+                else:  # giữ lại để lượt sau thử tiếp; journal niêm phong vẫn còn nếu process chết
+                    self._pending = {**{o.pk: o for o in batch}, **self._pending}
+                    if sealed:
+                        self._carry.append(sealed)
+                self._inflight = set()
+                self._cond.notify_all()
+        return len(batch)
+
+    def replay(self) -> int:
+        """Insert lại journal của process đã chết (file không còn ai giữ lock)."""
+        from .models import PlateReading
+        from .platesearch import index_objects
+        if not self.journal:
+            return 0
+        total = 0
+        for path in sorted(self.journal.dir.glob("readings-*.jsonl")):
+            if path == self.journal.path:
+                continue
+            try:
+                f = open(path, "rb")
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (OSError, BlockingIOError):
+                continue  # process khác vẫn đang dùng
+            try:
+                rows, orphan_sets = read_journal(path)
+                objs = [_from_row(r) for r in rows]
+                with transaction.atomic():
+                    PlateReading.objects.bulk_create(objs, batch_size=int(self.conf["BATCH_SIZE"]),
+                                                     ignore_conflicts=True)
+                    for pk, fields in orphan_sets.items():
+                        PlateReading.objects.filter(pk=pk).update(**fields)
+                index_objects("reading", objs)
+                path.unlink()
+                total += len(objs)
+                log.info("write-behind: replay %d reading từ %s", len(objs), path.name)
+            finally:
+                f.close()
+        self.stats["replayed"] += total
+        return total
+
+    def _abandon(self):
+        """Trong process con sau fork: đóng fd journal thừa hưởng (lock của cha vẫn giữ), không flush."""
+        for f in ([self.journal.f] + [s[1] for s in self._carry]) if self.journal else []:
+            f.close()
+
+    def close(self):
+        if os.getpid() != self.pid:
+            return  # bản thừa hưởng qua fork: phần chưa flush là của process cha
+        try:
+            self.flush()
+        except Exception:
+            log.exception("write-behind: flush lúc tắt lỗi — journal còn giữ, sẽ replay lần khởi động sau")
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = ReadingBuffer()
+                atexit.register(_buffer.close)
+    return _buffer
+
+def _after_fork_in_child():
+    global _buffer, _buffer_lock
+    if _buffer is not None:
+        _buffer._abandon()
+    _buffer, _buffer_lock = None, threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+def start():
+    """Gọi trong process web đã sẵn sàng phục vụ (runserver: apps.ready, gunicorn: post_worker_init — không gọi
+    lúc import wsgi/asgi, vì với --preload đó là process master): tạo bộ đệm sớm để replay journal của worker
+    cũ ngay, không đợi reading đầu tiên."""
+    conf = _conf()
+    if conf["ENABLED"] and conf["JOURNAL_DIR"]:
+        get_buffer()
+
+def _collect():
+    if _buffer:
+        WRITE_BEHIND.set(len(_buffer._pending), state="pending")
+        for k, v in _buffer.stats.items():
+            WRITE_BEHIND.set(v, state=k)
+
+REGISTRY.register_collector(_collect)
+
+
+# ===== API cho views / worker nền =====
+def save_reading(**fields):
+    """Tạo PlateReading: bật write-behind → chỉ thêm vào bộ đệm khi transaction hiện tại commit."""
+    from .models import PlateReading
+    reading = PlateReading(**fields)
+    if not _conf()["ENABLED"]:
+        reading.save(force_insert=True)
+        return reading
+    buf = get_buffer()
+    transaction.on_commit(lambda: buf.add(reading))
+    return reading
+
+def update_reading(reading, **fields):
+    for k, v in fields.items():
+        setattr(reading, k, v)
+    if update_pending(reading.pk, **fields):
+        return
+    ensure_flushed(reading.pk)
+    if reading._state.adding:
+        return  # còn chờ on_commit để vào bộ đệm: chính object này sẽ được insert, đã mang giá trị mới
+    reading.save(update_fields=list(fields))
+
+def update_pending(pk, **fields) -> bool:
+    """Sửa reading theo id nếu nó còn trong bộ đệm của process này (không cần chờ flush)."""
+    return _buffer is not None and _buffer.update_pending(pk, **fields)
+
+def ensure_flushed(pk, timeout=None) -> bool:
+    """Chờ reading `pk` (nếu còn trong bộ đệm của process này) được insert xong."""
+    if _buffer is None:
+        return True
+    ok = _buffer.ensure_flushed(pk, timeout)
+    if not ok:
+        log.warning("write-behind: reading %s chưa flush sau %ss", pk, timeout or _buffer.conf["FLUSH_TIMEOUT"])
+    return ok
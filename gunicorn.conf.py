@@ -0,0 +1,25 @@
+"""Cấu hình gunicorn: `gunicorn -c gunicorn.conf.py api.wsgi`.
+
+runserver khởi động nền (warmup LPR, bộ đệm write-behind) trong AppConfig.ready; dưới gunicorn việc đó
+làm ở đây, trong từng worker sau khi fork — thread nền/model tạo trước khi fork (--preload) không sống
+sang worker.
+"""
+import os, threading
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))   # khớp INFERENCE["WEB_WORKERS"] để chia core
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+
+
+def pre_fork(server, worker):
+    # vị trí ổn định 0..workers-1: worker thay thế nhận lại dải core của worker vừa chết
+    used = {getattr(w, "slot_index", None) for w in server.WORKERS.values()}
+    worker.slot_index = next(i for i in range(len(used) + 1) if i not in used)
+
+
+def post_worker_init(worker):
+    from app.inference import warmup
+    from app.writebehind import start
+    threading.Thread(target=warmup, kwargs={"index": worker.slot_index}, name="lpr-warmup", daemon=True).start()
+    start()  # replay journal PlateReading của worker đã chết